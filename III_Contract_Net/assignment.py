@@ -0,0 +1,290 @@
+import argparse
+import random
+import time
+
+"""
+Batch assignment of jobs to machines.
+
+- hungarian(cost): optimal one-job-per-machine assignment (min total cost) of a rectangular
+  cost matrix, O(n^2 m) with n = min(rows, cols).
+- plan_batch(job_types, etas): multi-round makespan heuristic for a whole block of jobs:
+    1. jobs in LPT order (longest best-case ETA first), in rounds of n jobs (n = machines);
+    2. each round is solved with hungarian() on completion-time costs (machine ready time
+       + ETA), every machine offering `slots` virtual positions so a fast machine can take
+       several jobs of a round instead of a slow machine taking one; jobs left without a
+       capable column (more of one type than its machines' positions) open the next round;
+    3. local search on the makespan machine (move one job / swap two jobs) until no move
+       lowers it.
+  Jobs of one machine run shortest-first (lower mean flow time, same makespan).
+- greedy_schedule(): model of the auction supervisors, for comparison: jobs in list order,
+  each to the lowest-ETA machine among those free when it is issued.
+
+`etas` is {machine_id: {job_type: seconds}}; a machine without a job type cannot run it.
+"""
+
+INF = float("inf")
+
+# Capabilities of the 12 machines launched by run_all.sh
+RUN_ALL_CAPS = {
+    "M01": {"cut": 1.8, "drill": 4.5, "paint": 1.2},
+    "M02": {"cut": 2.4, "drill": 2.1, "paint": 2.0},
+    "M03": {"cut": 3.0, "drill": 1.9, "paint": 2.6},
+    "M04": {"cut": 2.2, "drill": 3.8, "paint": 1.4},
+    "M05": {"cut": 1.9, "drill": 4.2, "paint": 1.8},
+    "M06": {"cut": 2.8, "drill": 2.5, "paint": 1.6},
+    "M07": {"cut": 3.6, "drill": 1.7, "paint": 2.2},
+    "M08": {"cut": 2.1, "drill": 3.1, "paint": 1.3},
+    "M09": {"cut": 2.7, "drill": 2.3, "paint": 1.9},
+    "M10": {"cut": 3.2, "drill": 2.0, "paint": 2.1},
+    "M11": {"cut": 2.5, "drill": 2.7, "paint": 1.5},
+    "M12": {"cut": 1.7, "drill": 3.9, "paint": 1.7},
+}
+
+
+def hungarian(cost: list[list[float]]) -> list[int]:
+    """Min-cost assignment; returns the column of each row (-1 if the row is left out when rows > cols)."""
+    n_rows = len(cost)
+    if n_rows == 0:
+        return []
+    n_cols = len(cost[0])
+    if n_rows > n_cols:
+        cols = hungarian([list(col) for col in zip(*cost)])
+        rows = [-1] * n_rows
+        for c, r in enumerate(cols):
+            rows[r] = c
+        return rows
+
+    # Shortest augmenting paths with potentials (1-based, column 0 is the virtual start)
+    big = max((c for row in cost for c in row if c < INF), default=0.0) * (n_rows + 1) + 1.0
+    u = [0.0] * (n_rows + 1)
+    v = [0.0] * (n_cols + 1)
+    match = [0] * (n_cols + 1)        # column -> row
+    way = [0] * (n_cols + 1)
+    for i in range(1, n_rows + 1):
+        match[0] = i
+        j0 = 0
+        minv = [INF] * (n_cols + 1)
+        used = [False] * (n_cols + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = INF
+            j1 = 0
+            for j in range(1, n_cols + 1):
+                if used[j]:
+                    continue
+                c = row[j - 1]
+                cur = (c if c < INF else big) - ui0 - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+            for j in range(n_cols + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    result = [-1] * n_rows
+    for j in range(1, n_cols + 1):
+        if match[j]:
+            result[match[j] - 1] = j - 1
+    return result
+
+
+def _eta(etas: dict, machine: str, job_type: str) -> float:
+    return etas[machine].get(job_type, INF)
+
+
+def plan_batch(job_types: list[str], etas: dict, slots: int = 2, refine: bool = True) -> dict[str, list[int]]:
+    """Returns {machine_id: [job index, ...] in run order}; jobs no machine can run are left out."""
+    machines = sorted(etas)
+    n = len(machines)
+    best = [min((_eta(etas, m, jt) for m in machines), default=INF) for jt in job_types]
+    order = sorted((j for j in range(len(job_types)) if best[j] < INF), key=lambda j: -best[j])
+
+    ready = [0.0] * n
+    queues: list[list[int]] = [[] for _ in machines]
+    # Column (i, k): k-th extra job of this round on machine i, costed as if the
+    # previous k were of the same type.
+    cols = [(i, k) for i in range(n) for k in range(slots)]
+    pending = order
+    while pending:
+        block, pending = pending[:n], pending[n:]
+        cost = []
+        for j in block:
+            jt = job_types[j]
+            row = []
+            for i, k in cols:
+                e = _eta(etas, machines[i], jt)
+                row.append(ready[i] + (k + 1) * e if e < INF else INF)
+            cost.append(row)
+        picked = hungarian(cost)
+        # A round can hold more jobs of a type than there are columns able to run it: hungarian() then
+        # fills the rest in with columns that cannot (cost INF); those jobs open the next round instead.
+        # Every job has a capable machine, so each round places at least one.
+        placed = [r for r in range(len(block)) if cost[r][picked[r]] < INF]
+        pending = [block[r] for r in range(len(block)) if cost[r][picked[r]] == INF] + pending
+        # Apply per machine in slot order so ready times accumulate correctly
+        for r in sorted(placed, key=lambda r: cols[picked[r]][1]):
+            i = cols[picked[r]][0]
+            j = block[r]
+            queues[i].append(j)
+            ready[i] += _eta(etas, machines[i], job_types[j])
+
+    if refine:
+        _refine(queues, ready, machines, job_types, etas)
+
+    plan = {}
+    for i, m in enumerate(machines):
+        if queues[i]:
+            plan[m] = sorted(queues[i], key=lambda j: _eta(etas, m, job_types[j]))
+    assert all(job_types[j] in etas[m] for m, jobs in plan.items() for j in jobs), "job planned on an incapable machine"
+    return plan
+
+
+def _refine(queues, ready, machines, job_types, etas, max_iter: int = 100_000) -> None:
+    """Move / swap jobs off the makespan machine while that strictly lowers its finish time."""
+    n = len(machines)
+    types = sorted(set(job_types))
+    e = [[_eta(etas, m, t) for t in types] for m in machines]
+    t_index = {t: k for k, t in enumerate(types)}
+    # Per machine, per type: job indices (jobs of one type are interchangeable)
+    by_type = [[[] for _ in types] for _ in range(n)]
+    for i in range(n):
+        for j in queues[i]:
+            by_type[i][t_index[job_types[j]]].append(j)
+
+    for _ in range(max_iter):
+        top = max(range(n), key=lambda i: ready[i])
+        span = ready[top]
+        best = None  # (new pair max, kind, other machine, type out, type in)
+        for a, jobs_a in enumerate(by_type[top]):
+            if not jobs_a:
+                continue
+            for i in range(n):
+                if i == top or e[i][a] == INF:
+                    continue
+                # Move one job of type a from top to i
+                cand = max(span - e[top][a], ready[i] + e[i][a])
+                if cand < span - 1e-9 and (best is None or cand < best[0]):
+                    best = (cand, "move", i, a, None)
+                # Swap it with one job of type b from i
+                for b, jobs_b in enumerate(by_type[i]):
+                    if b == a or not jobs_b or e[top][b] == INF:
+                        continue
+                    cand = max(span - e[top][a] + e[top][b], ready[i] - e[i][b] + e[i][a])
+                    if cand < span - 1e-9 and (best is None or cand < best[0]):
+                        best = (cand, "swap", i, a, b)
+        if best is None:
+            break
+        _cand, kind, i, a, b = best
+        j = by_type[top][a].pop()
+        by_type[i][a].append(j)
+        ready[top] -= e[top][a]
+        ready[i] += e[i][a]
+        if kind == "swap":
+            k = by_type[i][b].pop()
+            by_type[top][b].append(k)
+            ready[i] -= e[i][b]
+            ready[top] += e[top][b]
+
+    for i in range(n):
+        queues[i] = [j for jobs in by_type[i] for j in jobs]
+
+
+def greedy_schedule(job_types: list[str], etas: dict) -> dict[str, list[int]]:
+    """Auction supervisor model: list order, lowest ETA among the machines free at issue time."""
+    machines = sorted(etas)
+    ready = {m: 0.0 for m in machines}
+    plan = {m: [] for m in machines}
+    now = 0.0
+    for j, jt in enumerate(job_types):
+        capable = [m for m in machines if jt in etas[m]]
+        if not capable:
+            continue
+        now = max(now, min(ready[m] for m in capable))
+        m = min((m for m in capable if ready[m] <= now), key=lambda m: etas[m][jt])
+        plan[m].append(j)
+        ready[m] = now + etas[m][jt]
+    return {m: js for m, js in plan.items() if js}
+
+
+def evaluate(plan: dict[str, list[int]], job_types: list[str], etas: dict, deadlines: list | None = None) -> dict:
+    """Makespan, mean flow time, utilization (and late ratio with deadlines) of a plan run back to back."""
+    finish = []
+    busy = 0.0
+    ends = []
+    late = 0
+    for m, jobs in plan.items():
+        t = 0.0
+        for j in jobs:
+            t += etas[m][job_types[j]]
+            finish.append(t)
+            if deadlines and deadlines[j] is not None and t > deadlines[j]:
+                late += 1
+        busy += t
+        ends.append(t)
+    makespan = max(ends, default=0.0)
+    return {
+        "makespan_s": makespan,
+        "mean_flow_s": sum(finish) / len(finish) if finish else 0.0,
+        "utilization": busy / (makespan * len(etas)) if makespan > 0 else 0.0,
+        "late_ratio": late / len(finish) if finish else 0.0,
+    }
+
+
+def lower_bound(job_types: list[str], etas: dict) -> float:
+    """max(longest best-case job, total best-case work / machines)."""
+    best = [min(e.get(jt, INF) for e in etas.values()) for jt in job_types]
+    best = [b for b in best if b < INF]
+    return max(max(best, default=0.0), sum(best) / len(etas))
+
+
+# ---------- Benchmark ----------
+
+def bench(sizes: list[int], seed: int = 7) -> None:
+    rng = random.Random(seed)
+    types = ["cut", "drill", "paint"]
+    # A second fleet where job types really compete for a few fast machines
+    contended = {}
+    for k in range(12):
+        contended[f"C{k + 1:02d}"] = {t: round(rng.uniform(1.0, 2.0) if (k + h) % 4 == 0 else rng.uniform(2.5, 6.0), 1)
+                                      for h, t in enumerate(types + ["weld", "sand"])}
+    fleets = {"run_all": (RUN_ALL_CAPS, types), "contended": (contended, types + ["weld", "sand"])}
+
+    print(f"{'fleet':10s} {'jobs':>6s} {'LB':>9s} {'greedy':>9s} {'batch':>9s} {'gain':>7s} {'greedy ms':>10s} {'batch ms':>9s}")
+    for fleet, (caps, fleet_types) in fleets.items():
+        for n in sizes:
+            jobs = [rng.choice(fleet_types) for _ in range(n)]
+            t0 = time.perf_counter()
+            g = evaluate(greedy_schedule(jobs, caps), jobs, caps)["makespan_s"]
+            t1 = time.perf_counter()
+            b = evaluate(plan_batch(jobs, caps), jobs, caps)["makespan_s"]
+            t2 = time.perf_counter()
+            lb = lower_bound(jobs, caps)
+            print(f"{fleet:10s} {n:6d} {lb:9.1f} {g:9.1f} {b:9.1f} {(g - b) / g * 100:6.1f}% "
+                  f"{(t1 - t0) * 1000:10.1f} {(t2 - t1) * 1000:9.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Batch assignment benchmark (greedy auction vs Hungarian rounds)")
+    ap.add_argument("--bench", default="10,100,1000,10000", help="Comma-separated job counts")
+    args = ap.parse_args()
+    bench([int(x) for x in args.bench.split(",")])
+
+
+if __name__ == "__main__":
+    main()
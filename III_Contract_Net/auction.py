@@ -0,0 +1,210 @@
+import argparse
+import heapq
+import random
+import threading
+import time
+
+"""
+Bid collection for one CfP round.
+
+- on_proposal() calls add(): O(log n) heap push, incremental unique-bidder count.
+- The round closes on the first of: deadline, `min_bids` unique bidders, `quiet_s`
+  without a new bid, or every machine given to expect() (from the registry, see registry.py)
+  having bid; an empty set closes the round at once. The waiting thread sleeps on a condition variable until the next
+  timer expires or add() reports that `min_bids` was reached, so there is no polling.
+- Several rounds can share one condition (pipelined supervisor): the waiter sleeps until
+  the earliest wakeup_at() among the open rounds.
+
+Timers use time.monotonic(); message timestamps (CfP.issued_at, Proposal.at) stay on the wall clock.
+A proposal with ttl_s > 0 is a reservation: best(valid_at=...) skips it once at + ttl_s has passed.
+"""
+
+
+def reservation_expired(p: dict, now: float) -> bool:
+    """True if the proposal reserved room on its machine (ttl_s) and that reservation is over at `now`."""
+    ttl = float(p.get("ttl_s", 0.0))
+    return ttl > 0 and float(p["at"]) + ttl < now
+
+
+class Auction:
+    def __init__(self, job_id: str, job_type: str, deadline_s: float, min_bids: int = 0, quiet_s: float = 0.0,
+                 cond: threading.Condition | None = None, clock=time.monotonic) -> None:
+        self.job_id = job_id
+        self.job_type = job_type
+        self.deadline_s = deadline_s
+        self.min_bids = min_bids
+        self.quiet_s = quiet_s
+        self.cond = cond or threading.Condition()
+        self.clock = clock
+
+        self.opened_at = clock()
+        self.last_rx = self.opened_at
+        self._heap = []          # (eta_s, seq, proposal)
+        self._seq = 0
+        self.bidders = set()
+        self.proposals = 0
+        self.expected = None     # see expect()
+        self.enough_at = None    # time the min_bids-th unique bidder (or the last expected one) arrived
+        self.enough_reason = None
+        self.closed_at = None
+        self.close_reason = None
+        self.close_lag = 0.0     # closed_at - due time
+
+    def expect(self, expected: set | None) -> None:
+        """Sets the machines whose bids close the round (None: no such condition)."""
+        with self.cond:
+            self.expected = expected
+            if expected is not None and self.enough_at is None and expected <= self.bidders:
+                self.enough_at, self.enough_reason = self.clock(), "all_bids"
+                self.cond.notify_all()
+
+    # ---------- Producer side (MQTT thread) ----------
+
+    def add(self, p: dict) -> bool:
+        """Records a proposal; returns False once the round is closed (late bid)."""
+        with self.cond:
+            if self.closed_at is not None:
+                return False
+            now = self.clock()
+            heapq.heappush(self._heap, (float(p["eta_s"]), self._seq, p))
+            self._seq += 1
+            self.proposals += 1
+            self.last_rx = now
+            if p["machine_id"] not in self.bidders:
+                self.bidders.add(p["machine_id"])
+                if self.enough_at is None:
+                    if self.min_bids > 0 and len(self.bidders) == self.min_bids:
+                        self.enough_at, self.enough_reason = now, "min_bids"
+                    elif self.expected is not None and self.expected <= self.bidders:
+                        self.enough_at, self.enough_reason = now, "all_bids"
+                    if self.enough_at is not None:
+                        self.cond.notify_all()
+            return True
+
+    # ---------- Close conditions (cond held) ----------
+
+    def due_at(self) -> tuple[float, str]:
+        """Earliest time a close condition is (or was) met, and which one."""
+        if self.enough_at is not None:
+            return self.enough_at, self.enough_reason
+        due, reason = self.opened_at + self.deadline_s, "deadline"
+        if self.quiet_s > 0 and self.last_rx + self.quiet_s < due:
+            due, reason = self.last_rx + self.quiet_s, "quiet"
+        return due, reason
+
+    def wakeup_at(self) -> float:
+        return self.due_at()[0]
+
+    def try_close(self, now: float | None = None) -> bool:
+        if self.closed_at is not None:
+            return True
+        now = self.clock() if now is None else now
+        due, reason = self.due_at()
+        if now < due:
+            return False
+        self.closed_at = now
+        self.close_reason = reason
+        self.close_lag = now - due
+        return True
+
+    def wait_closed(self) -> str:
+        """Blocks until the round closes; returns the reason (deadline / min_bids / quiet / all_bids)."""
+        with self.cond:
+            while not self.try_close():
+                self.cond.wait(max(0.0, self.wakeup_at() - self.clock()))
+            return self.close_reason
+
+    # ---------- Results ----------
+
+    def ranked(self, key=None) -> list[dict]:
+        """Proposals by ascending ETA, or `key(p)` (e.g. a corrected ETA); arrival order on ties."""
+        if key is not None:
+            return [p for _k, _seq, p in sorted((key(p), seq, p) for _eta, seq, p in self._heap)]
+        return [p for _eta, _seq, p in sorted(self._heap)]
+
+    def best(self, exclude=(), adjust=None, valid_at: float | None = None) -> dict | None:
+        """Lowest-ETA proposal whose machine is not in `exclude`; `adjust(p)` may correct the ETA.
+        With `valid_at` (wall clock), proposals whose reservation has expired by then are skipped."""
+        def usable(p):
+            return p["machine_id"] not in exclude and (valid_at is None or not reservation_expired(p, valid_at))
+
+        if adjust is not None:
+            candidates = [(adjust(p), seq, p) for _eta, seq, p in self._heap if usable(p)]
+            return min(candidates)[2] if candidates else None
+        if not exclude and valid_at is None:
+            return self._heap[0][2] if self._heap else None
+        for _eta, _seq, p in sorted(self._heap):
+            if usable(p):
+                return p
+        return None
+
+    def __len__(self) -> int:
+        return self.proposals
+
+
+# ---------- Benchmark ----------
+
+def _polling_round(deadline_s: float, min_bids: int, quiet_s: float, bids: list, lock: threading.Lock) -> tuple[float, float]:
+    """The previous supervisor_opt loop: sleep 20 ms, rebuild the bidder set, compare times."""
+    t0 = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now - t0 >= deadline_s:
+            return now, t0 + deadline_s
+        with lock:
+            snapshot = list(bids)
+        uniq = {mid for mid, _t in snapshot}
+        if min_bids > 0 and len(uniq) >= min_bids:
+            return now, snapshot[min_bids - 1][1]
+        last = snapshot[-1][1] if snapshot else t0
+        if quiet_s > 0 and now - last >= quiet_s:
+            return now, last + quiet_s
+        time.sleep(0.02)
+
+
+def bench(rounds: int, seed: int = 1) -> None:
+    """Close lag (time between a close condition being met and the waiter returning), polling vs Auction."""
+    rng = random.Random(seed)
+
+    def feed(add, n, spread):
+        for i in range(n):
+            time.sleep(rng.uniform(0, spread))
+            add(f"M{i:02d}")
+
+    for case, (min_bids, quiet_s, n_bids) in {"min_bids=3": (3, 0.0, 5), "quiet=50ms": (0, 0.05, 4)}.items():
+        for impl in ("polling", "auction"):
+            lags = []
+            for r in range(rounds):
+                if impl == "polling":
+                    bids, lock = [], threading.Lock()
+
+                    def add(mid):
+                        with lock:
+                            bids.append((mid, time.monotonic()))
+                    th = threading.Thread(target=feed, args=(add, n_bids, 0.015))
+                    th.start()
+                    closed, due = _polling_round(1.0, min_bids, quiet_s, bids, lock)
+                else:
+                    a = Auction(f"j{r}", "cut", 1.0, min_bids, quiet_s)
+                    th = threading.Thread(target=feed, args=(lambda mid: a.add({"machine_id": mid, "eta_s": 1.0}),
+                                                             n_bids, 0.015))
+                    th.start()
+                    a.wait_closed()
+                    closed, due = a.closed_at, a.due_at()[0]
+                th.join()
+                lags.append(closed - due)
+            lags.sort()
+            p50 = lags[len(lags) // 2] * 1000
+            p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000
+            print(f"{case:11s} {impl:8s} close lag p50={p50:7.3f} ms  p99={p99:7.3f} ms  max={lags[-1] * 1000:7.3f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bid collection benchmark (close lag)")
+    ap.add_argument("--bench", type=int, default=200, help="Rounds per case")
+    args = ap.parse_args()
+    bench(args.bench)
+
+
+if __name__ == "__main__":
+    main()
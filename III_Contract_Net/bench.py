@@ -0,0 +1,463 @@
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import sim
+from common import BASE, jload, now_s, t_registry
+from strategies import parse_jobs
+
+"""
+Contract Net benchmark: one fleet, one workload, several supervisor_opt.py variants, one report.
+
+- Fleet (--fleet): the run_all.sh machines ("run_all"), N generated machines (sim.fleet) or a JSON file
+  {machine_id: {job_type: seconds}}.
+- Workload (--workload): a file of jobs in the supervisors' --jobs syntax ("cut,drill@12,paint"), any
+  number per line, '#' starts a comment; --jobs N draws N random jobs instead; default: the run_all.sh list.
+- Variants (--variant NAME=FLAGS, repeatable): supervisor_opt.py flags, e.g. "early=--min-bids 3 --quiet-ms 100";
+  without --variant the adaptive deadline / early-stop / lookahead flags are swept (DEFAULT_VARIANTS).
+- Transport (--transport):
+  - "sim": in process on virtual time (sim.py), deterministic per --seed; flags sim.py does not model are refused;
+  - "mqtt": machine.py processes (or one fleet.py host with --fleet-host) and supervisor_opt.py against the
+    broker (--broker / --port), in real time.
+- Machine failures (--crash K@T, repeatable): K machines (sim.crash_plan(), the same ones for a seed on both
+  transports) fail T s after the supervisor starts: "crash" kills the process (SIGKILL, the broker publishes
+  its LWT), "hang" stops it (SIGSTOP, the LWT comes after 1.5 x --keepalive); --restart-s starts it again
+  (SIGCONT for a hung one). --heartbeat-s / --keepalive are passed to the machines.
+- Tracer: a passive subscriber to lab/cnp/# that timestamps every CfP, proposal, Accept and Done of the run.
+  It gives makespan, jobs/s, CfP to Accept and job (first CfP to Done) latency percentiles, round idle time (last bid to Accept, summed),
+  per-machine utilization and messages per job (retained replays excluded); skipped / rejected / lost /
+  late bids come from the supervisor's SUMMARY.
+
+Output in --out: report.json (per-variant means, then every run with its per-machine utilization and message
+counts by kind), report.csv (one row per run) and per run a Gantt trace: trace_<variant>_<run>.csv (one row per
+job: machine, slot, CfP, Accept, start and end times from the first CfP) and the same as text in
+gantt_<variant>_<run>.txt.
+"""
+
+DEFAULT_VARIANTS = [
+    "deadline=",
+    "adaptive=--adaptive-deadline",
+    "min-bids-3=--min-bids 3",
+    "quiet-100=--quiet-ms 100",
+    "min-bids-3+quiet-100=--min-bids 3 --quiet-ms 100",
+    "guard-fast=--guard-fast",
+    "guard-fast-1.3=--guard-fast --alpha 1.3",
+]
+
+RUN_ALL_JOBS = "cut,drill,paint,cut,drill,paint,cut,drill,paint,cut,drill,paint,cut,drill,paint"
+
+CSV_FIELDS = ["variant", "run", "seed", "jobs", "done", "skipped", "rejected", "lost", "makespan_s", "jobs_per_s",
+              "latency_p50_s", "latency_p99_s", "award_p50_ms", "award_p90_ms", "award_p99_ms", "award_max_ms", "idle_s", "late_bids", "direct_awards",
+              "utilization_mean", "utilization_min", "utilization_max", "messages", "msgs_per_job", "wall_s"]
+
+
+class Tracer:
+    """Passive lab/cnp/# subscriber: per-job CfP / Accept / Done times and message counts of one run."""
+
+    def __init__(self, clock=now_s) -> None:
+        self.clock = clock
+        self.online = set()       # machines whose last Advert says online
+        self.reset()
+
+    def reset(self) -> None:
+        self.jobs = {}            # job_id -> record (see _job)
+        self.messages = 0
+        self.by_kind = {}
+
+    def attach(self, client, clock=None) -> None:
+        if clock is not None:
+            self.clock = clock
+        client.message_callback_add(f"{BASE}/#", self.on_message)
+        client.subscribe(f"{BASE}/#")
+
+    def _job(self, job_id: str, job_type: str) -> dict:
+        rec = self.jobs.get(job_id)
+        if rec is None:
+            rec = self.jobs[job_id] = {"job_id": job_id, "job_type": job_type, "cfp_at": None, "last_bid_at": None,
+                                       "award_at": None, "machine_id": "", "slot": 0, "started_at": None,
+                                       "finished_at": None, "preempted_s": 0.0}
+        return rec
+
+    def on_message(self, _c, _u, msg) -> None:
+        try:
+            self._trace(msg)
+        except Exception as e:
+            print(f"[BENCH] tracer error on {msg.topic}: {e!r}")
+
+    def _trace(self, msg) -> None:
+        parts = msg.topic.split("/")
+        kind = parts[2] if len(parts) > 2 else ""
+        if kind == "registry":
+            if not msg.payload:
+                return  # retained Advert cleared
+            a = jload(msg.payload)
+            (self.online.add if a.get("online") else self.online.discard)(a["machine_id"])
+        if msg.retain:
+            return  # replay of a retained Advert, not traffic of this run
+        if kind == "replies" and len(parts) > 4:
+            kind = parts[4]
+        t = self.clock()
+        if kind in ("cfp", "cfp_to"):
+            d = jload(msg.payload)
+            rec = self._job(d["job_id"], d["job_type"])
+            if rec["cfp_at"] is None:
+                rec["cfp_at"] = t
+        elif kind == "cfp_batch":
+            for j in jload(msg.payload)["jobs"]:
+                rec = self._job(j["job_id"], j["job_type"])
+                if rec["cfp_at"] is None:
+                    rec["cfp_at"] = t
+        elif kind == "proposals":
+            d = jload(msg.payload)
+            rec = self._job(d["job_id"], d["job_type"])
+            if rec["award_at"] is None:
+                rec["last_bid_at"] = t
+        elif kind == "accept":
+            d = jload(msg.payload)
+            rec = self._job(d["job_id"], d["job_type"])
+            rec["award_at"] = t
+            rec["machine_id"] = parts[3]
+        elif kind in ("done", "reject", "reassigned", "results"):
+            d = jload(msg.payload)
+            kind = "reject" if "reason" in d else "reassigned" if "from_machine" in d else "done"
+            if kind == "reassigned":
+                self._job(d["job_id"], d["job_type"])["machine_id"] = d["machine_id"]
+            elif kind == "done":
+                rec = self._job(d["job_id"], d["job_type"])
+                rec.update(machine_id=d["machine_id"], slot=d.get("slot", 0),
+                           started_at=d["started_at"], finished_at=d["finished_at"],
+                           preempted_s=d.get("preempted_s", 0.0))
+        self.messages += 1
+        self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+
+
+def percentile(values: list[float], q: float):
+    """Nearest-rank percentile (None for no values)."""
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(q / 100.0 * len(s)) - 1))]
+
+
+def measure(tracer: Tracer, caps: dict, slots: int, n_jobs: int) -> tuple[dict, list[dict]]:
+    """Report metrics of a traced run, and its trace rows (times relative to the first CfP / Accept)."""
+    recs = list(tracer.jobs.values())
+    firsts = [r["cfp_at"] if r["cfp_at"] is not None else r["award_at"] for r in recs]
+    t0 = min((t for t in firsts if t is not None), default=0.0)
+    done = [r for r in recs if r["finished_at"] is not None]
+    makespan = max((r["finished_at"] for r in done), default=t0) - t0
+    rounds = [r for r in recs if r["award_at"] is not None and r["cfp_at"] is not None]
+    lat = [(r["award_at"] - r["cfp_at"]) * 1000.0 for r in rounds]
+    job_lat = [r["finished_at"] - r["cfp_at"] for r in done if r["cfp_at"] is not None]
+    # Round idle time: open after its last bid (after the CfP if it got none before the Accept)
+    idle = [r["award_at"] - (r["last_bid_at"] if r["last_bid_at"] is not None else r["cfp_at"]) for r in rounds]
+    busy = {m: 0.0 for m in caps}
+    for r in done:
+        busy[r["machine_id"]] = busy.get(r["machine_id"], 0.0) + r["finished_at"] - r["started_at"] - r["preempted_s"]
+    util = {m: b / (makespan * slots) if makespan > 0 else 0.0 for m, b in sorted(busy.items())}
+
+    def rel(t):
+        return None if t is None else round(t - t0, 4)
+
+    rows = [{"machine_id": r["machine_id"], "slot": r["slot"], "job_id": r["job_id"], "job_type": r["job_type"],
+             "cfp_s": rel(r["cfp_at"]), "award_s": rel(r["award_at"]), "start_s": rel(r["started_at"]),
+             "end_s": rel(r["finished_at"])} for r in sorted(done, key=lambda r: (r["machine_id"], r["started_at"]))]
+    metrics = {
+        "jobs": n_jobs,
+        "done": len(done),
+        "makespan_s": makespan,
+        "jobs_per_s": len(done) / makespan if makespan > 0 else 0.0,
+        "latency_p50_s": percentile(job_lat, 50),
+        "latency_p99_s": percentile(job_lat, 99),
+        "award_p50_ms": percentile(lat, 50),
+        "award_p90_ms": percentile(lat, 90),
+        "award_p99_ms": percentile(lat, 99),
+        "award_max_ms": max(lat, default=None),
+        "idle_s": sum(idle),
+        "direct_awards": sum(1 for r in recs if r["award_at"] is not None and r["cfp_at"] is None),
+        "utilization_mean": sum(util.values()) / len(util) if util else 0.0,
+        "utilization_min": min(util.values(), default=0.0),
+        "utilization_max": max(util.values(), default=0.0),
+        "messages": tracer.messages,
+        "msgs_per_job": tracer.messages / max(1, n_jobs),
+        "machine_utilization": util,
+        "messages_by_kind": dict(sorted(tracer.by_kind.items())),
+    }
+    return metrics, rows
+
+
+def gantt(rows: list[dict], caps: dict, makespan: float, width: int = 100) -> str:
+    """Text Gantt chart: one line per machine slot, each job drawn with its type's initial (case alternates)."""
+    lines = {}
+    for m in caps:
+        lines[(m, 0)] = [" "] * width
+    scale = width / makespan if makespan > 0 else 0.0
+    count = {}
+    for r in rows:
+        key = (r["machine_id"], r["slot"])
+        line = lines.setdefault(key, [" "] * width)
+        n = count[key] = count.get(key, 0) + 1
+        ch = r["job_type"][:1].upper() if n % 2 else r["job_type"][:1].lower()
+        a = min(width - 1, int(r["start_s"] * scale))
+        b = max(a + 1, min(width, int(round(r["end_s"] * scale))))
+        line[a:b] = ch * (b - a)
+    label = max((len(f"{m}/{s}") for m, s in lines), default=4)
+    out = [f"{'':{label}s} |0 s{'':{max(0, width - 3 - len(f'{makespan:.1f} s'))}s}{makespan:.1f} s|"]
+    for (m, s), line in sorted(lines.items()):
+        out.append(f"{f'{m}/{s}':{label}s} |{''.join(line)}|")
+    return "\n".join(out) + "\n"
+
+
+def parse_summary(text: str) -> dict:
+    """key=value pairs of the last "SUMMARY:" line of a supervisor log."""
+    line = next((ln for ln in reversed(text.splitlines()) if "SUMMARY:" in ln), "")
+    out = {}
+    for item in line.split("SUMMARY:", 1)[-1].split():
+        k, _, v = item.partition("=")
+        for conv in (int, float, str):
+            try:
+                out[k] = conv(v)
+                break
+            except ValueError:
+                pass
+    return out
+
+
+def run_sim(flags: list[str], job_types: list[str], caps: dict, opts, seed: int) -> tuple[dict, Tracer]:
+    mode = "pipeline" if "--pipeline" in flags else "sequential"
+    base = ["--mode", mode, "--seed", str(seed), "--deadline", str(opts.deadline), "--slots", str(opts.slots),
+            "--queue-cap", str(opts.queue_cap), "--latency-ms", str(opts.latency_ms), "--jitter-ms", str(opts.jitter_ms),
+            "--machine-skew", str(opts.machine_skew), "--duration-noise", str(opts.duration_noise),
+            "--heartbeat-s", str(opts.heartbeat_s), "--keepalive-s", str(opts.keepalive),
+            "--crash-mode", opts.crash_mode, "--restart-s", str(opts.restart_s)]
+    for spec in opts.crash:
+        base += ["--crash", spec]
+    args, unknown = sim.build_parser().parse_known_args(base + [f for f in flags if f != "--pipeline"])
+    if unknown:
+        raise SystemExit(f"[BENCH] sim.py does not model {' '.join(unknown)} (use --transport mqtt)")
+    tracer = Tracer()
+    stats = sim.simulate(args, job_types, caps, observer=tracer.attach)
+    return stats, tracer
+
+
+def run_mqtt(flags: list[str], job_spec: str, caps: dict, opts, log_prefix: str, seed: int) -> tuple[dict, Tracer]:
+    import paho.mqtt.client as mqtt
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    tracer = Tracer()
+    connected = threading.Event()
+    client = mqtt.Client(client_id=f"bench-{os.getpid()}")
+    client.on_connect = lambda c, u, f, rc: connected.set()
+    client.connect(opts.broker, opts.port, keepalive=30)
+    client.loop_start()
+    if not connected.wait(10.0):
+        raise SystemExit(f"[BENCH] no broker at {opts.broker}:{opts.port}")
+    tracer.attach(client)
+
+    procs, logs = [], []
+    settings = ["--slots", str(opts.slots), "--queue-cap", str(opts.queue_cap), "--duration-noise", str(opts.duration_noise),
+                "--heartbeat-s", str(opts.heartbeat_s), "--keepalive", str(opts.keepalive),
+                "--broker", opts.broker, "--port", str(opts.port), *shlex.split(opts.machine_flags)]
+    slow = sim.slowdowns(caps, opts.machine_skew, seed)
+    crashes = sim.crash_plan(opts.crash, list(caps), seed)
+    if crashes and opts.fleet_host:
+        raise SystemExit("[BENCH] --crash needs one machine.py process per machine (no --fleet-host)")
+    by_id, machine_logs, stopped, timers = {}, {}, set(), []   # machine_id -> process / log; SIGSTOPped; pending
+
+    def fail(mid: str) -> None:
+        p = by_id[mid]
+        print(f"[BENCH] {opts.crash_mode} {mid} (pid {p.pid})")
+        if opts.crash_mode == "hang":
+            p.send_signal(signal.SIGSTOP)
+            stopped.add(p)
+        else:
+            p.kill()
+        if opts.restart_s > 0:
+            timers.append(threading.Timer(opts.restart_s, restart, (mid,)))
+            timers[-1].start()
+
+    def restart(mid: str) -> None:
+        p = by_id[mid]
+        if p in stopped:
+            stopped.discard(p)
+            p.send_signal(signal.SIGCONT)
+        else:
+            by_id[mid] = subprocess.Popen(p.args, stdout=machine_logs[mid], stderr=subprocess.STDOUT)
+            procs.append(by_id[mid])
+
+    try:
+        if opts.fleet_host:
+            with open(f"{log_prefix}_fleet.json", "w") as f:
+                json.dump(caps, f)
+            log = open(f"{log_prefix}_fleet.txt", "w")
+            logs.append(log)
+            procs.append(subprocess.Popen([sys.executable, "-u", os.path.join(here, "fleet.py"), "--fleet", f.name,
+                                           "--name", "bench", "--machine-skew", str(opts.machine_skew),
+                                           "--seed", str(seed), *settings], stdout=log, stderr=subprocess.STDOUT))
+        for mid, c in caps.items() if not opts.fleet_host else ():
+            log = open(f"{log_prefix}_{mid}.txt", "w")
+            logs.append(log)
+            procs.append(subprocess.Popen(
+                [sys.executable, "-u", os.path.join(here, "machine.py"), "--machine-id", mid,
+                 "--caps", ",".join(f"{jt}:{s}" for jt, s in c.items()), "--slowdown", str(slow[mid]), *settings],
+                stdout=log, stderr=subprocess.STDOUT))
+            by_id[mid], machine_logs[mid] = procs[-1], log
+        until = time.monotonic() + 10.0 + 0.1 * len(caps)
+        while not set(caps) <= tracer.online and time.monotonic() < until:
+            time.sleep(0.05)
+        if not set(caps) <= tracer.online:
+            raise SystemExit(f"[BENCH] machines not online: {sorted(set(caps) - tracer.online)}")
+        tracer.reset()
+
+        sup_log = f"{log_prefix}_supervisor.txt"
+        for t, mid in crashes:
+            timers.append(threading.Timer(t, fail, (mid,)))
+            timers[-1].start()
+        t0 = time.perf_counter()
+        with open(sup_log, "w") as log:
+            subprocess.run([sys.executable, "-u", os.path.join(here, "supervisor_opt.py"), "--jobs", job_spec,
+                            "--deadline", str(opts.deadline), *flags, "--broker", opts.broker, "--port", str(opts.port)],
+                           stdout=log, stderr=subprocess.STDOUT, timeout=opts.timeout_s, check=False)
+        wall = time.perf_counter() - t0
+        time.sleep(0.2)   # last Done still on its way to the tracer
+    finally:
+        for timer in timers:
+            timer.cancel()
+        for p in stopped:
+            p.send_signal(signal.SIGCONT)
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        for log in logs:
+            log.close()
+        time.sleep(0.3)   # LWTs
+        for mid in list(caps) + (["bench"] if opts.fleet_host else []):
+            client.publish(t_registry(mid), b"", qos=0, retain=True)   # no retained Advert left for the next run
+        client.loop_stop()
+        client.disconnect()
+    with open(sup_log) as f:
+        stats = parse_summary(f.read())
+    stats["wall_s"] = wall
+    return stats, tracer
+
+
+def load_workload(path: str) -> str:
+    """Job file -> one --jobs spec ("cut,drill@12,...")."""
+    items = []
+    with open(path) as f:
+        for line in f:
+            items += [x.strip() for x in line.split("#", 1)[0].split(",") if x.strip()]
+    return ",".join(items)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Contract Net benchmark: supervisor_opt.py variants on one workload")
+    ap.add_argument("--transport", choices=("sim", "mqtt"), default="sim")
+    ap.add_argument("--fleet", default="run_all", help='"run_all", a machine count (sim.fleet) or a JSON caps file')
+    ap.add_argument("--workload", default="", help="Job file in the --jobs syntax (default: the run_all.sh list)")
+    ap.add_argument("--jobs", type=int, default=0, help="N random jobs of the fleet's types instead of --workload")
+    ap.add_argument("--variant", action="append", default=[],
+                    help='NAME=FLAGS, supervisor_opt.py flags of one variant (repeatable)')
+    ap.add_argument("--repeat", type=int, default=1, help="Runs per variant (sim seeds --seed, --seed + 1, ...)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--deadline", type=float, default=0.8, help="CfP deadline of every variant (unless overridden)")
+    ap.add_argument("--slots", type=int, default=1, help="Slots per machine")
+    ap.add_argument("--queue-cap", type=int, default=0, help="Job queue per machine")
+    ap.add_argument("--machine-skew", type=float, default=0.0,
+                    help="Lognormal sigma of each machine's real / promised run time (sim.slowdowns, per --seed)")
+    ap.add_argument("--duration-noise", type=float, default=0.0, help="Lognormal sigma of each job's run time")
+    ap.add_argument("--machine-flags", default="", help="Extra machine.py / fleet.py flags (mqtt)")
+    ap.add_argument("--fleet-host", action="store_true", help="Run the machines in one fleet.py process (mqtt)")
+    ap.add_argument("--heartbeat-s", type=float, default=0.0, help="Machines re-advertise this often (0 = off)")
+    ap.add_argument("--keepalive", type=int, default=60, help="Machines' MQTT keepalive (s)")
+    ap.add_argument("--crash", action="append", default=[],
+                    help="K@T: K machines fail T s after the supervisor starts (repeatable)")
+    ap.add_argument("--crash-mode", choices=("crash", "hang"), default="crash",
+                    help="crash: SIGKILL (LWT at once); hang: SIGSTOP (LWT after 1.5 x --keepalive)")
+    ap.add_argument("--restart-s", type=float, default=0.0, help="Failed machines start again N s later (0 = never)")
+    ap.add_argument("--latency-ms", type=float, default=2.0, help="Broker delivery latency (sim)")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform random latency per message (sim)")
+    ap.add_argument("--broker", default="localhost")
+    ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--timeout-s", type=float, default=600.0, help="Max wall time of one run (mqtt)")
+    ap.add_argument("--gantt-width", type=int, default=100)
+    ap.add_argument("--out", default="bench_out", help="Report directory")
+    args = ap.parse_args()
+
+    caps = sim.load_fleet(args.fleet, args.seed)
+    if args.workload:
+        job_spec = load_workload(args.workload)
+    elif args.jobs:
+        job_spec = ",".join(sim.random_jobs(caps, args.jobs, args.seed))
+    else:
+        job_spec = RUN_ALL_JOBS
+    job_types, _dues = parse_jobs(job_spec)
+    variants = []
+    for v in args.variant or DEFAULT_VARIANTS:
+        name, sep, flags = v.partition("=")
+        variants.append((name, flags) if sep else (v, v))
+    os.makedirs(args.out, exist_ok=True)
+    if args.transport == "mqtt":
+        os.makedirs(os.path.join(args.out, "logs"), exist_ok=True)
+
+    runs = []
+    for name, flags in variants:
+        for i in range(args.repeat):
+            seed = args.seed + i
+            tag = f"{re.sub(r'[^A-Za-z0-9.+-]', '_', name) or 'default'}_{i + 1}"
+            argv = shlex.split(flags)
+            if args.transport == "sim":
+                stats, tracer = run_sim(argv, job_types, caps, args, seed)
+            else:
+                stats, tracer = run_mqtt(argv, job_spec, caps, args, os.path.join(args.out, "logs", tag), seed)
+            metrics, rows = measure(tracer, caps, args.slots, len(job_types))
+            trace_path = os.path.join(args.out, f"trace_{tag}.csv")
+            with open(trace_path, "w", newline="") as f:
+                w = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["machine_id"])
+                w.writeheader()
+                w.writerows(rows)
+            gantt_path = os.path.join(args.out, f"gantt_{tag}.txt")
+            with open(gantt_path, "w") as f:
+                f.write(f"{name} run {i + 1} ({flags or 'no flags'})\n")
+                f.write(gantt(rows, caps, metrics["makespan_s"], args.gantt_width))
+            run = {"variant": name, "flags": flags, "run": i + 1, "seed": seed, "transport": args.transport,
+                   **{k: stats.get(k, 0) for k in ("skipped", "rejected", "lost", "late_bids")}, **metrics,
+                   "wall_s": stats.get("wall_s"), "supervisor": stats, "trace": trace_path, "gantt": gantt_path}
+            runs.append(run)
+            p50, p99 = run["award_p50_ms"], run["award_p99_ms"]
+            l99 = run["latency_p99_s"]
+            print(f"[BENCH] {name:22s} run {i + 1}: makespan={run['makespan_s']:.2f}s jobs/s={run['jobs_per_s']:.2f} "
+                  f"latency p99={'-' if l99 is None else f'{l99:.2f}'}s award p50/p99={'-' if p50 is None else f'{p50:.0f}'}/{'-' if p99 is None else f'{p99:.0f}'} ms "
+                  f"idle={run['idle_s']:.1f}s util={run['utilization_mean']:.2f} skipped={run['skipped']} "
+                  f"msgs/job={run['msgs_per_job']:.1f}")
+
+    config = {"transport": args.transport, "fleet": args.fleet, "machines": len(caps), "slots": args.slots,
+              "queue_cap": args.queue_cap, "deadline_s": args.deadline, "jobs": len(job_types),
+              "workload": args.workload or ("random" if args.jobs else "run_all"), "seed": args.seed}
+    means = {}
+    for name, _flags in variants:
+        mine = [run for run in runs if run["variant"] == name]
+        means[name] = {k: sum(run[k] for run in mine) / len(mine) for k in CSV_FIELDS[3:]
+                       if all(isinstance(run[k], (int, float)) for run in mine)}
+    with open(os.path.join(args.out, "report.json"), "w") as f:
+        json.dump({"config": config, "variants": means, "runs": runs}, f, indent=2)
+    with open(os.path.join(args.out, "report.csv"), "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        w.writeheader()
+        for run in runs:
+            w.writerow({k: round(v, 4) if isinstance(v, float) else v for k, v in run.items()})
+    print(f"[BENCH] report: {os.path.join(args.out, 'report.json')}, {os.path.join(args.out, 'report.csv')}")
+
+
+if __name__ == "__main__":
+    main()
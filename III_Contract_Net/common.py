@@ -1,5 +1,5 @@
 import json, time, uuid
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 
 BASE = "lab/cnp" 
 
@@ -21,9 +21,12 @@ class CfP:
     job_type: str
     deadline_s: float     # seconds
     issued_at: float      # timestamp epoch
+    reply_to: str = ""    # topic for the Proposal ("" = lab/cnp/proposals), see with_reply()
+    corr: str = ""        # correlation id echoed in the answer
+    priority: int = 0     # priority class (higher first): machines queue and preempt by it
 
     def to_msg(self):
-        return jdump(asdict(self))
+        return jdump(vars(self))
 
 @dataclass
 class Proposal:
@@ -32,17 +35,78 @@ class Proposal:
     machine_id: str
     eta_s: float          # promised time (seconds)
     at: float
+    backlog_s: float = 0.0  # part of eta_s spent on work already queued on the machine
+    ttl_s: float = 0.0      # the machine keeps room for this job until at + ttl_s (0 = no reservation)
+    corr: str = ""          # correlation id of the CfP
 
     def to_msg(self):
-        return jdump(asdict(self))
+        return jdump(vars(self))
+
+@dataclass
+class BatchCfP:
+    batch_id: str
+    jobs: list            # [{"job_id": ..., "job_type": ...}, ...]
+    deadline_s: float
+    issued_at: float
+    reply_to: str = ""
+    corr: str = ""
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class BatchProposal:
+    batch_id: str
+    machine_id: str
+    etas: dict            # job_type -> ETA (seconds), for the types of the batch this machine can run
+    at: float
+    slots: int = 1        # jobs the machine runs in parallel
+    corr: str = ""
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class Advert:
+    # Retained machine state on lab/cnp/registry/<machine_id> (the LWT publishes online=False)
+    machine_id: str
+    caps: dict            # job_type -> duration (seconds)
+    slots: int
+    queue_cap: int
+    busy: int             # slots running a job
+    queued: int           # accepted jobs waiting for a slot
+    room: int             # jobs it would still accept
+    backlog_s: float      # seconds until a job accepted now could start
+    online: bool
+    at: float
+    host: str = ""        # fleet host sharing its connection (fleet.py); the host's own Advert has machine_id == host
+    heartbeat_s: float = 0.0  # re-published at least this often while online (0 = only on changes)
+
+    def to_msg(self):
+        return jdump(vars(self))
 
 @dataclass
 class Accept:
     job_id: str
     job_type: str
+    reply_to: str = ""    # topic for the Done / Reject ("" = lab/cnp/done, lab/cnp/reject)
+    corr: str = ""
+    priority: int = 0     # priority class of the job (as in its CfP)
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class Reject:
+    job_id: str
+    job_type: str
+    machine_id: str
+    reason: str           # "busy" (no room left) or "incapable"
+    at: float
+    corr: str = ""
 
     def to_msg(self):
-        return jdump(asdict(self))
+        return jdump(vars(self))
 
 @dataclass
 class Done:
@@ -51,20 +115,192 @@ class Done:
     machine_id: str
     started_at: float
     finished_at: float
+    slot: int = 0         # machine slot that ran the job
+    corr: str = ""
+    preemptions: int = 0  # times a higher-priority job took its slot
+    preempted_s: float = 0.0  # part of started_at..finished_at not spent on the run that finished it
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class StealRequest:
+    # An idle machine offers its free slots on lab/cnp/steal/request (free=0 withdraws the offer); a machine
+    # whose queue went above the steal threshold announces its backlog there (backlog=0 once it is empty)
+    machine_id: str
+    caps: dict            # job_type -> duration (seconds)
+    free: int             # jobs it would start at once
+    at: float
+    backlog: int = 0      # queued jobs it would lend
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class StealGrant:
+    # A queued job handed to an idle peer on lab/cnp/steal/grant/<to_machine>, or handed back (returned)
+    job_id: str
+    job_type: str
+    from_machine: str
+    to_machine: str
+    at: float
+    priority: int = 0
+    reply_to: str = ""    # reply topic / correlation id of the job's Accept: the new machine answers there
+    corr: str = ""
+    returned: bool = False  # the peer had no room left: the job goes back to from_machine's queue
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class Reassigned:
+    # The job's supervisor learns that another machine will run it (on the reply topic of its Accept)
+    job_id: str
+    job_type: str
+    from_machine: str
+    machine_id: str       # machine that runs it now
+    eta_s: float          # its ETA there
+    duration_s: float     # its promised run time there
+    at: float
+    corr: str = ""
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class JobRequest:
+    # A job submitted to a supervisor's intake (lab/cnp/jobs/<supervisor>)
+    job_type: str
+    request_id: str = ""
+    priority: int = 0     # higher is served first
+    due_s: float = 0.0    # wanted done this many seconds after submitted_at (0 = no due time)
+    submitted_at: float = 0.0
+    reply_to: str = ""    # topic for its JobStatus updates ("" = none)
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class JobStatus:
+    request_id: str
+    status: str           # queued, refused, done, late (done after its due time) or dropped
+    at: float
+    reason: str = ""
+    machine_id: str = ""
+
+    def to_msg(self):
+        return jdump(vars(self))
+
+@dataclass
+class IntakeStatus:
+    # Retained on lab/cnp/intake/<supervisor> (the LWT publishes accepting=False): producers send
+    # at most limit - depth jobs until the next one, none while accepting is False
+    supervisor: str
+    accepting: bool
+    depth: int            # jobs waiting in the intake queue
+    limit: int
+    at: float
 
     def to_msg(self):
-        return jdump(asdict(self))
+        return jdump(vars(self))
 
 
 def t_cfp(job_type: str) -> str:
     # Broadcast
     return f"{BASE}/cfp/{job_type}"
 
+def t_cfp_to(machine_id: str) -> str:
+    # CfP sent to one machine (sampled auctions)
+    return f"{BASE}/cfp_to/{machine_id}"
+
 def t_proposals() -> str:
     return f"{BASE}/proposals"
 
+def t_cfp_batch() -> str:
+    # One CfP for a block of jobs (all machines)
+    return f"{BASE}/cfp_batch"
+
+def t_batch_proposals() -> str:
+    return f"{BASE}/batch_proposals"
+
+def t_registry(machine_id: str = "+") -> str:
+    # Retained capability / state adverts, one per machine ("+" = all)
+    return f"{BASE}/registry/{machine_id}"
+
 def t_accept(machine_id: str) -> str:
     return f"{BASE}/accept/{machine_id}"
 
+def t_reject() -> str:
+    # Accepts a machine cannot honor
+    return f"{BASE}/reject"
+
 def t_done() -> str:
     return f"{BASE}/done"
+
+def t_steal_request() -> str:
+    # Idle machines offering to take queued jobs of their peers
+    return f"{BASE}/steal/request"
+
+def t_steal_grant(machine_id: str) -> str:
+    return f"{BASE}/steal/grant/{machine_id}"
+
+def t_reassigned() -> str:
+    # Jobs moved to another machine by work stealing (without a reply topic)
+    return f"{BASE}/reassigned"
+
+def t_jobs(supervisor_id: str) -> str:
+    # Job intake of one supervisor (JobRequest)
+    return f"{BASE}/jobs/{supervisor_id}"
+
+def t_intake(supervisor_id: str = "+") -> str:
+    # Retained intake state (IntakeStatus) of one supervisor ("+" = all)
+    return f"{BASE}/intake/{supervisor_id}"
+
+def t_replies(supervisor_id: str, kind: str = "#") -> str:
+    # Answers to one supervisor's requests: proposals, batch_proposals or results (Done, Reject, Reassigned)
+    return f"{BASE}/replies/{supervisor_id}/{kind}"
+
+
+# ---------- Reply routing ----------
+# A request (CfP, BatchCfP, Accept) may name the topic its answers go to and a correlation id
+# (its job or batch id) that the answers carry back. Both travel in the payload, so MQTT 3.1.1
+# peers understand them; an MQTT v5 client also sets the Response Topic / Correlation Data
+# properties, which a v5 peer reads first. Without a reply topic the shared topics are used.
+
+def _publish_props(**values):
+    # MQTT v5 PUBLISH properties (imported here: only v5 clients need them)
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+    props = Properties(PacketTypes.PUBLISH)
+    for name, value in values.items():
+        setattr(props, name, value)
+    return props
+
+def with_reply(req, reply_to: str, mqtt5: bool = False):
+    """Routes the answers to `req` to `reply_to`; returns the PUBLISH properties (None without mqtt5)."""
+    if not reply_to:
+        return None
+    req.reply_to = reply_to
+    req.corr = getattr(req, "job_id", None) or req.batch_id
+    if not mqtt5:
+        return None
+    return _publish_props(ResponseTopic=req.reply_to, CorrelationData=req.corr.encode())
+
+def reply_route(msg, req: dict) -> tuple[str, str]:
+    """(reply topic, correlation id) of a received request; ("", "") when it has none."""
+    props = getattr(msg, "properties", None)
+    topic = getattr(props, "ResponseTopic", None) if props is not None else None
+    if topic:
+        corr = getattr(props, "CorrelationData", b"")
+        return topic, corr.decode() if isinstance(corr, bytes) else str(corr)
+    return req.get("reply_to", ""), req.get("corr", "")
+
+def publish_reply(client, route: tuple[str, str], shared_topic: str, answer, mqtt5: bool = False):
+    """Publishes `answer` on the reply topic of its request, else on `shared_topic`."""
+    topic, corr = route
+    props = None
+    if topic:
+        answer.corr = corr
+        if mqtt5:
+            props = _publish_props(CorrelationData=corr.encode())
+    return client.publish(topic or shared_topic, answer.to_msg(), qos=0, properties=props)
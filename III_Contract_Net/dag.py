@@ -0,0 +1,207 @@
+import argparse
+import heapq
+import json
+import os
+import random
+from collections import deque
+
+"""
+Job DAGs: jobs that may only start once the jobs they depend on are Done (cut -> drill -> paint on one part).
+
+- parse_dag() reads a DAG: a JSON file {name: {"type": job_type, "after": [names]}} (or {name: job_type} for a
+  job without dependency), or chains "cut>drill>paint" separated by commas, "*N" for N parts with the same chain
+  ("cut>drill>paint*4,cut>paint").
+- JobDag releases a job once all its predecessors are Done; the released jobs are served by critical path
+  (order "cp": the longest chain of estimated run times from the job to the end of the DAG, the upward rank of
+  list scheduling, so the chains that bound the makespan start first) or in release order ("fifo").
+  Independent branches are released together, and the pipeline (pipeline.py) runs them on different machines.
+- A job the pipeline gives up on (skipped / lost) cancels every job that depends on it.
+- topological() is the DAG as one job list (what a sequential supervisor has to run one job at a time).
+
+pop() / finished() / drained() are the interface of intake.JobQueue, so the pipeline pulls from both the same way.
+"""
+
+
+def parse_dag(spec: str) -> dict:
+    """{name: (job_type, [predecessor names])} from a JSON file or chain syntax (see above)."""
+    if os.path.exists(spec):
+        with open(spec) as f:
+            raw = json.load(f)
+        return {name: (v, []) if isinstance(v, str) else (v["type"], list(v.get("after", [])))
+                for name, v in raw.items()}
+    nodes = {}
+    part = 0
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        chain, _, copies = item.partition("*")
+        for _ in range(int(copies) if copies else 1):
+            part += 1
+            prev = None
+            for k, jt in enumerate(chain.split(">")):
+                name = f"p{part}.{k + 1}.{jt.strip()}"
+                nodes[name] = (jt.strip(), [prev] if prev else [])
+                prev = name
+    return nodes
+
+
+def random_dag(n: int, types: list[str], width: int = 6, max_preds: int = 2, seed: int = 1) -> dict:
+    """n jobs in layers of up to `width`, each depending on 1..max_preds jobs of the layer before."""
+    rng = random.Random(seed)
+    nodes, layer, k = {}, [], 0
+    while k < n:
+        size = min(n - k, rng.randint(1, width))
+        new = []
+        for _ in range(size):
+            k += 1
+            preds = rng.sample(layer, min(len(layer), rng.randint(1, max_preds))) if layer else []
+            nodes[f"j{k}"] = (rng.choice(types), preds)
+            new.append(f"j{k}")
+        layer = new
+    return nodes
+
+
+class JobDag:
+    def __init__(self, nodes: dict, order: str = "cp", est=None) -> None:
+        if order not in ("cp", "fifo"):
+            raise ValueError(f"unknown DAG order {order!r}")
+        self.order = order
+        self.types = {name: jt for name, (jt, _preds) in nodes.items()}
+        self.succ = {name: [] for name in nodes}
+        self._waiting = {}       # name -> predecessors not Done yet
+        for name, (_jt, preds) in nodes.items():
+            for p in preds:
+                if p not in nodes:
+                    raise ValueError(f"job {name!r} depends on unknown job {p!r}")
+                self.succ[p].append(name)
+            self._waiting[name] = len(set(preds))
+        self._topo = self._sort(nodes)
+        self._ready = []         # (key, seq, name)
+        self._seq = 0
+        self.ranks = {}
+        self.rank(est)
+        for name in self._topo:
+            if not self._waiting[name]:
+                self._release(name)
+
+        self.total = len(nodes)
+        self.left = len(nodes)   # neither Done nor cancelled
+        self.cancelled = 0
+
+    def _sort(self, nodes: dict) -> list[str]:
+        """Kahn's algorithm in input order; ValueError on a cycle."""
+        left = dict(self._waiting)
+        todo = deque(name for name in nodes if not left[name])
+        out = []
+        while todo:
+            name = todo.popleft()
+            out.append(name)
+            for s in self.succ[name]:
+                left[s] -= 1
+                if not left[s]:
+                    todo.append(s)
+        if len(out) != len(nodes):
+            raise ValueError("job DAG has a cycle: " + ", ".join(sorted(n for n in nodes if left[n])))
+        return out
+
+    def rank(self, est=None) -> None:
+        """Critical path of every job with `est(job_type)` seconds per job (1 per job without it)."""
+        for name in reversed(self._topo):
+            tail = max((self.ranks[s] for s in self.succ[name]), default=0.0)
+            self.ranks[name] = (est(self.types[name]) if est is not None else 1.0) + tail
+        self._ready = [(self._key(name), seq, name) for _k, seq, name in self._ready]
+        heapq.heapify(self._ready)
+
+    def _key(self, name: str) -> float:
+        return -self.ranks[name] if self.order == "cp" else 0.0
+
+    def _release(self, name: str) -> None:
+        heapq.heappush(self._ready, (self._key(name), self._seq, name))
+        self._seq += 1
+
+    def topological(self) -> list[str]:
+        """Job types in a dependency-respecting order."""
+        return [self.types[name] for name in self._topo]
+
+    def critical_path_s(self) -> float:
+        """Makespan lower bound with as many machines as needed (with the `est` of rank())."""
+        return max(self.ranks.values(), default=0.0)
+
+    # ---------- Source interface of the pipeline ----------
+
+    def pop(self) -> dict | None:
+        """Next released job (None while every job left waits for a predecessor)."""
+        if not self._ready:
+            return None
+        name = heapq.heappop(self._ready)[2]
+        return {"job_type": self.types[name], "node": name}
+
+    def finished(self, req: dict, outcome: str, machine_id: str = "") -> None:
+        """A job ended: "done" releases the jobs waiting only for it, anything else cancels its descendants."""
+        name = req["node"]
+        self.left -= 1
+        if outcome == "done":
+            for s in self.succ[name]:
+                self._waiting[s] -= 1
+                if not self._waiting[s]:
+                    self._release(s)
+            return
+        todo, seen = list(self.succ[name]), set()
+        while todo:
+            s = todo.pop()
+            if s not in seen and self._waiting[s] >= 0:
+                seen.add(s)
+                todo.extend(self.succ[s])
+        self.cancelled += len(seen)
+        self.left -= len(seen)
+        for s in seen:
+            self._waiting[s] = -1    # cancelled, never released
+        print(f"[DAG] job {name} {outcome}: {len(seen)} dependent job(s) cancelled")
+
+    def drained(self) -> bool:
+        return self.left <= 0
+
+    def stats(self) -> dict:
+        return {"dag_cancelled": self.cancelled, "critical_path_s": self.critical_path_s()}
+
+
+# ---------- Benchmark ----------
+
+def bench(seed: int = 1, jitter_ms: float = 0.0) -> None:
+    """Makespan of DAGs on the run_all.sh fleet in sim.py: serialized, released fifo, released by critical path."""
+    from sim import build_parser, fleet, simulate
+    from assignment import RUN_ALL_CAPS
+
+    caps = fleet(len(RUN_ALL_CAPS))
+    types = sorted({jt for c in caps.values() for jt in c})
+    mean = {jt: sum(c[jt] for c in caps.values() if jt in c) / sum(jt in c for c in caps.values()) for jt in types}
+    shapes = {
+        "3-stage chain x 20 parts": parse_dag("cut>drill>paint*20"),
+        "chains of 2..6 x 12": parse_dag(",".join(">".join(random.Random(seed + k).choices(types, k=2 + k % 5))
+                                                  for k in range(12))),
+        "random layered, 60 jobs": random_dag(60, types, seed=seed),
+        "random layered, 300 jobs": random_dag(300, types, width=12, seed=seed),
+    }
+    flags = ["--seed", str(seed), "--jitter-ms", str(jitter_ms)]
+    print(f"{'DAG':26s} {'serialized':>11s} {'fifo':>8s} {'cp':>8s} {'cp bound':>9s}")
+    for label, nodes in shapes.items():
+        dag = JobDag(nodes, est=mean.get)
+        serial = simulate(build_parser().parse_args(flags + ["--mode", "sequential", "--wait-done"]),
+                          dag.topological(), caps)   # as sim.py --dag-order serial
+        spans = [simulate(build_parser().parse_args(flags + ["--dag-order", order]), [], caps, dag=nodes)["makespan_s"]
+                 for order in ("fifo", "cp")]
+        print(f"{label:26s} {serial['makespan_s']:10.1f}s {spans[0]:7.1f}s {spans[1]:7.1f}s "
+              f"{dag.critical_path_s():8.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Job DAG benchmark (sim.py, run_all.sh fleet)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    args = ap.parse_args()
+    bench(args.seed, args.jitter_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+"""
+Adaptive CfP deadlines, sized from the observed CfP -> proposal latency.
+
+- LatencySketch: streaming quantiles on log-spaced buckets (each bucket is `rel_err` wide around its
+  value, as in DDSketch): O(1) add, quantile() walks the few hundred buckets between 0.1 ms and 10 s.
+  Every `window` samples all counts are halved, so the estimate follows a fleet whose latency drifts.
+- DeadlineTracker: one sketch per job type. A round's deadline is the `quantile` of its type plus
+  `margin_s`, clamped to [floor_s, cap_s] (cap = the static --deadline); the cap is used until
+  `min_samples` bids of the type were seen. Bids are timed from the CfP until `cap_s` after it, late bids
+  of rounds already closed included, so a deadline that cut bidders off learns from the bids it missed.
+  With adaptive=False the cap is always used and only the metrics are kept (baseline).
+- Guardrail: a round that closed on an adapted deadline without any bid (every capable machine busy, which
+  the bid latency of the machines that did bid cannot show) is to be opened again at the cap; closed() says
+  so and the supervisor passes static=True to opened().
+- Metrics per round: its deadline, the time it stayed open after its last bid (idle), and for rounds
+  that closed on the deadline the seconds saved against the cap and the bids that came too late.
+
+Timers use `clock` (time.monotonic by default, the virtual clock in sim.py).
+"""
+
+BID_SECONDS = REGISTRY.histogram("cnp_bid_latency_seconds", "CfP to proposal latency", ("agent", "job_type"))
+ROUND_DEADLINE = REGISTRY.histogram("cnp_round_deadline_seconds", "Deadline of a CfP round", ("agent",))
+ROUND_IDLE = REGISTRY.histogram("cnp_round_idle_seconds", "CfP round open after its last bid", ("agent",))
+DEADLINE_SAVED = REGISTRY.counter("cnp_deadline_saved_seconds_total",
+                                  "Static deadline minus adaptive deadline of the rounds closed on it", ("agent",))
+LATE_BIDS = REGISTRY.counter("cnp_late_bids_total", "Bids after their round closed on the deadline", ("agent",))
+
+
+class LatencySketch:
+    def __init__(self, rel_err: float = 0.02, min_s: float = 1e-4, window: int = 1000) -> None:
+        self._log_gamma = math.log((1 + rel_err) / (1 - rel_err))
+        self.min_s = min_s
+        self.window = window
+        self._counts = {}        # bucket k -> weight of the values in (gamma^(k-1), gamma^k]
+        self._low = 0.0          # weight of the values <= min_s
+        self.count = 0.0
+        self._since_decay = 0
+
+    def add(self, x: float) -> None:
+        if x <= self.min_s:
+            self._low += 1
+        else:
+            k = math.ceil(math.log(x) / self._log_gamma)
+            self._counts[k] = self._counts.get(k, 0.0) + 1
+        self.count += 1
+        self._since_decay += 1
+        if self.window and self._since_decay >= self.window:
+            self._since_decay = 0
+            self._low /= 2
+            self._counts = {k: c / 2 for k, c in self._counts.items() if c > 0.01}
+            self.count = self._low + sum(self._counts.values())
+
+    def quantile(self, q: float) -> float | None:
+        """Value of rank q * (count - 1) within `rel_err` (None before the first sample)."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._low
+        if seen > rank:
+            return self.min_s
+        k = None
+        for k in sorted(self._counts):
+            seen += self._counts[k]
+            if seen > rank:
+                break
+        if k is None:
+            return self.min_s
+        # Midpoint of the bucket in relative terms: 2 gamma^k / (gamma + 1)
+        return 2 * math.exp(k * self._log_gamma) / (math.exp(self._log_gamma) + 1)
+
+
+class DeadlineTracker:
+    def __init__(self, cap_s: float, quantile: float = 0.99, margin_s: float = 0.02, floor_s: float = 0.05,
+                 min_samples: int = 20, adaptive: bool = True, clock=time.monotonic,
+                 agent: str = "supervisor_opt") -> None:
+        self.cap_s = cap_s
+        self.quantile = quantile
+        self.margin_s = margin_s
+        self.floor_s = min(floor_s, cap_s)
+        self.min_samples = min_samples
+        self.adaptive = adaptive
+        self.clock = clock
+        self.agent = agent
+        self._lock = threading.Lock()
+        self._sketches = {}      # job_type -> LatencySketch
+        self._rounds = {}        # job_id -> [job_type, opened_at, deadline, close reason or None]
+        self._order = deque()    # (opened_at, job_id), to forget rounds cap_s after their CfP
+
+        self.rounds = 0
+        self.idle_s = 0.0        # sum over the rounds of close time - last bid (or CfP without bid)
+        self.saved_s = 0.0
+        self.late_bids = 0
+        self.retries = 0         # empty adapted rounds sent back to the cap
+
+        self._m_deadline = ROUND_DEADLINE.labels(agent=agent)
+        self._m_idle = ROUND_IDLE.labels(agent=agent)
+        self._m_saved = DEADLINE_SAVED.labels(agent=agent)
+        self._m_late = LATE_BIDS.labels(agent=agent)
+        self._m_bid = {}         # job_type -> BID_SECONDS child
+
+    def deadline(self, job_type: str) -> float:
+        """Deadline for a new round of this job type."""
+        sketch = self._sketches.get(job_type)
+        if not self.adaptive or sketch is None or sketch.count < self.min_samples:
+            return self.cap_s
+        return min(self.cap_s, max(self.floor_s, sketch.quantile(self.quantile) + self.margin_s))
+
+    def opened(self, job_id: str, job_type: str, static: bool = False) -> float:
+        """Registers the CfP of a round; returns its deadline (the cap with `static`)."""
+        with self._lock:
+            now = self.clock()
+            while self._order and self._order[0][0] + self.cap_s < now:
+                self._rounds.pop(self._order.popleft()[1], None)
+            deadline = self.cap_s if static else self.deadline(job_type)
+            self._rounds[job_id] = [job_type, now, deadline, None]
+            self._order.append((now, job_id))
+        self._m_deadline.observe(deadline)
+        return deadline
+
+    def on_bid(self, job_id: str) -> None:
+        """A proposal for the round arrived (open or not)."""
+        with self._lock:
+            rnd = self._rounds.get(job_id)
+            if rnd is None:
+                return
+            jt, opened_at, _deadline, reason = rnd
+            latency = self.clock() - opened_at
+            sketch = self._sketches.get(jt)
+            if sketch is None:
+                sketch = self._sketches[jt] = LatencySketch()
+                self._m_bid[jt] = BID_SECONDS.labels(agent=self.agent, job_type=jt)
+            sketch.add(latency)
+            if reason == "deadline":
+                self.late_bids += 1
+                self._m_late.inc()
+        self._m_bid[jt].observe(latency)
+
+    def closed(self, auction) -> bool:
+        """The round of this Auction closed (any reason); True if it must be opened again at the cap."""
+        idle = auction.closed_at - auction.last_rx
+        saved = 0.0
+        retry = False
+        with self._lock:
+            rnd = self._rounds.get(auction.job_id)
+            if rnd is not None:
+                rnd[3] = auction.close_reason
+                if not len(auction):
+                    retry = rnd[2] < self.cap_s
+                    self.retries += retry
+                elif auction.close_reason == "deadline":
+                    saved = self.cap_s - rnd[2]
+            self.rounds += 1
+            self.idle_s += idle
+            self.saved_s += saved
+        self._m_idle.observe(idle)
+        if saved > 0:
+            self._m_saved.add(saved)
+        return retry
+
+    def stats(self) -> dict:
+        return {
+            "round_idle_s": self.idle_s,
+            "deadline_saved_s": self.saved_s if self.adaptive else None,
+            "deadline_retries": self.retries if self.adaptive else None,
+            "late_bids": self.late_bids,
+        }
+
+
+# ---------- Benchmark ----------
+
+def bench(samples: int, seed: int = 1) -> None:
+    """Sketch quantiles against the exact ones on lognormal latencies, then after a 3x latency shift."""
+    rng = random.Random(seed)
+    sketch = LatencySketch()
+    for phase, scale in (("steady", 0.01), ("shifted", 0.03)):
+        values = [rng.lognormvariate(math.log(scale), 0.5) for _ in range(samples)]
+        t0 = time.perf_counter()
+        for x in values:
+            sketch.add(x)
+        t_add = (time.perf_counter() - t0) / samples
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            sketch.quantile(0.99)
+        t_q = (time.perf_counter() - t0) / 1000
+        recent = sorted(values[-sketch.window:])
+        for q in (0.5, 0.9, 0.99):
+            exact = recent[min(len(recent) - 1, int(q * (len(recent) - 1)))]
+            est = sketch.quantile(q)
+            print(f"{phase:8s} p{q * 100:g}: sketch {est * 1000:7.2f} ms  exact (last {len(recent)}) "
+                  f"{exact * 1000:7.2f} ms  error {(est / exact - 1) * 100:+5.1f} %")
+        print(f"{phase:8s} add {t_add * 1e6:.2f} us, quantile {t_q * 1e6:.1f} us ({len(sketch._counts)} buckets)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Latency sketch accuracy benchmark")
+    ap.add_argument("--bench", type=int, default=20000, help="Samples per phase")
+    args = ap.parse_args()
+    bench(args.bench)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import math
+import random
+import threading
+
+from metrics import REGISTRY
+
+"""
+Run times learned from the Done messages (started_at / finished_at, both on the machine's clock).
+
+- observe() updates, per (machine, job type), an EWMA of the run time and of its variance, and per machine
+  an EWMA of actual / promised run time (the promised one is the duration of the winning bid).
+- eta(p) corrects a Proposal: the machine's backlog times its ratio, plus the learned run time of the job
+  type (or the promised one times the ratio for a type it has not run yet), plus `risk` standard
+  deviations; the bids of machines without a Done yet are kept as they are.
+- A machine that over-promises stops winning the jobs it runs slowly, one that under-promises wins more.
+"""
+
+ERROR_RATIO = REGISTRY.histogram("cnp_duration_error_ratio", "Actual run time / learned estimate at award",
+                                 ("agent",), buckets=(0.5, 0.8, 0.9, 0.95, 1.0, 1.05, 1.1, 1.25, 1.5, 2.0, 4.0))
+
+
+class DurationModel:
+    def __init__(self, alpha: float = 0.3, risk: float = 0.0, agent: str = "supervisor_opt") -> None:
+        self.alpha = alpha
+        self.risk = risk
+        self._lock = threading.Lock()
+        self._runs = {}          # (machine_id, job_type) -> [mean, variance, samples]
+        self._ratio = {}         # machine_id -> EWMA of actual / promised
+        self._m_error = ERROR_RATIO.labels(agent=agent)
+
+    def _ewma(self, state: list | None, x: float) -> list:
+        if state is None:
+            return [x, 0.0, 1]
+        mean, var, n = state
+        diff = x - mean
+        incr = self.alpha * diff
+        return [mean + incr, (1 - self.alpha) * (var + diff * incr), n + 1]
+
+    def observe(self, machine_id: str, job_type: str, promised_s: float, actual_s: float) -> None:
+        with self._lock:
+            est = self.duration(machine_id, job_type, promised_s)
+            if est > 0:
+                self._m_error.observe(actual_s / est)
+            key = (machine_id, job_type)
+            self._runs[key] = self._ewma(self._runs.get(key), actual_s)
+            if promised_s > 0:
+                ratio = self._ratio.get(machine_id)
+                r = actual_s / promised_s
+                self._ratio[machine_id] = r if ratio is None else ratio + self.alpha * (r - ratio)
+
+    def duration(self, machine_id: str, job_type: str, promised_s: float) -> float:
+        """Expected run time of a job the machine promised in `promised_s`."""
+        run = self._runs.get((machine_id, job_type))
+        if run is not None:
+            return run[0] + self.risk * math.sqrt(run[1])
+        return promised_s * self._ratio.get(machine_id, 1.0)
+
+    def eta(self, p: dict) -> float:
+        """ETA of a Proposal corrected by what its machine's Done messages showed."""
+        mid = p["machine_id"]
+        eta = float(p["eta_s"])
+        ratio = self._ratio.get(mid)
+        if ratio is None:
+            return eta
+        backlog = float(p.get("backlog_s", 0.0))
+        return backlog * ratio + self.duration(mid, p["job_type"], eta - backlog)
+
+    def summary(self) -> dict:
+        """{machine_id: ratio} learned so far."""
+        with self._lock:
+            return dict(self._ratio)
+
+
+# ---------- Benchmark ----------
+
+def bench(machines: int, jobs: int, sigma: float, noise: float, seed: int = 1) -> None:
+    """Pick the best of `machines` bids per job, on promised vs learned ETAs; report the real run times."""
+    rng = random.Random(seed)
+    promised = [rng.uniform(1.0, 5.0) for _ in range(machines)]
+    factor = [rng.lognormvariate(0.0, sigma) for _ in range(machines)]
+    model = DurationModel()
+    totals = {"promised": 0.0, "learned": 0.0, "oracle": 0.0}
+    for _ in range(jobs):
+        bids = [{"machine_id": f"M{k}", "job_type": "cut", "eta_s": promised[k], "backlog_s": 0.0}
+                for k in range(machines)]
+        picks = {
+            "promised": min(range(machines), key=lambda k: promised[k]),
+            "learned": min(range(machines), key=lambda k: model.eta(bids[k])),
+            "oracle": min(range(machines), key=lambda k: promised[k] * factor[k]),
+        }
+        for name, k in picks.items():
+            actual = promised[k] * factor[k] * rng.lognormvariate(0.0, noise)
+            totals[name] += actual
+            if name == "learned":
+                model.observe(f"M{k}", "cut", promised[k], actual)
+    for name, total in totals.items():
+        print(f"{name:9s} mean run time {total / jobs:6.3f} s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Learned run time benchmark (one job at a time, idle machines)")
+    ap.add_argument("--machines", type=int, default=12)
+    ap.add_argument("--jobs", type=int, default=2000)
+    ap.add_argument("--skew", type=float, default=0.5, help="Lognormal sigma of the machines' actual / promised")
+    ap.add_argument("--noise", type=float, default=0.2, help="Lognormal sigma of each run around it")
+    args = ap.parse_args()
+    bench(args.machines, args.jobs, args.skew, args.noise)
+
+
+if __name__ == "__main__":
+    main()
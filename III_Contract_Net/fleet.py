@@ -0,0 +1,362 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from common import BASE, Advert, jload, now_s, t_registry
+from machine import MachineAgent, QUEUE_POLICIES, PREEMPT_MODES
+from metrics import start_http_server
+from sim import fleet as make_fleet, load_fleet, slowdowns
+
+"""
+Machine fleet host: many machine.py agents in one process.
+
+- One MQTT connection for the whole fleet: the host subscribes to the topics of all its machines in one
+  SUBSCRIBE (the CfP topic of a job type once) and routes every message itself: a broadcast CfP is
+  decoded once and handed to the machines of its job type, cfp_to / accept to the machine of the topic
+  (with --steal, a steal request to every other machine and a grant to the machine of the topic).
+- One timer thread ends the running jobs of all the machines (Timers) instead of a slot thread per
+  machine sleeping through each job.
+- Each machine keeps its own retained Advert, with host=<--name>. MQTT has one LWT per connection: the
+  host's own Advert (machine_id = host) is the LWT, and a registry takes every machine of an offline
+  host offline (registry.py). --heartbeat-s re-publishes the host's Advert only: the registry keeps the
+  machines of a host as long as the host is heard from.
+- Capabilities come from one file, {machine_id: {job_type: seconds}} (as bench.py --fleet), or
+  "run_all", or a machine count (sim.fleet). --machine-skew gives every machine the slowdown of
+  sim.slowdowns() for --seed (the same machines over-promise as in sim.py and bench.py).
+
+`python fleet.py --bench 12,100,500` measures startup (process start to every Advert seen on the broker)
+and resident memory, against one machine.py process per machine.
+"""
+
+
+class Timers:
+    """Delayed calls, all on one thread in due order."""
+
+    def __init__(self, name: str = "timers") -> None:
+        self._cond = threading.Condition()
+        self._heap = []           # (due, seq, fn, args), due on time.monotonic()
+        self._seq = itertools.count()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay: float, fn, *args) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), fn, args))
+            self._cond.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if self._stopped:
+                    return
+                _due, _seq, fn, args = heapq.heappop(self._heap)
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[FLEET] timer error: {e}")
+
+    def stop(self) -> None:
+        """Drops the pending calls."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(1.0)
+
+
+class FleetHost:
+    """
+    The MachineAgents of one capability table on a single MQTT connection and timer thread.
+
+    `fleet` is {machine_id: {job_type: seconds}}; `slowdowns` {machine_id: factor} the machines' real
+    / promised run times (default 1); the other settings apply to every machine (see MachineAgent).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fleet: dict,
+        broker_host: str = "localhost",
+        broker_port: int = 1883,
+        queue_cap: int = 0,
+        queue_policy: str = "fifo",
+        slots: int = 1,
+        reserve_ttl: float = 0.0,
+        mqtt5: bool = False,
+        slowdowns: dict | None = None,
+        duration_noise: float = 0.0,
+        heartbeat_s: float = 0.0,
+        keepalive: int = 60,
+        preempt: str = "off",
+        steal: bool = False,
+        steal_margin: float = 0.5,
+        steal_threshold: int = 1,
+    ) -> None:
+        self.name = name
+        self.heartbeat_s = max(0.0, heartbeat_s)
+        self.keepalive = keepalive
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        if mqtt5:
+            self.client = mqtt.Client(client_id=f"fleet-{name}", protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(client_id=f"fleet-{name}", clean_session=True)
+        self.timers = Timers(f"{name}-timers")
+        self.agents = {
+            mid: MachineAgent(mid, caps, broker_host, broker_port, queue_cap, queue_policy, slots, reserve_ttl, mqtt5,
+                              client=self.client, timers=self.timers, host=name,
+                              slowdown=(slowdowns or {}).get(mid, 1.0), duration_noise=duration_noise,
+                              preempt=preempt, steal=steal, steal_margin=steal_margin,
+                              steal_threshold=steal_threshold)
+            for mid, caps in fleet.items()
+        }
+        self._by_type = {}        # job_type -> [agent]
+        for agent in self.agents.values():
+            for jt in agent.caps:
+                self._by_type.setdefault(jt, []).append(agent)
+        self._stop_event = threading.Event()
+        self._online = None       # payload of the host's online Advert since the last connect
+
+    def _advert(self, online: bool) -> Advert:
+        return Advert(machine_id=self.name, caps={}, slots=0, queue_cap=0, busy=0, queued=0, room=0, backlog_s=0.0,
+                      online=online, at=now_s(), host=self.name, heartbeat_s=self.heartbeat_s)
+
+    def topics(self) -> list[str]:
+        return sorted({topic for agent in self.agents.values() for topic in agent.topics()})
+
+    # ---------- MQTT callbacks ----------
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            print(f"[FLEET] Connect failed rc={rc}")
+            return
+        topics = self.topics()
+        client.subscribe([(topic, 0) for topic in topics])
+        # Host first: a registry that saw its LWT ignores the machines until then
+        self._online = self._advert(online=True).to_msg()
+        client.publish(t_registry(self.name), self._online, qos=0, retain=True)
+        for agent in self.agents.values():
+            agent._advertise()
+            agent._offered = None
+            agent._share_work()
+        print(f"[FLEET] {self.name} connected: {len(self.agents)} machines on {len(topics)} topics")
+
+    def _on_message(self, client, userdata, msg):
+        kind, _, arg = msg.topic[len(BASE) + 1:].partition("/")
+        if kind == "cfp":
+            try:
+                cfp = jload(msg.payload)
+            except ValueError as e:
+                print(f"[FLEET] bad CfP on {msg.topic}: {e}")
+                return
+            for agent in self._by_type.get(arg, ()):
+                agent._on_cfp(client, userdata, msg, cfp)
+        elif kind == "cfp_to":
+            agent = self.agents.get(arg)
+            if agent is not None:
+                agent._on_cfp(client, userdata, msg)
+        elif kind == "accept":
+            agent = self.agents.get(arg)
+            if agent is not None:
+                agent._on_accept(client, userdata, msg)
+        elif kind == "cfp_batch":
+            for agent in self.agents.values():
+                agent._on_cfp_batch(client, userdata, msg)
+        elif kind == "steal":
+            what, _, mid = arg.partition("/")
+            if what == "request":
+                for agent in self.agents.values():
+                    agent._on_steal_request(client, userdata, msg)
+            elif what == "grant" and mid in self.agents:
+                self.agents[mid]._on_steal_grant(client, userdata, msg)
+
+    # ---------- Public API ----------
+
+    def connect(self) -> None:
+        """Connects to the broker and starts MQTT loop in background."""
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.will_set(t_registry(self.name), self._advert(online=False).to_msg(), qos=1, retain=True)
+        self.client.connect(self.broker_host, self.broker_port, self.keepalive)
+        self.client.loop_start()
+
+    def run(self) -> None:
+        """Runs jobs until stop() is called."""
+        self.connect()
+        beat = time.monotonic()
+        try:
+            while not self._stop_event.wait(min(1.0, self.heartbeat_s / 4) if self.heartbeat_s else 1.0):
+                if self.heartbeat_s and self._online and time.monotonic() - beat >= self.heartbeat_s:
+                    # The same Advert again: a newer `at` would read as a restart and drop the machines
+                    beat = time.monotonic()
+                    self.client.publish(t_registry(self.name), self._online, qos=0, retain=True)
+        finally:
+            for agent in self.agents.values():
+                agent.stop()
+            self.timers.stop()
+            for mid, agent in self.agents.items():
+                self.client.publish(t_registry(mid), agent._advert(online=False).to_msg(), qos=0, retain=True)
+            info = self.client.publish(t_registry(self.name), self._advert(online=False).to_msg(), qos=1, retain=True)
+            info.wait_for_publish(1.0)
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+# ---------- Startup / memory benchmark ----------
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def _launch(cmds: list[list[str]], machine_ids: set, broker: str, port: int, timeout_s: float = 60.0):
+    """Starts the processes; returns (seconds until an online Advert of every machine arrived, summed RSS in MB)."""
+    seen = set()
+    all_seen = threading.Event()
+    connected = threading.Event()
+
+    def on_message(_c, _u, msg):
+        if msg.retain or not msg.payload:
+            return  # Adverts of earlier runs
+        a = jload(msg.payload)
+        if a.get("online"):
+            seen.add(a["machine_id"])
+            if machine_ids <= seen:
+                all_seen.set()
+
+    probe = mqtt.Client(client_id=f"fleet-bench-{os.getpid()}")
+    probe.on_connect = lambda c, u, f, rc: connected.set()
+    probe.on_message = on_message
+    probe.connect(broker, port, 60)
+    probe.loop_start()
+    procs = []
+    try:
+        if not connected.wait(10.0):
+            raise SystemExit(f"[FLEET] no broker at {broker}:{port}")
+        probe.subscribe(t_registry())
+        time.sleep(0.3)   # retained Adverts of earlier runs
+        t0 = time.perf_counter()
+        procs = [subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for cmd in cmds]
+        if not all_seen.wait(timeout_s):
+            raise SystemExit(f"[FLEET] {len(machine_ids - seen)} machine(s) never advertised")
+        startup = time.perf_counter() - t0
+        rss = sum(_rss_mb(p.pid) for p in procs)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        time.sleep(0.3)   # LWTs
+        for mid in machine_ids:
+            probe.publish(t_registry(mid), b"", qos=0, retain=True)   # clear the retained Adverts
+        probe.loop_stop()
+        probe.disconnect()
+    return startup, rss
+
+
+def bench(sizes: list[int], broker: str, port: int, max_procs: int = 50) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'machines':>8s} {'host startup':>13s} {'host RSS':>9s} {'processes startup':>18s} {'processes RSS':>14s}")
+    for n in sizes:
+        caps = make_fleet(n)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(caps, f)
+        try:
+            name = f"bench{n}"
+            host_s, host_mb = _launch([[sys.executable, os.path.join(here, "fleet.py"), "--fleet", f.name,
+                                        "--name", name, "--broker", broker, "--port", str(port)]],
+                                      set(caps) | {name}, broker, port)
+        finally:
+            os.unlink(f.name)
+        procs = "-".rjust(18) + " " + "-".rjust(14)
+        if n <= max_procs:
+            cmds = [[sys.executable, os.path.join(here, "machine.py"), "--machine-id", mid,
+                     "--caps", ",".join(f"{jt}:{s}" for jt, s in c.items()), "--broker", broker, "--port", str(port)]
+                    for mid, c in caps.items()]
+            proc_s, proc_mb = _launch(cmds, set(caps), broker, port)
+            procs = f"{proc_s:17.2f}s {proc_mb:12.0f}MB"
+        print(f"{n:8d} {host_s:12.2f}s {host_mb:7.0f}MB {procs}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Contract Net machine fleet host (many machines, one MQTT connection)")
+    ap.add_argument("--fleet", default="run_all",
+                    help='Capability file (JSON {machine_id: {job_type: seconds}}), "run_all" or a machine count')
+    ap.add_argument("--name", default="fleet", help="Host name (client id fleet-<name>, host of the Adverts)")
+    ap.add_argument("--slots", type=int, default=1, help="Jobs each machine runs in parallel")
+    ap.add_argument("--queue-cap", type=int, default=0,
+                    help="Accepted jobs that may wait for a free slot (0 = bid only while a slot is free)")
+    ap.add_argument("--queue-policy", choices=QUEUE_POLICIES, default="fifo",
+                    help="Order of the waiting jobs: fifo or spt (shortest job first)")
+    ap.add_argument("--reserve-ttl", type=float, default=0.0,
+                    help="A bid keeps room for its job until the CfP deadline + this grace in seconds")
+    ap.add_argument("--mqtt5", action="store_true",
+                    help="Connect with MQTT v5 (reply topic and correlation id as PUBLISH properties)")
+    ap.add_argument("--machine-skew", type=float, default=0.0,
+                    help="Lognormal sigma of each machine's real / promised run time (sim.slowdowns, per --seed)")
+    ap.add_argument("--seed", type=int, default=1, help="Seed of --machine-skew")
+    ap.add_argument("--duration-noise", type=float, default=0.0,
+                    help="Lognormal sigma of each job's real run time around it (0 = exact)")
+    ap.add_argument("--preempt", choices=PREEMPT_MODES, default="off",
+                    help="A higher-priority job takes the slot of a running one (restart / checkpoint it)")
+    ap.add_argument("--steal", action="store_true",
+                    help="Idle machines take queued jobs of their peers that they finish sooner (work stealing)")
+    ap.add_argument("--steal-margin", type=float, default=0.5,
+                    help="Seconds an idle machine must finish a queued job sooner to be granted it (with --steal)")
+    ap.add_argument("--steal-threshold", type=int, default=1,
+                    help="Queued jobs above which a machine announces its backlog; idle machines only offer their "
+                         "slots while a peer has one (with --steal)")
+    ap.add_argument("--heartbeat-s", type=float, default=0.0,
+                    help="Re-publish the host's Advert at least every N seconds (0 = only on connect)")
+    ap.add_argument("--keepalive", type=int, default=60,
+                    help="MQTT keepalive in seconds: the broker publishes the host's LWT after 1.5x of silence")
+    ap.add_argument("--broker", default="localhost", help="MQTT broker host")
+    ap.add_argument("--port", type=int, default=1883, help="MQTT broker port")
+    ap.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port (0 = off)")
+    ap.add_argument("--bench", default="",
+                    help="Comma-separated fleet sizes: startup and memory against one machine.py per machine")
+    args = ap.parse_args()
+
+    if args.bench:
+        bench([int(x) for x in args.bench.split(",")], args.broker, args.port)
+        return
+
+    fleet = load_fleet(args.fleet)
+    if not fleet:
+        raise SystemExit("The capability file defines no machine")
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    host = FleetHost(args.name, fleet, args.broker, args.port, args.queue_cap, args.queue_policy, args.slots,
+                     args.reserve_ttl, args.mqtt5, slowdowns(fleet, args.machine_skew, args.seed), args.duration_noise,
+                     args.heartbeat_s, args.keepalive, args.preempt, args.steal, args.steal_margin,
+                     args.steal_threshold)
+    signal.signal(signal.SIGTERM, lambda *_: host.stop())   # offline Adverts on kill, too
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        host.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import heapq
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from common import JobRequest, IntakeStatus, jload, new_job_id, now_s, t_jobs, t_intake, t_replies
+from deadlines import LatencySketch
+from metrics import REGISTRY
+
+"""
+Streaming job intake: jobs arrive while the supervisor runs instead of coming from the --jobs list.
+
+- JobQueue: the jobs admitted and not dispatched yet, served by priority (higher first), then due time
+  (earliest first, jobs without one last), then arrival. offer() and pop() are O(log n).
+- Admission control, checked by offer():
+  - backpressure: the queue stops accepting at `limit` jobs and accepts again once it is down to
+    `resume_at` (hysteresis, so the producers are not flipped on every job); `on_state(accepting)`
+    reports each change. supervisor_opt.py publishes state() retained on lab/cnp/intake/<name> on each
+    change and every second; producers send at most its room (limit - depth) until the next one;
+  - due times: with `check_due`, a job is refused if the jobs ahead of it (same or higher priority),
+    drained at the completion rate of the last `rate_window` jobs, plus the p90 dispatch -> done time,
+    `headroom` (10 %) added, would finish it after its due time: better refused at once than done late;
+  - `capable(job_type)`, if given, refuses the job types no machine can run.
+- Outcomes: finished() is told how each dispatched job ended (done, or given up by the pipeline);
+  a job done after its due time counts as late (a deadline miss). With `drop_expired`, pop() drops the
+  jobs whose due time passed while they waited instead of running them late. Sojourn times (submission
+  to Done) are also kept per priority class: the tail latency of the urgent jobs under mixed load.
+- `notify(req, status, reason, machine_id)` is called on every JobStatus change of a job.
+
+Feeders: tail_jobs() reads job lines from a file (following it like tail -f, and holding while the queue
+does not accept); main() is a load generator publishing Poisson arrivals on lab/cnp/jobs/<supervisor>,
+an arrival waiting while the last intake state leaves no room.
+Times use `clock` (the wall clock, as JobRequest.submitted_at; the virtual clock in sim.py).
+"""
+
+INTAKE_DEPTH = REGISTRY.gauge("cnp_intake_depth", "Jobs waiting in the intake queue", ("agent",))
+INTAKE_JOBS = REGISTRY.counter("cnp_intake_jobs_total",
+                               "Intake jobs by status (queued, refused, done, late, dropped)", ("agent", "status"))
+INTAKE_REFUSED = REGISTRY.counter("cnp_intake_refused_total", "Jobs refused at admission", ("agent", "reason"))
+INTAKE_WAIT = REGISTRY.histogram("cnp_intake_wait_seconds", "Admission to dispatch (CfP) of an intake job",
+                                 ("agent",), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+INTAKE_SOJOURN = REGISTRY.histogram("cnp_intake_sojourn_seconds", "Submission to Done of an intake job",
+                                    ("agent",), buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600))
+
+
+def parse_request(item: str) -> JobRequest | None:
+    """A JobRequest from a JSON object or "job_type[@due_s][!priority]" (e.g. "paint@30!2"); None if empty."""
+    item = item.strip()
+    if not item or item.startswith("#"):
+        return None
+    if item.startswith("{"):
+        return JobRequest(**json.loads(item))
+    item, _, prio = item.partition("!")
+    jt, _, due = item.partition("@")
+    return JobRequest(jt.strip(), priority=int(prio) if prio else 0, due_s=float(due) if due else 0.0)
+
+
+class JobQueue:
+    def __init__(self, limit: int = 1000, resume_at: int | None = None, check_due: bool = True,
+                 headroom: float = 0.1, drop_expired: bool = False, capable=None, rate_window: int = 50, clock=now_s,
+                 notify=None, on_state=None, agent: str = "supervisor_opt") -> None:
+        self.limit = max(1, limit)
+        self.resume_at = self.limit // 2 if resume_at is None else min(resume_at, self.limit - 1)
+        self.check_due = check_due
+        self.headroom = headroom
+        self.drop_expired = drop_expired
+        self.capable = capable
+        self.clock = clock
+        self.notify = notify
+        self.on_state = on_state
+        self.agent = agent
+
+        self._heap = []          # (-priority, due_at or inf, seq, request)
+        self._seq = 0
+        self._ahead = {}         # priority -> jobs queued with it
+        self._finishes = deque(maxlen=max(2, rate_window))   # completion times
+        self._service = LatencySketch(window=rate_window * 10)   # dispatch -> done
+        self.accepting = True
+        self.closed = False
+
+        self.admitted = 0
+        self.refused = 0
+        self.done = 0
+        self.late = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.waits = LatencySketch(window=0)
+        self.sojourns = LatencySketch(window=0)
+        self.class_sojourns = {}     # priority -> LatencySketch
+
+        self._m_depth = INTAKE_DEPTH.labels(agent=agent)
+        self._m_wait = INTAKE_WAIT.labels(agent=agent)
+        self._m_sojourn = INTAKE_SOJOURN.labels(agent=agent)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    # ---------- Producer side ----------
+
+    def offer(self, req: dict) -> bool:
+        """Admits a JobRequest (as a dict) or refuses it; returns True if queued."""
+        now = self.clock()
+        req.setdefault("request_id", "")
+        req["request_id"] = req["request_id"] or new_job_id()
+        submitted = float(req.get("submitted_at") or 0.0) or now
+        due_s = float(req.get("due_s") or 0.0)
+        req["submitted_at"] = submitted
+        req["due_at"] = submitted + due_s if due_s > 0 else None
+        prio = int(req.get("priority", 0))
+
+        reason = ""
+        if self.closed:
+            reason = "closing"
+        elif not self.accepting:
+            reason = "saturated"
+        elif self.capable is not None and not self.capable(req["job_type"]):
+            reason = "incapable"
+        elif self.check_due and req["due_at"] is not None and self.predicted_done(prio, now) > req["due_at"]:
+            reason = "would_miss"
+        if reason:
+            self.refused += 1
+            INTAKE_REFUSED.labels(agent=self.agent, reason=reason).inc()
+            self._status(req, "refused", reason)
+            return False
+
+        req["queued_at"] = now
+        heapq.heappush(self._heap, (-prio, req["due_at"] if req["due_at"] is not None else math.inf, self._seq, req))
+        self._seq += 1
+        self._ahead[prio] = self._ahead.get(prio, 0) + 1
+        self.admitted += 1
+        self.max_depth = max(self.max_depth, len(self._heap))
+        self._status(req, "queued")
+        if len(self._heap) >= self.limit:
+            self._set_accepting(False)
+        self._m_depth.set(len(self._heap))
+        return True
+
+    def predicted_done(self, priority: int, now: float) -> float:
+        """When a job of this priority admitted now should be done (now if nothing was learned yet):
+        the jobs ahead at the recent completion rate plus the p90 dispatch -> done time, with `headroom`."""
+        if len(self._finishes) < 10:
+            return now
+        span = self._finishes[-1] - self._finishes[0]
+        if span <= 0:
+            return now
+        rate = (len(self._finishes) - 1) / span
+        ahead = sum(n for p, n in self._ahead.items() if p >= priority)
+        return now + (ahead / rate + self._service.quantile(0.9)) * (1 + self.headroom)
+
+    def top_priority(self) -> int:
+        """Priority of the next job pop() would return (0 if the queue is empty)."""
+        return -self._heap[0][0] if self._heap else 0
+
+    def close(self) -> None:
+        """Stops admission; the queued jobs are still served (drained())."""
+        self.closed = True
+        self._set_accepting(False)
+
+    # ---------- Consumer side (the pipeline) ----------
+
+    def pop(self) -> dict | None:
+        """Next job to dispatch (None if the queue is empty)."""
+        while self._heap:
+            _p, due_at, _seq, req = heapq.heappop(self._heap)
+            prio = int(req.get("priority", 0))
+            self._ahead[prio] -= 1
+            now = self.clock()
+            if len(self._heap) <= self.resume_at and not self.closed:
+                self._set_accepting(True)
+            self._m_depth.set(len(self._heap))
+            if self.drop_expired and due_at < now:
+                self.dropped += 1
+                self._status(req, "dropped", "expired")
+                continue
+            wait = now - req["queued_at"]
+            req["dispatched_at"] = now
+            self.waits.add(wait)
+            self._m_wait.observe(wait)
+            return req
+        return None
+
+    def finished(self, req: dict, outcome: str, machine_id: str = "") -> None:
+        """A dispatched job ended: "done", or the pipeline gave up on it ("skipped", "lost")."""
+        now = self.clock()
+        if outcome != "done":
+            self.dropped += 1
+            self._status(req, "dropped", outcome)
+            return
+        self._service.add(now - req["dispatched_at"])
+        self._finishes.append(now)
+        sojourn = now - req["submitted_at"]
+        self.sojourns.add(sojourn)
+        self.class_sojourns.setdefault(int(req.get("priority", 0)), LatencySketch(window=0)).add(sojourn)
+        self._m_sojourn.observe(sojourn)
+        if req["due_at"] is not None and now > req["due_at"]:
+            self.late += 1
+            self._status(req, "late", f"{now - req['due_at']:.3f}s", machine_id)
+        else:
+            self.done += 1
+            self._status(req, "done", "", machine_id)
+
+    def drained(self) -> bool:
+        """Closed and nothing left to dispatch."""
+        return self.closed and not self._heap
+
+    def state(self, supervisor: str) -> IntakeStatus:
+        return IntakeStatus(supervisor, self.accepting, len(self._heap), self.limit, self.clock())
+
+    def _set_accepting(self, accepting: bool) -> None:
+        if accepting != self.accepting:
+            self.accepting = accepting
+            if self.on_state is not None:
+                self.on_state(accepting)
+
+    def _status(self, req: dict, status: str, reason: str = "", machine_id: str = "") -> None:
+        INTAKE_JOBS.labels(agent=self.agent, status=status).inc()
+        if self.notify is not None:
+            self.notify(req, status, reason, machine_id)
+
+    def stats(self) -> dict:
+        return {
+            "intake_admitted": self.admitted,
+            "intake_refused": self.refused,
+            "intake_late": self.late,
+            "intake_dropped": self.dropped,
+            "intake_max_depth": self.max_depth,
+            "wait_p50_s": self.waits.quantile(0.5),
+            "wait_p99_s": self.waits.quantile(0.99),
+            "sojourn_p50_s": self.sojourns.quantile(0.5),
+            "sojourn_p99_s": self.sojourns.quantile(0.99),
+            **({f"sojourn_p99_prio{p}_s": s.quantile(0.99) for p, s in sorted(self.class_sojourns.items())}
+               if len(self.class_sojourns) > 1 else {}),
+        }
+
+
+# ---------- Feeders ----------
+
+def tail_jobs(path: str, submit, stop: threading.Event, follow: bool = True, hold=None, poll_s: float = 0.2) -> None:
+    """Feeds the job lines of `path` (parse_request(); a JSON object, or items separated by commas) to submit().
+    With `follow`, waits for more lines at the end of the file until `stop` is set; else returns at its end.
+    While hold() is true (the queue does not accept), the next line is not read."""
+    with open(path) as f:
+        while not stop.is_set():
+            if hold is not None and hold():
+                stop.wait(poll_s)
+                continue
+            pos = f.tell()
+            line = f.readline()
+            if not line.endswith("\n") and follow:
+                f.seek(pos)      # nothing new, or a line still being written
+                stop.wait(poll_s)
+                continue
+            if not line:
+                return
+            for item in [line] if line.lstrip().startswith("{") else line.split(","):
+                try:
+                    req = parse_request(item)
+                except (ValueError, TypeError) as e:
+                    print(f"[INTAKE] Bad job {item.strip()!r} skipped: {e}")
+                    continue
+                if req is not None:
+                    req.submitted_at = req.submitted_at or now_s()
+                    submit(req)
+
+
+def main():
+    import paho.mqtt.client as mqtt
+
+    ap = argparse.ArgumentParser(description="Job load generator: Poisson arrivals on a supervisor's intake")
+    ap.add_argument("--supervisor", default="supervisor_opt", help="Supervisor name (lab/cnp/jobs/<name>)")
+    ap.add_argument("--rate", type=float, default=2.0, help="Mean arrivals per second")
+    ap.add_argument("--duration", type=float, default=60.0, help="Seconds of arrivals")
+    ap.add_argument("--types", default="cut,drill,paint", help="Comma-separated job types, drawn uniformly")
+    ap.add_argument("--due-s", type=float, default=0.0, help="Due time of each job after its submission (0 = none)")
+    ap.add_argument("--priority-frac", type=float, default=0.0, help="Share of the jobs sent with priority 1")
+    ap.add_argument("--ignore-backpressure", action="store_true",
+                    help="Keep sending while the intake does not accept (the jobs are refused)")
+    ap.add_argument("--settle-s", type=float, default=120.0, help="Wait up to N s for the last job statuses")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--name", default="loadgen", help="Client id and lab/cnp/replies/<name>/status reply topic")
+    ap.add_argument("--broker", default="localhost")
+    ap.add_argument("--port", type=int, default=1883)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    types = [jt.strip() for jt in args.types.split(",") if jt.strip()]
+    status_topic = t_replies(args.name, "status")
+    lock = threading.Lock()
+    open_jobs = {}               # request_id -> (submitted_at, priority), until done / late / refused / dropped
+    outcomes = {}                # status -> count
+    sojourns = {}                # priority -> [seconds]
+    room = threading.Event()     # the last intake state leaves room for credit[0] more jobs
+    room.set()
+    credit = [None]
+
+    def on_status(_c, _u, msg):
+        s = jload(msg.payload)
+        with lock:
+            if s["status"] == "queued" or s["request_id"] not in open_jobs:
+                return
+            submitted, prio = open_jobs.pop(s["request_id"])
+            outcomes[s["status"]] = outcomes.get(s["status"], 0) + 1
+            if s["status"] in ("done", "late"):
+                sojourns.setdefault(prio, []).append(s["at"] - submitted)
+
+    def on_intake(_c, _u, msg):
+        st = jload(msg.payload)
+        with lock:
+            credit[0] = st["limit"] - st["depth"] if st["accepting"] else 0
+            (room.set if credit[0] > 0 else room.clear)()
+
+    client = mqtt.Client(client_id=args.name, clean_session=True)
+    client.message_callback_add(status_topic, on_status)
+    client.message_callback_add(t_intake(args.supervisor), on_intake)
+    client.connect(args.broker, args.port, keepalive=30)
+    client.subscribe(status_topic, qos=0)
+    client.subscribe(t_intake(args.supervisor), qos=0)
+    client.loop_start()
+    time.sleep(0.5)              # retained intake state first
+
+    sent = held = 0
+    t_end = time.monotonic() + args.duration
+    next_at = time.monotonic()
+    while True:
+        next_at += rng.expovariate(args.rate)
+        if next_at >= t_end:
+            break
+        time.sleep(max(0.0, next_at - time.monotonic()))
+        submitted = now_s()
+        if not args.ignore_backpressure and not room.is_set():
+            held += 1
+            room.wait(max(0.0, t_end - time.monotonic()))   # the arrival waits at the producer
+            if not room.is_set():
+                break
+        req = JobRequest(rng.choice(types), new_job_id(), 1 if rng.random() < args.priority_frac else 0,
+                         args.due_s, submitted, status_topic)
+        with lock:
+            open_jobs[req.request_id] = (req.submitted_at, req.priority)
+            if credit[0] is not None and not args.ignore_backpressure:
+                credit[0] -= 1
+                if credit[0] <= 0:
+                    room.clear()
+        client.publish(t_jobs(args.supervisor), req.to_msg(), qos=1)
+        sent += 1
+
+    t_settle = time.monotonic() + args.settle_s
+    while time.monotonic() < t_settle:
+        with lock:
+            if not open_jobs:
+                break
+        time.sleep(0.2)
+    client.loop_stop()
+    client.disconnect()
+
+    def pct(values, q):
+        return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+    every = sorted(x for values in sojourns.values() for x in values)
+    classes = "".join(f" sojourn_p99_prio{p}_s={pct(sorted(v), 0.99):.3f}" for p, v in sorted(sojourns.items())
+                      if len(sojourns) > 1)
+    counts = " ".join(f"{k}={outcomes.get(k, 0)}" for k in ("done", "late", "refused", "dropped"))
+    print(f"[LOAD] SUMMARY: sent={sent} held={held} {counts} unanswered={len(open_jobs)} "
+          f"sojourn_p50_s={pct(every, 0.5):.3f} sojourn_p99_s={pct(every, 0.99):.3f}{classes}")
+
+
+if __name__ == "__main__":
+    main()
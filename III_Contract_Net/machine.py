@@ -1,21 +1,73 @@
 import argparse
 import json
+import random
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import paho.mqtt.client as mqtt
 from common import (
-    Proposal, Done, now_s, jload,
-    t_cfp, t_proposals, t_accept, t_done
+    Proposal, BatchProposal, Reject, Done, Advert, StealRequest, StealGrant, Reassigned, now_s, jload, reply_route,
+    publish_reply, t_cfp, t_cfp_to, t_proposals, t_accept, t_reject, t_done, t_cfp_batch, t_batch_proposals,
+    t_registry, t_steal_request, t_steal_grant, t_reassigned
 )
+from metrics import REGISTRY, start_http_server
 
 """
 Machine agent:
-- Listens for CfP by job_type.
-- If free and capable, sends a Proposal with its ETA.
-- When it receives an Accept addressed to this machine, it runs the job (becomes busy) and then publishes DONE.
+- Listens for CfP by job_type, and for CfPs addressed to it alone (sampled auctions).
+- If capable and its queue has room, sends a Proposal with its ETA = remaining backlog + job duration.
+- With --reserve-ttl, every Proposal also reserves room for its job until the CfP deadline plus that
+  grace, so the machine never bids beyond what it can accept; the reservation ends on Accept or when
+  it expires (a lost round frees the room as soon as its winner is due to be picked).
+- Batch CfP (a block of jobs): if free, answers once with its ETA per job type of the block.
+- Accepts addressed to this machine run on one of its --slots parallel slots (bounded executor) or
+  wait in the queue (FIFO, or shortest job first); each job publishes DONE with its slot index.
+- Priority classes: CfP and Accept carry the job's priority; the queue serves the highest class first,
+  and a bid's ETA only counts the queued jobs of the same or a higher class. With --preempt, an Accept
+  of a higher class than a running job takes its slot: the preempted job goes back to the head of its
+  class and runs again from the start ("restart") or from where it stopped ("checkpoint"); such a job
+  is also bid on and accepted without room. DONE reports the preemptions and the time they cost.
+- Work stealing (--steal): a machine with more than --steal-threshold queued jobs announces its backlog on
+  lab/cnp/steal/request (backlog=0 once its queue is empty); while a peer has one, a machine with a free slot
+  and nothing queued offers it there (free=0 withdraws the offer once it is busy again), so a fleet where no
+  queue builds up sends no steal messages. A peer with queued jobs that it has not started yet
+  grants one to the idle machine on lab/cnp/steal/grant/<id> when the idle machine would finish it more than
+  --steal-margin seconds sooner (its advertised run time against the job's place in the peer's queue). The
+  new machine tells the job's supervisor (Reassigned, on the reply topic of the Accept) and runs it; a grant
+  that finds it busy again (several peers granted it a job at once, or an Accept came first) is handed back
+  and takes its old place in the granting machine's queue.
+- Publishes a retained Advert (caps, busy slots, queue length, room, backlog) on lab/cnp/registry/<id>
+  when it connects and whenever its state changes; the broker publishes the offline Advert (LWT) if
+  the machine disappears, so supervisors can dispatch without a CfP round (registry.py).
+- Failure detection: a killed process closes its connection and the broker publishes the LWT at once; a
+  hung machine or a cut link only after 1.5 x --keepalive. With --heartbeat-s the Advert is re-published
+  at least that often (it carries the period), so a registry can give up on a silent machine sooner.
+- An Accept that cannot be honored (no room left, unknown job type) is answered with a Reject,
+  so the supervisor can award the job elsewhere instead of waiting for a DONE that never comes.
+- Answers go to the reply topic of their request when it names one (payload fields, or the MQTT v5
+  Response Topic / Correlation Data with --mqtt5), else to the shared topics.
+- With --slots 1 --queue-cap 0 (default) the machine behaves as before: it only bids and accepts while idle.
+- --slowdown / --duration-noise make the real run time differ from the promised one (the bids still use
+  --caps), e.g. to test supervisors that learn run times from the Done messages.
+- fleet.py runs many MachineAgents in one process, on one shared MQTT connection and timer thread.
 """
 
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
+QUEUE_DEPTH = REGISTRY.gauge("mas_queue_depth", "Events waiting in the agent's queue", ("agent",))
+BIDS = REGISTRY.counter("cnp_bids_total", "Proposals sent", ("agent", "job_type"))
+JOBS = REGISTRY.counter("cnp_jobs_total", "Jobs by outcome", ("agent", "job_type", "outcome"))
+JOB_SECONDS = REGISTRY.histogram("cnp_job_seconds", "Job latency (machine: run time, supervisor: CfP to Done)",
+                                 ("agent", "job_type"))
+BUSY = REGISTRY.gauge("cnp_busy", "Slots running a job", ("agent",))
+
+QUEUE_POLICIES = ("fifo", "spt")
+PREEMPT_MODES = ("off", "restart", "checkpoint")
+LENT_TTL_S = 5.0   # a granted job handed back later than this is queued as a new one
+
+
 def parse_caps(caps_arg: str) -> dict:
     """
     Accepted formats:
@@ -35,105 +87,654 @@ def parse_caps(caps_arg: str) -> dict:
         pass
     return {}
 
-def main():
-    ap = argparse.ArgumentParser(description="Contract Net Machine (MQTT)")
-    ap.add_argument("--machine-id", required=True, help="Unique machine identifier")
-    ap.add_argument("--caps", default="", help='Capabilities like "cut:3,drill:5,paint:2.5" (seconds)')
-    ap.add_argument("--caps-json", default="", help="Capabilities in JSON")
-    ap.add_argument("--broker", default="localhost", help="MQTT broker host")
-    ap.add_argument("--port", type=int, default=1883, help="MQTT broker port")
-    args = ap.parse_args()
 
-    caps = parse_caps(args.caps)
-    if (not caps) and args.caps_json:
-        caps = json.loads(args.caps_json)
+def _promised_left(job: dict) -> float:
+    """Promised seconds a queued or running job still needs (its duration until it ran at all)."""
+    if "run_s" not in job or job["run_s"] <= 0:
+        return job["duration"]
+    return job["duration"] * job["left_s"] / job["run_s"]
 
-    if not caps:
-        raise SystemExit("Define capabilities with --caps or --caps-json")
 
-    busy_lock = threading.Lock()
-    busy = {"flag": False, "job_id": None, "job_type": None}
+class MachineAgent:
+    """
+    Subscribes to:
+        lab/cnp/cfp/<job_type>  (for each capability), lab/cnp/cfp_to/<machine_id>, lab/cnp/cfp_batch,
+        lab/cnp/accept/<machine_id>
+    publishes Proposals on lab/cnp/proposals, Rejects on lab/cnp/reject, DONE on lab/cnp/done (or on
+    the reply topic of the CfP / Accept) and its retained Advert on lab/cnp/registry/<machine_id>.
+
+    `slots` jobs run in parallel; `queue_cap` is the number of accepted jobs that may wait
+    for a slot; `queue_policy` is "fifo" or "spt" (shortest job first); `reserve_ttl` > 0
+    makes every bid hold a place for its job until the CfP deadline + reserve_ttl seconds;
+    `mqtt5` connects with MQTT v5 (reply routing by Response Topic / Correlation Data).
+    `preempt` ("off", "restart", "checkpoint") lets an accepted job take the slot of a running job of a
+    lower priority class. `steal` announces a queue longer than `steal_threshold` jobs, offers the free
+    slots while a peer has one, and hands queued jobs to the idle peers that finish them `steal_margin`
+    seconds sooner.
+    A job really runs `slowdown` times its promised duration, times a lognormal factor of sigma
+    `duration_noise`; ETAs and Adverts keep the promised durations.
+
+    A fleet host (fleet.py) passes its own connected `client` (it subscribes to topics() and routes the
+    messages to the handlers), `timers` (call_later(delay, fn, *args)) that end the jobs instead of a
+    sleeping slot thread, and its `host` name for the Adverts.
+    """
+
+    def __init__(
+        self,
+        machine_id: str,
+        caps: dict,
+        broker_host: str = "localhost",
+        broker_port: int = 1883,
+        queue_cap: int = 0,
+        queue_policy: str = "fifo",
+        slots: int = 1,
+        reserve_ttl: float = 0.0,
+        mqtt5: bool = False,
+        client: mqtt.Client | None = None,
+        timers=None,
+        host: str = "",
+        slowdown: float = 1.0,
+        duration_noise: float = 0.0,
+        heartbeat_s: float = 0.0,
+        keepalive: int = 60,
+        preempt: str = "off",
+        steal: bool = False,
+        steal_margin: float = 0.5,
+        steal_threshold: int = 1,
+    ) -> None:
+        if queue_policy not in QUEUE_POLICIES:
+            raise ValueError(f"queue_policy must be one of {QUEUE_POLICIES}")
+        if preempt not in PREEMPT_MODES:
+            raise ValueError(f"preempt must be one of {PREEMPT_MODES}")
+        self.machine_id = machine_id
+        self.caps = caps
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.queue_cap = queue_cap
+        self.queue_policy = queue_policy
+        self.slots = max(1, slots)
+        self.reserve_ttl = max(0.0, reserve_ttl)
+        self.mqtt5 = mqtt5
+        self.host = host
+        self.slowdown = slowdown
+        self.duration_noise = duration_noise
+        self.heartbeat_s = max(0.0, heartbeat_s)
+        self.keepalive = keepalive
+        self.preempt = preempt
+        self.steal = steal
+        self.steal_margin = steal_margin
+        self.steal_threshold = steal_threshold
+        self._rng = random.Random()
+        self._seq = 0             # arrival order of the accepted jobs
+        self._advertised_at = 0.0  # time.monotonic() of the last Advert
+
+        if client is not None:
+            self.client = client
+        elif mqtt5:
+            self.client = mqtt.Client(client_id=f"machine-{machine_id}", protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(client_id=f"machine-{machine_id}", clean_session=True)
+        self._stop_event = threading.Event()
+        self._cond = threading.Condition()
+        self._queue = []          # waiting jobs: dict(job_id, job_type, duration, reply, priority, seq)
+        self._running = [None] * self.slots   # per slot: running job (same dict + run state) or None
+        self._reserved = {}       # job_id -> dict(job_type, duration, priority, expires_at) for outstanding bids
+        self._peers = {}          # idle peer id -> dict(caps, free) from its last StealRequest
+        self._offered = None      # free slots of our last StealRequest
+        self._loaded = {}         # backlogged peer id -> caps from its last StealRequest
+        self._announced = False   # our last StealRequest announced a backlog
+        self._lent = {}           # job_id -> queue entry granted to a peer (back in place if it is handed back)
+        self._timers = timers
+        self._executor = None if timers is not None else ThreadPoolExecutor(
+            max_workers=self.slots, thread_name_prefix=f"{machine_id}-slot")
+
+        mid = machine_id
+        self._m_in_cfp = MSGS_IN.labels(agent=mid, topic_class="cfp")
+        self._m_in_accept = MSGS_IN.labels(agent=mid, topic_class="accept")
+        self._m_in_cfp_batch = MSGS_IN.labels(agent=mid, topic_class="cfp_batch")
+        self._m_out_proposal = MSGS_OUT.labels(agent=mid, topic_class="proposal")
+        self._m_out_done = MSGS_OUT.labels(agent=mid, topic_class="done")
+        self._m_out_reject = MSGS_OUT.labels(agent=mid, topic_class="reject")
+        self._m_out_advert = MSGS_OUT.labels(agent=mid, topic_class="advert")
+        self._m_in_steal = MSGS_IN.labels(agent=mid, topic_class="steal")
+        self._m_out_steal = MSGS_OUT.labels(agent=mid, topic_class="steal")
+        self._m_handler_cfp = HANDLER_SECONDS.labels(agent=mid, topic_class="cfp")
+        self._m_handler_accept = HANDLER_SECONDS.labels(agent=mid, topic_class="accept")
+        self._m_queue = QUEUE_DEPTH.labels(agent=mid)
+        self._m_busy = BUSY.labels(agent=mid)
 
-    client = mqtt.Client(client_id=f"machine-{args.machine_id}", clean_session=True)
+    # ---------- Queue state (cond held) ----------
 
-    def is_busy() -> bool:
-        with busy_lock:
-            return busy["flag"]
+    def _busy_slots(self) -> int:
+        return sum(1 for job in self._running if job is not None)
 
-    def set_busy(val: bool, job_id=None, job_type=None):
-        with busy_lock:
-            busy["flag"] = val
-            busy["job_id"] = job_id
-            busy["job_type"] = job_type
+    def _is_idle(self) -> bool:
+        return self._busy_slots() == 0 and not self._queue
+
+    def _expire_reservations(self) -> None:
+        now = time.monotonic()
+        for job_id in [j for j, r in self._reserved.items() if r["expires_at"] <= now]:
+            del self._reserved[job_id]
+
+    def _has_room(self) -> bool:
+        self._expire_reservations()
+        used = self._busy_slots() + len(self._queue) + len(self._reserved)
+        return used < self.slots + self.queue_cap
+
+    def _victim(self, priority: int) -> int | None:
+        """Slot a job of `priority` would preempt (the lowest class, then the latest start); None if none."""
+        if self.preempt == "off":
+            return None
+        slots = [i for i, job in enumerate(self._running) if job is not None and job["priority"] < priority]
+        return min(slots, key=lambda i: (self._running[i]["priority"], -self._running[i]["resumed_at"]), default=None)
+
+    def _can_take(self, priority: int) -> bool:
+        return self._has_room() or self._victim(priority) is not None
+
+    def _eta(self, job_type: str, priority: int = 0) -> float:
+        """Seconds until a job of this type accepted now would be done (earliest free slot after the queue)."""
+        duration = float(self.caps[job_type])
+        return self._start_delay(duration, priority) + duration
+
+    def _start_delay(self, duration: float | None = None, priority: int | None = None) -> float:
+        """Seconds until a job of `duration` and `priority` accepted now could start (None: behind every
+        queued job)."""
+        now = time.monotonic()
+        preempts = priority is not None and self.preempt != "off"
+        free_at = sorted(0.0 if job is None or (preempts and job["priority"] < priority)
+                         else max(0.0, job["ends_at"] - now) for job in self._running)
+        waiting = self._queue + list(self._reserved.values())   # reserved jobs count as queued
+        spt = self.queue_policy == "spt"
+        if priority is not None:
+            # Behind the higher classes, and in its own class after the jobs the queue policy puts first
+            waiting = [j for j in waiting if j["priority"] > priority
+                       or (j["priority"] == priority and (not spt or j["duration"] <= duration))]
+        if spt:
+            waiting.sort(key=lambda j: (-j["priority"], j["duration"]))
+        else:
+            waiting.sort(key=lambda j: (-j["priority"], j.get("seq", self._seq)))   # reserved jobs last
+        for d in map(_promised_left, waiting):
+            free_at[0] += d
+            free_at.sort()
+        return free_at[0]
+
+    def _free_slots(self) -> int:
+        """Slots a job handed over now would start on at once (none while jobs wait or bids hold room)."""
+        if self._queue:
+            return 0
+        self._expire_reservations()
+        return max(0, self.slots - self._busy_slots() - len(self._reserved))
+
+    def _queued_ends(self) -> list[tuple[float, dict]]:
+        """(seconds until done, job) of the queued jobs, in the order they would start."""
+        now = time.monotonic()
+        free_at = sorted(0.0 if job is None else max(0.0, job["ends_at"] - now) for job in self._running)
+        key = (lambda j: (-j["priority"], j["duration"])) if self.queue_policy == "spt" else \
+            (lambda j: (-j["priority"], j["seq"]))
+        out = []
+        for job in sorted(self._queue, key=key):
+            free_at[0] += _promised_left(job)
+            out.append((free_at[0], job))
+            free_at.sort()
+        return out
+
+    def _pick_steals(self) -> list[StealGrant]:
+        """Hands queued jobs that were never started to the idle peers that finish them soonest, as long as
+        they gain more than steal_margin (cond held)."""
+        now = time.monotonic()
+        for job_id in [j for j, job in self._lent.items() if now - job["lent_at"] > LENT_TTL_S]:
+            del self._lent[job_id]
+        grants = []
+        while self._peers and self._queue:
+            best = None
+            for end, job in self._queued_ends():
+                if "run_s" in job:
+                    continue   # preempted: its progress stays here
+                for mid, peer in self._peers.items():
+                    d = peer["caps"].get(job["job_type"])
+                    if d is not None and (best is None or end - float(d) > best[0]):
+                        best = (end - float(d), job, mid)
+            if best is None or best[0] <= self.steal_margin:
+                break
+            _gain, job, mid = best
+            self._queue.remove(job)
+            job["lent_at"] = time.monotonic()
+            self._lent[job["job_id"]] = job
+            peer = self._peers[mid]
+            peer["free"] -= 1
+            if peer["free"] <= 0:
+                del self._peers[mid]
+            topic, corr = job["reply"]
+            grants.append(StealGrant(job["job_id"], job["job_type"], self.machine_id, mid, now_s(),
+                                     priority=job["priority"], reply_to=topic, corr=corr))
+            JOBS.labels(agent=self.machine_id, job_type=job["job_type"], outcome="stolen").inc()
+        if grants:
+            self._m_queue.set(len(self._queue))
+        return grants
+
+    def _pop_next(self) -> dict:
+        top = max(job["priority"] for job in self._queue)
+        ks = [k for k, job in enumerate(self._queue) if job["priority"] == top]
+        if self.queue_policy == "spt":
+            return self._queue.pop(min(ks, key=lambda k: self._queue[k]["duration"]))
+        return self._queue.pop(min(ks, key=lambda k: self._queue[k]["seq"]))
+
+    # ---------- Registry advert ----------
+
+    def _advert(self, online: bool = True) -> Advert:
+        with self._cond:
+            busy = self._busy_slots()
+            queued = len(self._queue)
+            return Advert(
+                machine_id=self.machine_id, caps=self.caps, slots=self.slots, queue_cap=self.queue_cap,
+                busy=busy if online else 0, queued=queued if online else 0,
+                room=max(0, self.slots + self.queue_cap - busy - queued) if online else 0,
+                backlog_s=round(self._start_delay(), 3) if online else 0.0,
+                online=online, at=now_s(), host=self.host, heartbeat_s=self.heartbeat_s,
+            )
+
+    def _advertise(self) -> None:
+        self._advertised_at = time.monotonic()
+        self.client.publish(t_registry(self.machine_id), self._advert().to_msg(), qos=0, retain=True)
+        self._m_out_advert.inc()
+
+    def heartbeat(self) -> None:
+        """Re-publishes the Advert if none went out for --heartbeat-s."""
+        if self.heartbeat_s and time.monotonic() - self._advertised_at >= self.heartbeat_s:
+            self._advertise()
+
+    # ---------- MQTT callbacks ----------
+
+    def topics(self) -> list[str]:
+        steal = [t_steal_request(), t_steal_grant(self.machine_id)] if self.steal else []
+        return ([t_cfp(jt) for jt in self.caps] + [t_cfp_to(self.machine_id), t_accept(self.machine_id), t_cfp_batch()]
+                + steal)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            for topic in self.topics():
+                client.subscribe(topic, qos=0)
+            self._advertise()
+            self._offered = None
+            self._share_work()
+            print(f"[{self.machine_id}] Connected. Caps={self.caps} slots={self.slots} "
+                  f"queue_cap={self.queue_cap} ({self.queue_policy}) preempt={self.preempt}"
+                  + (" steal" if self.steal else ""))
+        else:
+            print(f"[{self.machine_id}] Connect failed rc={rc}")
 
     # CfP handler: decide whether to bid
-    def on_cfp(client, _userdata, msg):
-        if is_busy():
+    def _on_cfp(self, client, userdata, msg, cfp: dict | None = None):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        self._m_in_cfp.inc()
+        try:
+            self._handle_cfp(msg, cfp)
+        except Exception as e:
+            print(f"[{self.machine_id}] on_cfp error: {e}")
+        finally:
+            if t0:
+                self._m_handler_cfp.observe(time.perf_counter() - t0)
+
+    def _handle_cfp(self, msg, cfp: dict | None = None):
+        if cfp is None:
+            cfp = jload(msg.payload)   # a fleet host decodes a broadcast CfP once for all its machines
+        job_type = cfp["job_type"]
+        job_id = cfp["job_id"]
+        priority = int(cfp.get("priority", 0))
+        if job_type not in self.caps:
             return
+        with self._cond:
+            if job_id in self._reserved or not self._can_take(priority):
+                return
+            eta = round(self._eta(job_type, priority), 3)
+            ttl = 0.0
+            if self.reserve_ttl > 0 and self._has_room():   # a bid that would preempt holds no room
+                # Until the supervisor picks the winner, plus the grace for the Accept to arrive
+                left = float(cfp["issued_at"]) + float(cfp["deadline_s"]) - now_s()
+                ttl = round(max(0.0, left) + self.reserve_ttl, 3)
+                self._reserved[job_id] = {"job_type": job_type, "duration": float(self.caps[job_type]),
+                                          "priority": priority, "expires_at": time.monotonic() + ttl}
+        backlog = round(max(0.0, eta - float(self.caps[job_type])), 3)
+        prop = Proposal(job_id=job_id, job_type=job_type, machine_id=self.machine_id, eta_s=eta, at=now_s(),
+                        backlog_s=backlog, ttl_s=ttl)
+        publish_reply(self.client, reply_route(msg, cfp), t_proposals(), prop, self.mqtt5)
+        self._m_out_proposal.inc()
+        BIDS.labels(agent=self.machine_id, job_type=job_type).inc()
+        print(f"[{self.machine_id}] Proposal -> job={job_id} type={job_type} eta={eta}s")
+
+    # Batch CfP handler: one answer with the ETA of every job type of the block we can run
+    def _on_cfp_batch(self, client, userdata, msg):
+        self._m_in_cfp_batch.inc()
         try:
+            with self._cond:
+                if not self._is_idle():
+                    return
             cfp = jload(msg.payload)
-            job_type = cfp["job_type"]
-            job_id = cfp["job_id"]
-            if job_type not in caps:
+            etas = {}
+            for job in cfp["jobs"]:
+                jt = job["job_type"]
+                if jt in self.caps:
+                    etas[jt] = float(self.caps[jt])
+            if not etas:
                 return
-            eta = float(caps[job_type])
-            prop = Proposal(
-                job_id=job_id,
-                job_type=job_type,
-                machine_id=args.machine_id,
-                eta_s=eta,
-                at=now_s(),
-            )
-            client.publish(t_proposals(), prop.to_msg(), qos=0)
-            print(f"[{args.machine_id}] Proposal -> job={job_id} type={job_type} eta={eta}s")
+            prop = BatchProposal(batch_id=cfp["batch_id"], machine_id=self.machine_id, etas=etas, at=now_s(),
+                                 slots=self.slots)
+            publish_reply(self.client, reply_route(msg, cfp), t_batch_proposals(), prop, self.mqtt5)
+            self._m_out_proposal.inc()
+            print(f"[{self.machine_id}] Batch proposal -> batch={cfp['batch_id']} jobs={len(cfp['jobs'])} etas={etas}")
+        except Exception as e:
+            print(f"[{self.machine_id}] on_cfp_batch error: {e}")
+
+    # Accept handler: queue the job if there is room (or a reservation), reject it otherwise
+    def _on_accept(self, client, userdata, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        self._m_in_accept.inc()
+        try:
+            self._handle_accept(msg)
         except Exception as e:
-            print(f"[{args.machine_id}] on_cfp error: {e}")
+            print(f"[{self.machine_id}] on_accept error: {e}")
+        finally:
+            if t0:
+                self._m_handler_accept.observe(time.perf_counter() - t0)
+
+    def _handle_accept(self, msg):
+        acc = jload(msg.payload)
+        job_id = acc["job_id"]
+        job_type = acc["job_type"]
+        priority = int(acc.get("priority", 0))
+        route = reply_route(msg, acc)
+        with self._cond:
+            reserved = self._reserved.pop(job_id, None) is not None
+            if job_type not in self.caps:
+                reason = "incapable"
+            elif not reserved and not self._can_take(priority):
+                reason = "busy"
+            else:
+                reason = None
+                self._queue.append({"job_id": job_id, "job_type": job_type, "duration": float(self.caps[job_type]),
+                                    "reply": route, "priority": priority, "seq": self._seq})
+                self._seq += 1
+                self._start_queued()
+            queued = len(self._queue)
+        if reason is not None:
+            self._reject(job_id, job_type, reason, route)
+            return
+        self._advertise()
+        print(f"[{self.machine_id}] ACCEPTED -> job={job_id} type={job_type} (queued={queued}"
+              f"{', reserved' if reserved else ''})")
+        self._share_work()
 
-    # Accept handler: run only if addressed to this machine
-    def on_accept(client, _userdata, msg):
+    def _reject(self, job_id: str, job_type: str, reason: str, route: tuple[str, str]) -> None:
+        publish_reply(self.client, route, t_reject(), Reject(job_id, job_type, self.machine_id, reason, now_s()),
+                      self.mqtt5)
+        self._m_out_reject.inc()
+        JOBS.labels(agent=self.machine_id, job_type=job_type, outcome="rejected").inc()
+        with self._cond:
+            queued = len(self._queue)
+        print(f"[{self.machine_id}] REJECT -> job={job_id} ({reason}, {queued} queued)")
+
+    # ---------- Work stealing ----------
+
+    def _on_steal_request(self, client, userdata, msg):
+        self._m_in_steal.inc()
         try:
-            acc = jload(msg.payload)
-            job_id = acc["job_id"]
-            job_type = acc["job_type"]
-            if is_busy():
+            req = jload(msg.payload)
+            mid = req["machine_id"]
+            if mid == self.machine_id:
                 return
+            with self._cond:
+                if int(req["free"]) > 0 and any(jt in self.caps for jt in req["caps"]):
+                    self._peers[mid] = {"caps": req["caps"], "free": int(req["free"])}
+                else:
+                    self._peers.pop(mid, None)
+                if int(req.get("backlog", 0)) > 0:
+                    self._loaded[mid] = req["caps"]
+                else:
+                    self._loaded.pop(mid, None)
+            self._share_work()
+        except Exception as e:
+            print(f"[{self.machine_id}] on_steal_request error: {e}")
 
-            set_busy(True, job_id, job_type)
-            print(f"[{args.machine_id}] ACCEPTED -> job={job_id} type={job_type}, running...")
-
-            def run_job():
-                started = now_s()
-                duration = float(caps[job_type])
-                time.sleep(duration)  # simulate work
-                finished = now_s()
-                client.publish(
-                    t_done(),
-                    Done(job_id, job_type, args.machine_id, started, finished).to_msg(),
-                    qos=0,
-                )
-                print(f"[{args.machine_id}] DONE -> job={job_id} ({duration}s)")
-                set_busy(False, None, None)
-
-            threading.Thread(target=run_job, daemon=True).start()
+    def _on_steal_grant(self, client, userdata, msg):
+        self._m_in_steal.inc()
+        try:
+            self._handle_steal_grant(jload(msg.payload))
         except Exception as e:
-            print(f"[{args.machine_id}] on_accept error: {e}")
+            print(f"[{self.machine_id}] on_steal_grant error: {e}")
 
-    # Subscribe to CfP for supported types and to this machine's Accept topic
-    def on_connect(client, _userdata, _flags, rc):
-        if rc == 0:
-            for jt in caps.keys():
-                client.subscribe(t_cfp(jt), qos=0)
-            client.subscribe(t_accept(args.machine_id), qos=0)
-            print(f"[{args.machine_id}] Connected. Caps={caps}")
+    def _handle_steal_grant(self, g: dict) -> None:
+        job_id, job_type = g["job_id"], g["job_type"]
+        priority = int(g.get("priority", 0))
+        route = (g.get("reply_to", ""), g.get("corr", ""))
+        returned = bool(g.get("returned"))
+        with self._cond:
+            take = job_type in self.caps and (returned or self._free_slots() > 0)
+            if returned:
+                self._peers.pop(g["from_machine"], None)   # busy again: no grant until it offers again
+            if take:
+                eta = round(self._eta(job_type, priority), 3)
+                job = self._lent.pop(job_id, None) if returned else None
+                if job is None:
+                    job = {"job_id": job_id, "job_type": job_type, "duration": float(self.caps[job_type]),
+                           "reply": route, "priority": priority, "seq": self._seq}
+                    self._seq += 1
+                self._queue.append(job)   # a job handed back keeps its seq: its old place
+                self._start_queued()
+        if not take:
+            # Busy again since the offer (another peer's grant or an Accept came first): hand it back
+            back = StealGrant(job_id, job_type, self.machine_id, g["from_machine"], now_s(), priority=priority,
+                              reply_to=route[0], corr=route[1], returned=True)
+            self.client.publish(t_steal_grant(g["from_machine"]), back.to_msg(), qos=0)
+            self._m_out_steal.inc()
+            print(f"[{self.machine_id}] STEAL RETURNED -> job={job_id} to {g['from_machine']}")
+            return
+        self._advertise()
+        if not returned:
+            publish_reply(self.client, route, t_reassigned(),
+                          Reassigned(job_id, job_type, g["from_machine"], self.machine_id, eta,
+                                     float(self.caps[job_type]), now_s()), self.mqtt5)
+            print(f"[{self.machine_id}] STOLE -> job={job_id} type={job_type} from {g['from_machine']} (eta={eta}s)")
+        self._share_work()
+
+    def _share_work(self) -> None:
+        """After a change of the queue or the peers: grants to the idle peers, then our own offer or backlog if it
+        changed. Free slots are only offered while a peer announced a backlog."""
+        if not self.steal:
+            return
+        with self._cond:
+            grants = self._pick_steals()
+            free = self._free_slots()
+            backlog = len(self._queue)
+            loaded = backlog > self.steal_threshold or (self._announced and backlog > 0)
+            wanted = any(jt in self.caps for caps in self._loaded.values() for jt in caps)
+            free = free if free and (wanted or self._offered) else 0
+            offer = free != (self._offered or 0) or loaded != self._announced
+            self._offered, self._announced = free, loaded
+        for g in grants:
+            self.client.publish(t_steal_grant(g.to_machine), g.to_msg(), qos=0)
+            self._m_out_steal.inc()
+            print(f"[{self.machine_id}] STOLEN -> job={g.job_id} type={g.job_type} by {g.to_machine}")
+        if grants:
+            self._advertise()
+        if offer:
+            req = StealRequest(self.machine_id, self.caps, free, now_s(), backlog if loaded else 0)
+            self.client.publish(t_steal_request(), req.to_msg(), qos=0)
+            self._m_out_steal.inc()
+
+    # ---------- Slots ----------
+
+    def _start_queued(self) -> None:
+        """Moves queued jobs onto free slots, or onto the slot of a lower-priority job with --preempt (cond held)."""
+        while self._queue and not self._stop_event.is_set():
+            slot = next((i for i, job in enumerate(self._running) if job is None), None)
+            if slot is None:
+                slot = self._victim(max(job["priority"] for job in self._queue))
+                if slot is None:
+                    break
+                self._preempt(slot)
+            job = self._pop_next()
+            now = time.monotonic()
+            if "run_s" not in job:
+                job["run_s"] = job["duration"] * self.slowdown
+                if self.duration_noise > 0:
+                    job["run_s"] *= self._rng.lognormvariate(0.0, self.duration_noise)
+                job["left_s"] = job["run_s"]     # real seconds still to run
+                job["preemptions"] = 0
+                job["started_at"] = now_s()
+            job["resumed_at"] = now
+            job["ends_at"] = now + _promised_left(job)
+            job["stop"] = threading.Event()     # set when the job is preempted
+            self._running[slot] = job
+            if self._timers is not None:
+                self._job_started(slot, job)
+                self._timers.call_later(job["left_s"], self._finish_job, slot, job, job["stop"])
+            else:
+                self._executor.submit(self._run_job, slot, job, job["stop"])
+        self._m_queue.set(len(self._queue))
+        self._m_busy.set(self._busy_slots())
+
+    def _preempt(self, slot: int) -> None:
+        """Takes the running job off its slot and back into the queue (cond held)."""
+        job = self._running[slot]
+        self._running[slot] = None
+        job["stop"].set()
+        job["preemptions"] += 1
+        if self.preempt == "checkpoint":
+            job["left_s"] = max(0.0, job["left_s"] - (time.monotonic() - job["resumed_at"]))
         else:
-            print(f"[{args.machine_id}] Connect failed rc={rc}")
+            job["left_s"] = job["run_s"]
+        self._queue.append(job)
+        JOBS.labels(agent=self.machine_id, job_type=job["job_type"], outcome="preempted").inc()
+        print(f"[{self.machine_id}] PREEMPTED -> job={job['job_id']} slot={slot} priority={job['priority']} "
+              f"({self.preempt}, {job['left_s']:.3f}s left)")
+
+    def _run_job(self, slot: int, job: dict, stop: threading.Event) -> None:
+        self._job_started(slot, job)
+        if not stop.wait(job["left_s"]):   # simulate work, unless preempted or shutting down
+            self._finish_job(slot, job, stop)
+
+    def _job_started(self, slot: int, job: dict) -> None:
+        print(f"[{self.machine_id}] RUNNING -> job={job['job_id']} type={job['job_type']} slot={slot}"
+              + (f" priority={job['priority']}" if job["priority"] else "")
+              + (f" (after {job['preemptions']} preemption(s))" if job["preemptions"] else ""))
+
+    def _finish_job(self, slot: int, job: dict, stop: threading.Event) -> None:
+        finished = now_s()
+        with self._cond:
+            if stop.is_set():
+                return   # preempted meanwhile
+            self._running[slot] = None
+            self._start_queued()
+        self._advertise()
+        started = job["started_at"]
+        lost = round(max(0.0, finished - started - job["run_s"]), 3) if job["preemptions"] else 0.0
+        publish_reply(self.client, job["reply"], t_done(),
+                      Done(job["job_id"], job["job_type"], self.machine_id, started, finished, slot,
+                           preemptions=job["preemptions"], preempted_s=lost), self.mqtt5)
+        self._m_out_done.inc()
+        JOBS.labels(agent=self.machine_id, job_type=job["job_type"], outcome="done").inc()
+        JOB_SECONDS.labels(agent=self.machine_id, job_type=job["job_type"]).observe(finished - started - lost)
+        print(f"[{self.machine_id}] DONE -> job={job['job_id']} slot={slot} ({round(job['run_s'], 3)}s"
+              + (f", {job['preemptions']} preemption(s) cost {lost}s" if job["preemptions"] else "") + ")")
+        self._share_work()
 
-    client.on_connect = on_connect
-    client.message_callback_add("lab/cnp/cfp/+", on_cfp)
-    client.message_callback_add(f"lab/cnp/accept/{args.machine_id}", on_accept)
+    # ---------- Public API ----------
 
-    client.connect(args.broker, args.port, 60)
-    client.loop_forever()
+    def connect(self) -> None:
+        """Connects to the broker and starts MQTT loop in background."""
+        self.client.on_connect = self._on_connect
+        self.client.message_callback_add("lab/cnp/cfp/+", self._on_cfp)
+        self.client.message_callback_add(t_cfp_to(self.machine_id), self._on_cfp)
+        self.client.message_callback_add(t_accept(self.machine_id), self._on_accept)
+        self.client.message_callback_add(t_cfp_batch(), self._on_cfp_batch)
+        if self.steal:
+            self.client.message_callback_add(t_steal_request(), self._on_steal_request)
+            self.client.message_callback_add(t_steal_grant(self.machine_id), self._on_steal_grant)
+        # Broker-side removal from the registry if we vanish without stop()
+        self.client.will_set(t_registry(self.machine_id), self._advert(online=False).to_msg(), qos=1, retain=True)
+        self.client.connect(self.broker_host, self.broker_port, self.keepalive)
+        self.client.loop_start()
+
+    def run(self) -> None:
+        """Runs jobs until stop() is called."""
+        self.connect()
+        try:
+            while not self._stop_event.wait(min(1.0, self.heartbeat_s / 4) if self.heartbeat_s else 1.0):
+                self.heartbeat()
+        finally:
+            self._stop_event.set()
+            with self._cond:
+                for job in self._running:
+                    if job is not None:
+                        job["stop"].set()   # the slot threads return at once, without a Done
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            info = self.client.publish(t_registry(self.machine_id), self._advert(online=False).to_msg(),
+                                       qos=1, retain=True)
+            info.wait_for_publish(1.0)
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Contract Net Machine (MQTT)")
+    ap.add_argument("--machine-id", required=True, help="Unique machine identifier")
+    ap.add_argument("--caps", default="", help='Capabilities like "cut:3,drill:5,paint:2.5" (seconds)')
+    ap.add_argument("--caps-json", default="", help="Capabilities in JSON")
+    ap.add_argument("--slots", type=int, default=1, help="Jobs the machine runs in parallel")
+    ap.add_argument("--queue-cap", type=int, default=0,
+                    help="Accepted jobs that may wait for a free slot (0 = bid only while a slot is free)")
+    ap.add_argument("--queue-policy", choices=QUEUE_POLICIES, default="fifo",
+                    help="Order of the waiting jobs: fifo or spt (shortest job first)")
+    ap.add_argument("--reserve-ttl", type=float, default=0.0,
+                    help="A bid keeps room for its job until the CfP deadline + this grace in seconds "
+                         "(0 = no reservation, bid on every CfP while free)")
+    ap.add_argument("--mqtt5", action="store_true",
+                    help="Connect with MQTT v5 (reply topic and correlation id as PUBLISH properties)")
+    ap.add_argument("--slowdown", type=float, default=1.0,
+                    help="Jobs really take this factor times their --caps duration (> 1: the machine over-promises)")
+    ap.add_argument("--duration-noise", type=float, default=0.0,
+                    help="Lognormal sigma of each job's real run time around it (0 = exact)")
+    ap.add_argument("--preempt", choices=PREEMPT_MODES, default="off",
+                    help="A higher-priority job takes the slot of a running one, which runs again from the start "
+                         "(restart) or resumes where it stopped (checkpoint)")
+    ap.add_argument("--steal", action="store_true",
+                    help="Offer free slots to the peers and hand queued jobs to idle peers that finish them sooner")
+    ap.add_argument("--steal-margin", type=float, default=0.5,
+                    help="Seconds an idle peer must finish a queued job sooner to be granted it (with --steal)")
+    ap.add_argument("--steal-threshold", type=int, default=1,
+                    help="Queued jobs above which the machine announces its backlog; idle machines only offer their "
+                         "slots while a peer has one (with --steal)")
+    ap.add_argument("--heartbeat-s", type=float, default=0.0,
+                    help="Re-publish the Advert at least every N seconds (0 = only on state changes)")
+    ap.add_argument("--keepalive", type=int, default=60,
+                    help="MQTT keepalive in seconds: the broker publishes the LWT of a silent machine after 1.5x")
+    ap.add_argument("--broker", default="localhost", help="MQTT broker host")
+    ap.add_argument("--port", type=int, default=1883, help="MQTT broker port")
+    ap.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port (0 = off)")
+    args = ap.parse_args()
+
+    caps = parse_caps(args.caps)
+    if (not caps) and args.caps_json:
+        caps = json.loads(args.caps_json)
+
+    if not caps:
+        raise SystemExit("Define capabilities with --caps or --caps-json")
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    agent = MachineAgent(args.machine_id, caps, args.broker, args.port, args.queue_cap, args.queue_policy, args.slots,
+                         args.reserve_ttl, args.mqtt5, slowdown=args.slowdown, duration_noise=args.duration_noise,
+                         heartbeat_s=args.heartbeat_s, keepalive=args.keepalive, preempt=args.preempt,
+                         steal=args.steal, steal_margin=args.steal_margin, steal_threshold=args.steal_threshold)
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop()
 
 if __name__ == "__main__":
     main()
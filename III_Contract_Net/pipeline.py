@@ -0,0 +1,1185 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+from auction import Auction
+from common import (CfP, BatchCfP, Accept, now_s, new_job_id, with_reply, t_cfp, t_cfp_to, t_accept, t_cfp_batch,
+                    t_replies)
+from dag import JobDag
+from deadlines import DeadlineTracker
+from durations import DurationModel
+from intake import JobQueue
+from metrics import REGISTRY
+from strategies import HungarianStrategy
+
+"""
+Sequential supervisor core (SequentialSupervisor):
+- One CfP round at a time, in job list order; with `wait_done` the next round waits for the DONE of
+  the previous job. Rounds close early like the pipelined ones (min bids, quiet period, registry).
+- The handlers (MQTT thread) and run() (caller thread) share the rounds, the awarded jobs and the
+  counters under one condition, which the open round's Auction also waits on.
+- Rejects, DONE timeouts and lost machines are handled as below, between rounds: next-best bid of the
+  round, else new CfP rounds (at most `max_reissues`).
+- A round an adapted deadline closed without a bid is asked again with the static deadline, and again
+  while jobs of ours are running; `guard_fast` keeps the fastest machine free for the next job of the
+  same type when the second-best bid is within `alpha` of it.
+
+Pipelined supervisor core:
+- Keeps up to `max_auctions` CfP rounds open at the same time.
+- Each round is closed on its own (deadline, min bids or quiet period) and awarded right away;
+  the scheduling thread sleeps until the earliest round timer or a bid/Done notification.
+- At most `max_jobs` jobs are in the pipeline (open rounds + awarded jobs not Done yet).
+- A machine holds at most `per_machine` of our jobs (1 for single-job machines, more for machines
+  with a queue); a round whose bidders are all full goes back to the queue and is re-issued.
+  A bid sent before the machine won another of our rounds is corrected by that job's duration.
+- A round without any bid while our jobs are running (every capable machine busy) is parked
+  and re-issued on the next Done; without running jobs it is skipped as in the sequential mode.
+- With a registry (registry.py), a round closes as soon as every registered machine able to run the
+  job and with room has bid (at once if there is none: the round is parked); with `direct`, jobs are
+  awarded from the registry ranking without a CfP round while a registered machine has room;
+  with `sample_k`, each CfP goes to k machines picked by the registry (see publish_cfp()).
+- `deadlines` (deadlines.DeadlineTracker) sizes each round's deadline from the proposal latency seen for
+  its job type (at most `deadline_s`); without it every round gets `deadline_s` and the tracker only
+  measures the rounds (idle time after the last bid, late bids).
+- `durations` (durations.DurationModel) learns the machines' real run times from the Done messages;
+  bids are then ranked by the corrected ETA, and a machine's jobs count with their learned run time.
+- `dag` (dag.JobDag): jobs released as the Done of their predecessors arrive, by critical path; the job
+  list runs first. `intake` (intake.JobQueue): jobs also arrive while it runs (on_job()), and are
+  dispatched by priority and due time. Both are pulled whenever the pipeline has room, after the rounds
+  to re-issue, and told each job's outcome; run() returns once both are drained (the intake closed with
+  close_intake()) and every job is through.
+- A Reject (the winner had no room left) re-awards the job to the next-best bid of its round whose
+  reservation is still valid, else the job goes back to the queue for a new CfP. A job without
+  DONE `done_timeout_s` after ETA x `done_slack` is treated the same way (counted as timed out): the
+  due times of the running jobs are a heap, so the scheduling thread only wakes for the earliest.
+- With a registry, a machine that goes offline (its LWT, or a fleet host's) or whose heartbeats stop
+  (registry.expire()) is lost: each of its running jobs is re-awarded at once like a Reject (counted as
+  failed over), and its bids are passed over until it advertises again.
+- Work stealing (machines run with machine.py --steal): a Reassigned message moves a job to the machine
+  that took it over, with its new ETA and Done timeout; the machine it left has room again.
+- Priorities (intake jobs): every CfP and Accept carries the job's priority class, so machines queue it
+  ahead of lower classes. With `preempt` (the machines run with machine.py --preempt), a job may also take
+  the place of a running one of a lower class: for a job of priority p, `max_jobs` only counts the jobs of
+  priority >= p and `per_machine` only the jobs a machine holds of priority >= p; with a registry, the
+  machines running our lower-priority jobs are expected to bid as well. Either way, the Done timeouts of
+  our lower-priority jobs on its machine are pushed back by its run time.
+- With `replies` (the supervisor id), every CfP and Accept names lab/cnp/replies/<id>/... as its reply
+  topic, so the machines answer this supervisor alone (see common.with_reply()).
+- run() is a loop over step() (one scheduling pass, returns the next timer); with `clock` every
+  timestamp and timer uses it instead of the wall / monotonic clocks, so sim.py can drive the same
+  core on a virtual clock.
+
+Batch supervisor core (BatchSupervisor):
+- One batch CfP per block of jobs; machines answer once with their ETA per job type.
+- The block is planned as a whole by a strategy (strategies.py, default: Hungarian rounds +
+  makespan local search) and every machine gets its queue one Accept at a time, the next one on Done.
+- A machine with several slots is planned as one lane per slot ("M01#0", "M01#1", ...).
+- A Reject (or a DONE timeout, or the loss of the machine) takes the job and the rest of its lane out
+  of the plan; these jobs are planned again with a new batch CfP once the block is through.
+- With `direct`, the idle machines of the registry replace the answers to the batch CfP.
+"""
+
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+JOBS = REGISTRY.counter("cnp_jobs_total", "Jobs by outcome", ("agent", "job_type", "outcome"))
+JOB_SECONDS = REGISTRY.histogram("cnp_job_seconds", "Job latency (machine: run time, supervisor: CfP to Done)",
+                                 ("agent", "job_type"))
+AWARD_SECONDS = REGISTRY.histogram("cnp_award_seconds", "CfP to Accept latency (bid collection)", ("agent",))
+IN_FLIGHT = REGISTRY.gauge("cnp_jobs_in_flight", "Jobs awarded and not Done yet", ("agent",))
+OPEN_AUCTIONS = REGISTRY.gauge("cnp_open_auctions", "CfP rounds currently collecting bids", ("agent",))
+CLOSE_LAG = REGISTRY.histogram("cnp_close_lag_seconds", "Close condition met to round closed", ("agent",))
+
+IDLE_WAIT_S = 1.0   # upper bound on a wait with no open round (only Done notifications pending)
+RETRY_OUTCOMES = {"timeout": "timed_out", "machine_lost": "failed_over"}   # cnp_jobs_total outcome, else rejected
+
+
+def _priority(req: dict | None) -> int:
+    """Priority class of a job (intake request; 0 for the job list and DAG jobs)."""
+    return int(req.get("priority", 0)) if req else 0
+
+
+def publish_cfp(client, cfp: CfP, registry=None, sample_k: int = 0, sample_policy: str = "random",
+                reply_to: str = "", mqtt5: bool = False) -> set | None:
+    """Broadcasts the CfP on its job type topic, or with `sample_k` sends it to k machines of the
+    registry on their own CfP topics; proposals go to `reply_to` if set. Returns the machines expected
+    to bid (None: unknown)."""
+    props = with_reply(cfp, reply_to, mqtt5)
+    msg = cfp.to_msg()
+    if registry is None or not registry.known(cfp.job_type):
+        client.publish(t_cfp(cfp.job_type), msg, qos=0, properties=props)
+        return None
+    if sample_k <= 0:
+        client.publish(t_cfp(cfp.job_type), msg, qos=0, properties=props)
+        return registry.expected(cfp.job_type)
+    targets = registry.sample(cfp.job_type, sample_k, sample_policy)
+    for mid in targets:
+        client.publish(t_cfp_to(mid), msg, qos=0, properties=props)
+    # Sampled machines without room do not bid: only wait for the others
+    return registry.expected(cfp.job_type, among=targets)
+
+
+class SequentialSupervisor:
+    def __init__(
+        self,
+        client,
+        job_types: list[str],
+        deadline_s: float = 1.0,
+        min_bids: int = 0,
+        quiet_ms: int = 0,
+        max_reissues: int = 20,
+        done_timeout_s: float = 10.0,
+        done_slack: float = 1.0,
+        registry=None,
+        direct: bool = False,
+        sample_k: int = 0,
+        sample_policy: str = "random",
+        replies: str = "",
+        mqtt5: bool = False,
+        wait_done: bool = False,
+        drain_s: float = 30.0,
+        guard_fast: bool = False,
+        alpha: float = 1.15,
+        agent: str = "supervisor_opt",
+        tag: str = "[SUP+]",
+        deadlines: DeadlineTracker | None = None,
+        durations: DurationModel | None = None,
+    ) -> None:
+        self.client = client
+        self.job_types = job_types
+        self.replies = replies
+        self.mqtt5 = mqtt5
+        self.deadline_s = deadline_s
+        self.min_bids = min_bids
+        self.quiet_s = quiet_ms / 1000.0
+        self.max_reissues = max_reissues
+        self.done_timeout_s = done_timeout_s
+        self.done_slack = done_slack
+        self.registry = registry
+        self.direct = direct and registry is not None
+        self.sample_k = sample_k
+        self.sample_policy = sample_policy
+        self.wait_done = wait_done
+        self.drain_s = drain_s
+        self.guard_fast = guard_fast
+        self.alpha = alpha
+        self.deadlines = deadlines or DeadlineTracker(deadline_s, adaptive=False, agent=agent)
+        self.durations = durations
+        self._eta = durations.eta if durations is not None else None
+        self.agent = agent
+        self.tag = tag
+
+        # Everything below is shared with the MQTT thread: read and written with _cond held only
+        self._cond = threading.Condition()   # RLock: shared with the Auction of the open round
+        self._auctions = {}      # job_id -> Auction (open round)
+        self._issued = {}        # job_id -> (CfP time, job_type) while awarded and not Done
+        self._offers = {}        # job_id -> dict(auction, issued_at, machine_id, tried, reissues, due_at, duration)
+        self._rejected = deque() # (job_id, reason) to award again: Reject, DONE timeout or machine lost
+        self._down = set()       # machines lost (offline / silent) and not back in the registry
+        self._done_at = {}       # job_id -> DONE receive time
+
+        self.skipped = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed_over = 0
+        self.reassigned = 0
+        self.reawarded = 0
+        self.reissued = 0        # new rounds after a Reject or a missing Done (counts toward max_reissues)
+        self.parked = 0          # rounds asked again at the static deadline while our jobs run
+        self.lost = 0            # given up after max_reissues
+
+        self._m_out_cfp = MSGS_OUT.labels(agent=agent, topic_class="cfp")
+        self._m_out_accept = MSGS_OUT.labels(agent=agent, topic_class="accept")
+        self._m_award = AWARD_SECONDS.labels(agent=agent)
+        self._m_in_flight = IN_FLIGHT.labels(agent=agent)
+        self._m_close_lag = CLOSE_LAG.labels(agent=agent)
+
+    # ---------- Message handlers (MQTT thread) ----------
+
+    def on_proposal(self, p: dict) -> None:
+        with self._cond:
+            self.deadlines.on_bid(p["job_id"])
+            auction = self._auctions.get(p["job_id"])
+            if auction is not None:
+                auction.add(p)   # notifies the waiting round once a close condition is met
+
+    def on_done(self, d: dict) -> None:
+        with self._cond:
+            jid = d["job_id"]
+            entry = self._issued.pop(jid, None)
+            if entry is None:
+                return
+            self._done_at[jid] = now_s()
+            issued_at, jt = entry
+            if self.durations is not None:
+                self.durations.observe(d["machine_id"], jt, self._offers[jid]["duration"],
+                                       d["finished_at"] - d["started_at"] - d.get("preempted_s", 0.0))
+            JOBS.labels(agent=self.agent, job_type=jt, outcome="done").inc()
+            JOB_SECONDS.labels(agent=self.agent, job_type=jt).observe(now_s() - issued_at)
+            self._m_in_flight.dec()
+            self._cond.notify_all()
+
+    def on_reject(self, r: dict) -> None:
+        with self._cond:
+            jid = r["job_id"]
+            offer = self._offers.get(jid)
+            if jid not in self._issued or offer is None or offer["machine_id"] != r["machine_id"]:
+                return
+            self._issued.pop(jid)
+            self.rejected += 1
+            self._m_in_flight.dec()
+            self._rejected.append((jid, r["reason"]))
+            self._cond.notify_all()
+
+    def on_reassigned(self, s: dict) -> None:
+        """A queued job of ours moved to an idle machine (work stealing)."""
+        with self._cond:
+            jid = s["job_id"]
+            offer = self._offers.get(jid)
+            if jid not in self._issued or offer is None or offer["machine_id"] != s["from_machine"]:
+                return
+            if self.registry is not None:
+                self.registry.forget_award(offer["machine_id"], jid)
+                self.registry.note_award(s["machine_id"], jid, float(s["duration_s"]))
+            offer["machine_id"] = s["machine_id"]
+            offer["duration"] = float(s["duration_s"])
+            if offer["due_at"] is not None:
+                offer["due_at"] = time.monotonic() + float(s["eta_s"]) * self.done_slack + self.done_timeout_s
+            self.reassigned += 1
+            print(f"{self.tag} REASSIGNED: job={jid} {s['from_machine']} -> {s['machine_id']} (eta={s['eta_s']}s)")
+            self._cond.notify_all()
+
+    def on_advert(self, a: dict) -> None:
+        with self._cond:
+            self._machines_lost(self.registry.on_advert(a))
+            if self._down and a.get("online", True):
+                self._down = {m for m in self._down if not self.registry.online(m)}
+            self._cond.notify_all()   # a direct round may be waiting for a machine with room
+
+    # ---------- Rounds (caller thread, lock held) ----------
+
+    def _reply_to(self, kind: str) -> str:
+        return t_replies(self.replies, kind) if self.replies else ""
+
+    def _machines_lost(self, mids: list[str]) -> None:
+        """Sends the running jobs of machines that went offline or silent back to be awarded again."""
+        for mid in mids:
+            self._down.add(mid)
+            jobs = [jid for jid in self._issued if self._offers[jid]["machine_id"] == mid]
+            print(f"{self.tag} {mid} lost with {len(jobs)} running job(s)")
+            for jid in jobs:
+                del self._issued[jid]
+                self.failed_over += 1
+                self._m_in_flight.dec()
+                self._rejected.append((jid, "machine_lost"))
+
+    def _running(self) -> bool:
+        """Some job we awarded is still expected to end (and free its machine)."""
+        now = time.monotonic()
+        return any(self._offers[jid]["due_at"] is None or self._offers[jid]["due_at"] > now for jid in self._issued)
+
+    def _direct_round(self, jt: str, reissues: int) -> str | None:
+        """Awards from the registry ranking; waits for a machine with room, None if there is none."""
+        jid = new_job_id()
+        self._cond.wait_for(lambda: self.registry.best(jt) is not None or not self.registry.known(jt), self.drain_s)
+        auction = self.registry.auction(jid, jt)
+        if auction is None:
+            return None
+        self._offers[jid] = {"auction": auction, "issued_at": now_s(), "machine_id": None, "tried": set(),
+                             "reissues": reissues, "due_at": None}
+        return jid
+
+    def _round(self, jt: str, reissues: int) -> str | None:
+        """One CfP round (or a registry award with `direct`); returns the job id, or None if nobody bid."""
+        if self.direct:
+            jid = self._direct_round(jt, reissues)
+            if jid is not None:
+                return jid
+        static = False
+        first_at = None
+        while True:
+            jid = new_job_id()
+            deadline = self.deadlines.opened(jid, jt, static)
+            auction = Auction(jid, jt, deadline, self.min_bids, self.quiet_s, cond=self._cond)
+            self._auctions[jid] = auction
+            cfp = CfP(job_id=jid, job_type=jt, deadline_s=deadline, issued_at=now_s())
+            first_at = first_at or cfp.issued_at
+            # Close as soon as every free capable machine of the registry (or of the sample) has bid
+            expected = publish_cfp(self.client, cfp, self.registry, self.sample_k, self.sample_policy,
+                                   self._reply_to("proposals"), self.mqtt5)
+            auction.expect(expected or None)
+            self._m_out_cfp.inc()
+            sampled = f" to {len(expected)} machines" if self.sample_k > 0 and expected is not None else ""
+            print(f"\n{self.tag} CFP: job={jid} type={jt} deadline={deadline:.2f}s{sampled}")
+
+            # Wait for proposals with early-stop conditions (deadline, min bids, quiet period); releases _cond
+            auction.wait_closed()
+            del self._auctions[jid]
+            self._m_close_lag.observe(auction.close_lag)
+            retry = self.deadlines.closed(auction)
+            if len(auction):
+                break
+            # Guardrail of adaptive deadlines: a round an adapted deadline closed without a bid goes again with
+            # the static deadline, and again while jobs of ours are running (one of them frees a machine)
+            if not (retry or static and self._running()):
+                print(f"{self.tag} No proposals for job={jid}")
+                return None
+            print(f"{self.tag} No proposals for job={jid} within {deadline:.2f}s, CfP again with {self.deadline_s}s")
+            self.parked += not retry
+            static = True
+        self._offers[jid] = {"auction": auction, "issued_at": first_at, "machine_id": None, "tried": set(),
+                             "reissues": reissues, "due_at": None}
+        return jid
+
+    def _pick(self, jid: str, idx: int) -> dict:
+        """Best bid of the round; with `guard_fast`, the second-best when the next job has the same type and
+        its ETA is within `alpha` of the best (keeps the fastest machine free)."""
+        ranked = self._offers[jid]["auction"].ranked(key=self._eta)
+        jt = self.job_types[idx]
+        same_next = idx + 1 < len(self.job_types) and self.job_types[idx + 1] == jt
+        if self.guard_fast and same_next and len(ranked) >= 2:
+            eta = self._eta or (lambda p: float(p["eta_s"]))
+            best_eta, second_eta = eta(ranked[0]), eta(ranked[1])
+            if second_eta <= self.alpha * best_eta:
+                print(f"{self.tag} GUARD-FAST: picked 2nd best to keep fastest free "
+                      f"(best={best_eta}s, second={second_eta}s, alpha={self.alpha})")
+                return ranked[1]
+        return ranked[0]
+
+    def _award(self, jid: str, winner: dict | None = None) -> bool:
+        """Accept to `winner` (default: best bid not tried yet whose reservation holds); False if none is left."""
+        offer = self._offers[jid]
+        auction = offer["auction"]
+        if winner is None:
+            winner = auction.best(exclude=offer["tried"] | self._down, adjust=self._eta, valid_at=now_s())
+            if winner is None:
+                return False
+        jt = auction.job_type
+        mid = winner["machine_id"]
+        offer["tried"].add(mid)
+        offer["machine_id"] = mid
+        offer["duration"] = float(winner["eta_s"]) - float(winner.get("backlog_s", 0.0))
+        if self.registry is not None:
+            self.registry.note_award(mid, jid, offer["duration"])
+        if self.done_timeout_s > 0:
+            offer["due_at"] = time.monotonic() + float(winner["eta_s"]) * self.done_slack + self.done_timeout_s
+        print(f"{self.tag} WIN: job={jid} type={jt} -> {mid} (eta={winner['eta_s']}s, "
+              f"closed on {auction.close_reason} after {(auction.closed_at - auction.opened_at) * 1000:.1f} ms)")
+        self._issued[jid] = (offer["issued_at"], jt)
+        acc = Accept(jid, jt)
+        props = with_reply(acc, self._reply_to("results"), self.mqtt5)
+        self.client.publish(t_accept(mid), acc.to_msg(), qos=0, properties=props)
+        self._m_out_accept.inc()
+        self._m_award.observe(now_s() - offer["issued_at"])
+        self._m_in_flight.inc()
+        return True
+
+    def _retry_rejected(self) -> None:
+        """Awards rejected and timed-out jobs again: next-best bid of their round, else new rounds."""
+        if self.registry is not None:
+            self._machines_lost(self.registry.expire())
+        now = time.monotonic()
+        for jid in [j for j in self._issued if self._offers[j]["due_at"] is not None
+                    and self._offers[j]["due_at"] <= now]:
+            del self._issued[jid]
+            self.timed_out += 1
+            self._m_in_flight.dec()
+            self._rejected.append((jid, "timeout"))
+        while self._rejected:
+            jid, reason = self._rejected.popleft()
+            offer = self._offers[jid]
+            jt = offer["auction"].job_type
+            if self.registry is not None:
+                self.registry.forget_award(offer["machine_id"], jid)
+            JOBS.labels(agent=self.agent, job_type=jt, outcome=RETRY_OUTCOMES.get(reason, "rejected")).inc()
+            if self._award(jid):
+                self.reawarded += 1
+                continue
+            reissues = offer["reissues"]
+            while reissues < self.max_reissues:
+                reissues += 1
+                self.reissued += 1
+                new = self._round(jt, reissues)
+                if new is not None and self._award(new):
+                    break
+            else:
+                self.lost += 1
+                JOBS.labels(agent=self.agent, job_type=jt, outcome="lost").inc()
+                print(f"{self.tag} job={jid} type={jt}: no machine took it, giving up")
+
+    def _wait_settled(self, until: float | None = None) -> bool:
+        """Waits for the DONE of every awarded job, awarding rejected ones again; False at `until` (monotonic)."""
+        while True:
+            self._retry_rejected()
+            if not self._issued and not self._rejected:
+                return True
+            now = time.monotonic()
+            if until is not None and now >= until:
+                return False
+            wakes = [self._offers[jid]["due_at"] for jid in self._issued if self._offers[jid]["due_at"] is not None]
+            if self.registry is not None and self.registry.next_expiry() is not None:
+                wakes.append(self.registry.next_expiry())
+            if until is not None:
+                wakes.append(until)
+            self._cond.wait(max(0.0, min(wakes) - now) if wakes else None)
+
+    # ---------- Public API ----------
+
+    def run(self) -> dict:
+        """Runs the job list one round at a time; returns makespan/throughput stats."""
+        t_start = now_s()
+        with self._cond:
+            for idx, jt in enumerate(self.job_types):
+                self._retry_rejected()
+                jid = self._round(jt, 0)
+                if jid is None:
+                    self.skipped += 1
+                    JOBS.labels(agent=self.agent, job_type=jt, outcome="skipped").inc()
+                    continue
+                self._award(jid, self._pick(jid, idx))
+                if self.wait_done:
+                    self._wait_settled()
+            # Without wait_done, jobs may still be running, rejected or lost: give them drain_s
+            self._wait_settled(time.monotonic() + self.drain_s)
+            makespan = (max(self._done_at.values()) if self._done_at else now_s()) - t_start
+            return self.stats(makespan)
+
+    def stats(self, makespan: float) -> dict:
+        with self._cond:
+            done = len(self._done_at)
+            return {
+                "jobs": len(self.job_types),
+                "done": done,
+                "skipped": self.skipped,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "failed_over": self.failed_over,
+                "reassigned": self.reassigned,
+                "reawarded": self.reawarded,
+                "reissued": self.reissued,
+                "parked": self.parked,
+                "lost": self.lost + len(self._issued) + len(self._rejected),
+                "makespan_s": makespan,
+                "throughput_jobs_s": done / makespan if makespan > 0 else 0.0,
+                **self.deadlines.stats(),
+            }
+
+
+class PipelinedSupervisor:
+    def __init__(
+        self,
+        client,
+        job_types: list[str],
+        deadline_s: float = 1.0,
+        max_auctions: int = 4,
+        max_jobs: int = 12,
+        min_bids: int = 0,
+        quiet_ms: int = 0,
+        max_reissues: int = 20,
+        per_machine: int = 1,
+        done_timeout_s: float = 10.0,
+        done_slack: float = 1.0,
+        registry=None,
+        direct: bool = False,
+        sample_k: int = 0,
+        sample_policy: str = "random",
+        replies: str = "",
+        mqtt5: bool = False,
+        clock=None,
+        agent: str = "supervisor_opt",
+        tag: str = "[SUP+]",
+        deadlines: DeadlineTracker | None = None,
+        durations: DurationModel | None = None,
+        intake: JobQueue | None = None,
+        dag: JobDag | None = None,
+        preempt: bool = False,
+    ) -> None:
+        self.client = client
+        self.replies = replies
+        self.mqtt5 = mqtt5
+        self._now = clock or now_s             # timestamps, compared with Proposal.at
+        self._mono = clock or time.monotonic   # timers
+        self.per_machine = max(1, per_machine)
+        self.done_timeout_s = done_timeout_s
+        self.done_slack = max(1.0, done_slack)
+        self.registry = registry
+        self.direct = direct and registry is not None
+        self.sample_k = sample_k
+        self.sample_policy = sample_policy
+        self.deadline_s = deadline_s
+        self.deadlines = deadlines or DeadlineTracker(deadline_s, adaptive=False, clock=self._mono, agent=agent)
+        self.durations = durations
+        self.intake = intake
+        self.dag = dag
+        self._sources = [s for s in (dag, intake) if s is not None]
+        self.max_auctions = max(1, max_auctions)
+        self.max_jobs = max(self.max_auctions, max_jobs)
+        self.min_bids = min_bids
+        self.quiet_s = quiet_ms / 1000.0
+        self.max_reissues = max_reissues
+        self.preempt = preempt
+        self.agent = agent
+        self.tag = tag
+
+        self._cond = threading.Condition()   # RLock: shared with the Auction objects
+        self._pending = deque((jt, 0, None) for jt in job_types)   # (job_type, reissues, intake request)
+        self._auctions = {}      # job_id -> (Auction, CfP issued_at, reissues, intake request)
+        self._running = {}       # job_id -> dict(job_type, machine_id, issued_at, awarded_at, due_at,
+                                 #                 auction, tried, reissues, duration (promised), request, priority)
+        self._holding = {}       # machine id -> {job_id: (awarded_at, duration)} of our jobs
+        self._full = set()       # machines holding per_machine of our jobs
+        self._dues = []          # heap of (due_at, job_id); stale once the job is Done or awarded again
+        self._parked = []        # (job_type, reissues, request) waiting for a machine to free up
+        self._down = set()       # machines lost (offline / silent) and not back in the registry
+        self._freed_at = float("-inf")   # last time one of our jobs left a machine (Done, retry, reassigned)
+
+        self.total = len(job_types)
+        self.done = 0
+        self.skipped = 0
+        self.reissued = 0        # new rounds after a Reject or a missing Done (counts toward max_reissues)
+        self.parked = 0          # rounds that waited for a machine of ours to free up (free, not a reissue)
+        self.rejected = 0
+        self.timed_out = 0
+        self.reawarded = 0
+        self.failed_over = 0     # running jobs re-awarded because their machine was lost
+        self.reassigned = 0      # running jobs an idle machine took over (work stealing)
+        self.lost = 0            # given up after max_reissues
+        self.dispatched = 0      # awarded from the registry without a CfP round
+        self.latencies = []      # CfP -> Done (seconds), per completed job
+
+        self._m_award = AWARD_SECONDS.labels(agent=agent)
+        self._m_in_flight = IN_FLIGHT.labels(agent=agent)
+        self._m_open = OPEN_AUCTIONS.labels(agent=agent)
+        self._m_close_lag = CLOSE_LAG.labels(agent=agent)
+
+    # ---------- Message handlers (MQTT thread) ----------
+
+    def on_job(self, req: dict) -> bool:
+        """A JobRequest for the intake; returns False if it was refused."""
+        with self._cond:
+            if not self.intake.offer(req):
+                return False
+            self._cond.notify()
+            return True
+
+    def close_intake(self) -> None:
+        """No more jobs: run() returns once the queued and running ones are through."""
+        with self._cond:
+            self.intake.close()
+            self._cond.notify()
+
+    def on_proposal(self, p: dict) -> None:
+        with self._cond:
+            self.deadlines.on_bid(p["job_id"])
+            entry = self._auctions.get(p["job_id"])
+            if entry is not None:
+                entry[0].add(p)  # notifies the scheduling thread once min_bids is reached
+
+    def on_done(self, d: dict) -> None:
+        with self._cond:
+            job = self._running.pop(d["job_id"], None)
+            if job is None:
+                return
+            self._release(job["machine_id"], d["job_id"])
+            if self.durations is not None:
+                self.durations.observe(job["machine_id"], job["job_type"], job["duration"],
+                                       d["finished_at"] - d["started_at"] - d.get("preempted_s", 0.0))
+            # A machine is free again: give the parked rounds another chance
+            self._pending.extendleft(reversed(self._parked))
+            self._parked.clear()
+            self.done += 1
+            self._settle(job["request"], "done", job["machine_id"])
+            latency = self._now() - job["issued_at"]
+            self.latencies.append(latency)
+            JOBS.labels(agent=self.agent, job_type=job["job_type"], outcome="done").inc()
+            JOB_SECONDS.labels(agent=self.agent, job_type=job["job_type"]).observe(latency)
+            self._m_in_flight.set(len(self._running))
+            self._cond.notify()
+
+    def on_reject(self, r: dict) -> None:
+        with self._cond:
+            job = self._running.get(r["job_id"])
+            if job is None or job["machine_id"] != r["machine_id"]:
+                return
+            self.rejected += 1
+            self._retry(r["job_id"], r["reason"])
+            self._cond.notify()
+
+    def on_reassigned(self, s: dict) -> None:
+        """A queued job of ours moved to an idle machine (work stealing)."""
+        with self._cond:
+            jid = s["job_id"]
+            job = self._running.get(jid)
+            if job is None or job["machine_id"] != s["from_machine"]:
+                return
+            mid, old = s["machine_id"], job["machine_id"]
+            duration = float(s["duration_s"])
+            self._release(old, jid)
+            held = self._holding.setdefault(mid, {})
+            held[jid] = (self._now(), self.durations.duration(mid, job["job_type"], duration)
+                         if self.durations is not None else duration)
+            if len(held) >= self.per_machine:
+                self._full.add(mid)
+            if self.registry is not None:
+                self.registry.forget_award(old, jid)
+                self.registry.note_award(mid, jid, duration)
+            job["machine_id"], job["duration"] = mid, duration
+            if job["due_at"] is not None:
+                job["due_at"] = self._mono() + float(s["eta_s"]) * self.done_slack + self.done_timeout_s
+                heapq.heappush(self._dues, (job["due_at"], jid))
+            self.reassigned += 1
+            print(f"{self.tag} REASSIGNED: job={jid} type={job['job_type']} {old} -> {mid} (eta={s['eta_s']}s)")
+            # The machine it left has room again: give the parked rounds another chance
+            self._pending.extendleft(reversed(self._parked))
+            self._parked.clear()
+            self._cond.notify()
+
+    def on_advert(self, a: dict) -> None:
+        with self._cond:
+            self._machines_lost(self.registry.on_advert(a))
+            if self._down and a.get("online", True):
+                self._down = {m for m in self._down if not self.registry.online(m)}
+            if a.get("online", True) and int(a.get("room", 0)) > 0:
+                # A machine has room: give the parked rounds another chance
+                self._pending.extendleft(reversed(self._parked))
+                self._parked.clear()
+            self._cond.notify()
+
+    # ---------- Scheduling (caller thread, lock held) ----------
+
+    def _load(self, priority: int = 0) -> int:
+        """Jobs in the pipeline (open rounds, running, parked); with preempt only those of at least `priority`."""
+        if not self.preempt or priority <= 0:
+            return len(self._auctions) + len(self._running) + len(self._parked)
+        return (sum(_priority(req) >= priority for _a, _i, _r, req in self._auctions.values())
+                + sum(job["priority"] >= priority for job in self._running.values())
+                + sum(_priority(req) >= priority for _jt, _r, req in self._parked))
+
+    def _preemptable(self, job_type: str, priority: int) -> set[str]:
+        """Machines running one of our jobs of a lower class (able to run `job_type`, with a registry): with
+        preempt they bid on a job of `priority` without room."""
+        if not self.preempt or priority <= 0:
+            return set()
+        mids = {job["machine_id"] for job in self._running.values() if job["priority"] < priority}
+        if self.registry is not None:
+            mids = {mid for mid in mids if self.registry.capable(mid, job_type)}
+        return mids
+
+    def _open_auctions(self) -> None:
+        while len(self._auctions) < self.max_auctions:
+            if self._pending:
+                if self._load(_priority(self._pending[0][2])) >= self.max_jobs:
+                    break
+                jt, reissues, req = self._pending.popleft()
+            else:
+                if self._load() < self.max_jobs:
+                    req = next(filter(None, (s.pop() for s in self._sources)), None)
+                elif (self.preempt and self.intake is not None
+                      and self._load(self.intake.top_priority()) < self.max_jobs):
+                    req = self.intake.pop()   # a higher class than the full pipeline's jobs
+                else:
+                    break
+                if req is None:
+                    break
+                jt, reissues = req["job_type"], 0
+            priority = _priority(req)
+            victims = self._preemptable(jt, priority)
+            jid = new_job_id()
+            issued = self._now()
+            if self.direct:
+                auction = self.registry.auction(jid, jt, cond=self._cond, exclude=self._full)
+                if auction is not None:
+                    self.dispatched += 1
+                    # Already closed: award it now, so that the next ranking counts this job
+                    self._auctions[jid] = (auction, issued, reissues, req)
+                    self._close(jid)
+                    continue
+            if (self.registry is not None and self._running and self.registry.known(jt)
+                    and not self.registry.expected(jt) and not victims):
+                # Every machine able to run it is busy: a CfP would close without a bid, wait for a Done
+                self.parked += 1
+                self._parked.append((jt, reissues, req))
+                continue
+            deadline = self.deadlines.opened(jid, jt)
+            cfp = CfP(job_id=jid, job_type=jt, deadline_s=deadline, issued_at=issued, priority=priority)
+            # The auction exists before the CfP goes out: no bid can arrive for an unknown round
+            auction = Auction(jid, jt, deadline, self.min_bids, self.quiet_s, cond=self._cond, clock=self._mono)
+            self._auctions[jid] = (auction, issued, reissues, req)
+            expected = publish_cfp(self.client, cfp, self.registry, self.sample_k, self.sample_policy,
+                                   self._reply_to("proposals"), self.mqtt5)
+            if victims and expected is not None:
+                # Machines that preempt bid too (a sampled CfP only reached machines with room)
+                expected = expected | victims if self.sample_k <= 0 else None
+            auction.expect(expected)
+            print(f"{self.tag} CFP: job={jid} type={jt} deadline={deadline:.2f}s "
+                  + (f"priority={priority} " if priority else "")
+                  + f"(open={len(self._auctions)} running={len(self._running)})")
+        self._m_open.set(len(self._auctions))
+
+    def _close(self, jid: str) -> None:
+        auction, issued_at, reissues, req = self._auctions.pop(jid)
+        self._m_close_lag.observe(auction.close_lag)
+        if auction.close_reason != "registry":
+            self.deadlines.closed(auction)
+        jt = auction.job_type
+        if not len(auction) and (self._running or self._freed_at >= issued_at):
+            # Not a failed attempt: every capable machine is busy (with a smaller fleet than max_jobs, e.g.
+            # after losing machines, rounds are parked on every Done but one), ours will free one up, or
+            # one of ours freed it while the round was open and nothing is left to wait for: ask again now
+            self.parked += 1
+            if self._running:
+                self._parked.append((jt, reissues, req))
+            else:
+                self._pending.appendleft((jt, reissues, req))
+            return
+        if not len(auction):
+            self.skipped += 1
+            self._settle(req, "skipped")
+            JOBS.labels(agent=self.agent, job_type=jt, outcome="skipped").inc()
+            print(f"{self.tag} No proposals for job={jid} (skipped)")
+            return
+
+        if not self._award(jid, auction, issued_at, reissues, set(), req):
+            # Every bidder was awarded another job meanwhile: wait for one of ours to finish rather than
+            # reopening the round in this same pass, else ask again later
+            if self._running:
+                self.parked += 1
+                self._parked.append((jt, reissues, req))
+            elif reissues >= self.max_reissues:
+                self.skipped += 1
+                self._settle(req, "skipped")
+                JOBS.labels(agent=self.agent, job_type=jt, outcome="skipped").inc()
+                print(f"{self.tag} job={jid} type={jt}: all bidders busy, giving up")
+            else:
+                self.reissued += 1
+                self._pending.appendleft((jt, reissues + 1, req))
+
+    def _award(self, jid: str, auction: Auction, issued_at: float, reissues: int, tried: set,
+               req: dict | None = None) -> bool:
+        """Accepts the best bid of the round not in `tried` from a machine with room; False if none."""
+        now = self._now()
+        corrected = self.per_machine > 1 or self.durations is not None
+        priority = _priority(req)
+        full = self._full
+        if self.preempt and priority > 0:
+            # Full of lower-priority jobs only: the machine preempts one of them
+            full = {mid for mid in full if sum(j in self._running and self._running[j]["priority"] >= priority
+                                               for j in self._holding.get(mid, {})) >= self.per_machine}
+        win = auction.best(exclude=full | tried | self._down if tried or self._down else full,
+                           adjust=self._effective_eta if corrected else None, valid_at=now)
+        if win is None:
+            return False
+        jt = auction.job_type
+        mid = win["machine_id"]
+        tried.add(mid)
+        duration = float(win["eta_s"]) - float(win.get("backlog_s", 0.0))
+        held = self._holding.setdefault(mid, {})
+        held[jid] = (now, self.durations.duration(mid, jt, duration) if self.durations is not None else duration)
+        if len(held) >= self.per_machine:
+            self._full.add(mid)
+        if self.registry is not None:
+            self.registry.note_award(mid, jid, duration)
+        due_at = (self._mono() + float(win["eta_s"]) * self.done_slack + self.done_timeout_s
+                  if self.done_timeout_s > 0 else None)
+        if due_at is not None:
+            heapq.heappush(self._dues, (due_at, jid))
+            if priority > 0:
+                self._delay_dues(mid, priority, duration)
+        self._running[jid] = {"job_type": jt, "machine_id": mid, "issued_at": issued_at, "awarded_at": now,
+                              "due_at": due_at, "auction": auction, "tried": tried, "reissues": reissues,
+                              "duration": duration, "request": req, "priority": priority}
+        acc = Accept(jid, jt, priority=priority)
+        props = with_reply(acc, self._reply_to("results"), self.mqtt5)
+        self.client.publish(t_accept(mid), acc.to_msg(), qos=0, properties=props)
+        self._m_award.observe(now - issued_at)
+        self._m_in_flight.set(len(self._running))
+        print(f"{self.tag} WIN: job={jid} type={jt} -> {mid} (eta={win['eta_s']}s, "
+              f"bids={len(auction)}, closed on {auction.close_reason}, running={len(self._running)})")
+        return True
+
+    def _delay_dues(self, mid: str, priority: int, duration: float) -> None:
+        """A job of `duration` goes ahead of our lower-priority jobs on the machine (its queue, or a preemption):
+        their Done comes that much later (plus their own run time with preempt: a restarted job runs again)."""
+        for j in self._holding.get(mid, {}):
+            job = self._running.get(j)
+            if job is not None and job["priority"] < priority and job["due_at"] is not None:
+                job["due_at"] += (duration + (job["duration"] if self.preempt else 0.0)) * self.done_slack
+                heapq.heappush(self._dues, (job["due_at"], j))
+
+    def _retry(self, jid: str, reason: str) -> None:
+        """The winner will not run the job: next-best bid of its round, else a new CfP."""
+        job = self._running.pop(jid)
+        self._release(job["machine_id"], jid)
+        if self.registry is not None:
+            self.registry.forget_award(job["machine_id"], jid)
+        jt = job["job_type"]
+        JOBS.labels(agent=self.agent, job_type=jt, outcome=RETRY_OUTCOMES.get(reason, "rejected")).inc()
+        what = {"timeout": "TIMEOUT", "machine_lost": "MACHINE LOST"}.get(reason, f"REJECTED ({reason})")
+        print(f"{self.tag} {what}: job={jid} type={jt} by {job['machine_id']}")
+        # Something changed on the machines: give the parked rounds another chance
+        self._pending.extendleft(reversed(self._parked))
+        self._parked.clear()
+        if self._award(jid, job["auction"], job["issued_at"], job["reissues"], job["tried"], job["request"]):
+            self.reawarded += 1
+        elif job["reissues"] < self.max_reissues:
+            self.reissued += 1
+            self._pending.appendleft((jt, job["reissues"] + 1, job["request"]))
+        else:
+            self.lost += 1
+            self._settle(job["request"], "lost")
+            JOBS.labels(agent=self.agent, job_type=jt, outcome="lost").inc()
+            print(f"{self.tag} job={jid} type={jt}: no machine took it, giving up")
+        self._m_in_flight.set(len(self._running))
+
+    def _machines_lost(self, mids: list[str]) -> None:
+        """Re-awards the running jobs of machines that went offline or silent."""
+        for mid in mids:
+            self._down.add(mid)
+            jobs = [jid for jid, job in self._running.items() if job["machine_id"] == mid]
+            print(f"{self.tag} {mid} lost with {len(jobs)} running job(s)")
+            for jid in jobs:
+                self.failed_over += 1
+                self._retry(jid, "machine_lost")
+            self._holding.pop(mid, None)
+            self._full.discard(mid)
+
+    def _release(self, mid: str, jid: str) -> None:
+        self._freed_at = self._now()
+        held = self._holding.get(mid, {})
+        held.pop(jid, None)
+        if len(held) < self.per_machine:
+            self._full.discard(mid)
+
+    def _settle(self, req: dict | None, outcome: str, machine_id: str = "") -> None:
+        if req is not None:
+            (self.dag if "node" in req else self.intake).finished(req, outcome, machine_id)
+
+    def _next_due(self) -> float | None:
+        """Earliest DONE timeout of a running job (drops the stale heap entries on the way)."""
+        while self._dues:
+            due_at, jid = self._dues[0]
+            job = self._running.get(jid)
+            if job is not None and job["due_at"] == due_at:
+                return due_at
+            heapq.heappop(self._dues)
+        return None
+
+    def _reply_to(self, kind: str) -> str:
+        return t_replies(self.replies, kind) if self.replies else ""
+
+    def _effective_eta(self, p: dict) -> float:
+        # Jobs we awarded to this machine after it sent the bid are not in its backlog yet
+        late = sum(d for t, d in self._holding.get(p["machine_id"], {}).values() if t > p["at"])
+        eta = self.durations.eta(p) if self.durations is not None else float(p["eta_s"])
+        return eta + late
+
+    # ---------- Public API ----------
+
+    def finished(self) -> bool:
+        return (not (self._pending or self._auctions or self._running or self._parked)
+                and all(s.drained() for s in self._sources))
+
+    def step(self) -> float | None:
+        """One scheduling pass (lock held): opens, closes and awards rounds, handles DONE timeouts.
+        Returns the time of the next round timer or DONE timeout (None if there is none)."""
+        if self.registry is not None:
+            self._machines_lost(self.registry.expire())
+        self._open_auctions()
+        for jid, (auction, _issued, _reissues, _req) in list(self._auctions.items()):
+            if auction.try_close():
+                self._close(jid)
+        now = self._mono()
+        due = self._next_due()
+        while due is not None and due <= now:
+            self.timed_out += 1
+            self._retry(heapq.heappop(self._dues)[1], "timeout")
+            due = self._next_due()
+        self._open_auctions()
+        wakes = [a.wakeup_at() for a, _i, _r, _q in self._auctions.values()]
+        due = self._next_due()
+        if due is not None:
+            wakes.append(due)
+        beat = self.registry.next_expiry() if self.registry is not None else None
+        if beat is not None:
+            wakes.append(beat)
+        return min(wakes) if wakes else None
+
+    def run(self) -> dict:
+        """Blocks until every job is Done or skipped (and the intake closed); returns makespan/throughput stats."""
+        t_start = self._now()
+        with self._cond:
+            while not self.finished():
+                wake = self.step()
+                self._cond.wait(IDLE_WAIT_S if wake is None else min(IDLE_WAIT_S, max(0.0, wake - self._mono())))
+        return self.stats(self._now() - t_start)
+
+    def stats(self, makespan: float) -> dict:
+        return {
+            "jobs": (self.total + (self.dag.total if self.dag is not None else 0)
+                     + (self.intake.admitted if self.intake is not None else 0)),
+            "done": self.done,
+            "skipped": self.skipped,
+            "reissued": self.reissued,
+            "parked": self.parked,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "reawarded": self.reawarded,
+            "failed_over": self.failed_over,
+            "reassigned": self.reassigned,
+            "lost": self.lost,
+            "dispatched": self.dispatched if self.direct else None,
+            "makespan_s": makespan,
+            "throughput_jobs_s": self.done / makespan if makespan > 0 else 0.0,
+            "mean_latency_s": sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+            **self.deadlines.stats(),
+            **(self.dag.stats() if self.dag is not None else {}),
+            **(self.intake.stats() if self.intake is not None else {}),
+        }
+
+
+class BatchSupervisor:
+    def __init__(
+        self,
+        client,
+        job_types: list[str],
+        deadline_s: float = 1.0,
+        batch_size: int = 50,
+        min_bids: int = 0,
+        strategy=None,
+        due_s: list | None = None,
+        max_reissues: int = 20,
+        done_timeout_s: float = 10.0,
+        done_slack: float = 1.0,
+        registry=None,
+        direct: bool = False,
+        replies: str = "",
+        mqtt5: bool = False,
+        agent: str = "supervisor_opt",
+        tag: str = "[SUP+]",
+    ) -> None:
+        self.client = client
+        self.replies = replies
+        self.mqtt5 = mqtt5
+        self.job_types = job_types
+        self.max_reissues = max_reissues
+        self.done_timeout_s = done_timeout_s
+        self.done_slack = max(1.0, done_slack)
+        self.registry = registry
+        self.direct = direct and registry is not None
+        self.strategy = strategy or HungarianStrategy()
+        self.due_s = due_s or [None] * len(job_types)
+        self.deadline_s = deadline_s
+        self.batch_size = max(1, batch_size)
+        self.min_bids = min_bids
+        self.agent = agent
+        self.tag = tag
+
+        self._cond = threading.Condition()
+        self._batch_id = None
+        self._bids = {}          # machine_id -> ({job_type: eta}, slots)
+        self._queues = {}        # lane (machine_id or machine_id#slot) -> deque of (job_id, job_type)
+        self._lane_etas = {}     # lane -> {job_type: eta} of the current plan
+        self._running = {}       # job_id -> dict(job_type, lane, issued_at, due_at)
+        self._dues = {}          # job_id -> due time of the current block
+        self._reissues = {}      # job_id -> Rejects / DONE timeouts of the job so far (current block)
+        self._leftover = []      # (job_type, due, reissues) taken out of the plan by a Reject or a DONE timeout
+
+        self.total = len(job_types)
+        self.done = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed_over = 0
+        self.reissued = 0
+        self.lost = 0            # given up after max_reissues Rejects / DONE timeouts
+        self.solver_s = 0.0
+        self.latencies = []
+
+        self._m_award = AWARD_SECONDS.labels(agent=agent)
+        self._m_in_flight = IN_FLIGHT.labels(agent=agent)
+
+    # ---------- Message handlers (MQTT thread) ----------
+
+    def on_proposal(self, _p: dict) -> None:
+        pass  # single-job proposals are not used in batch mode
+
+    def on_batch_proposal(self, p: dict) -> None:
+        with self._cond:
+            if p["batch_id"] != self._batch_id:
+                return
+            self._bids[p["machine_id"]] = (p["etas"], int(p.get("slots", 1)))
+            if self.min_bids > 0 and len(self._bids) >= self.min_bids:
+                self._cond.notify_all()
+
+    def on_done(self, d: dict) -> None:
+        with self._cond:
+            job = self._running.pop(d["job_id"], None)
+            if job is None:
+                return
+            self.done += 1
+            latency = now_s() - job["issued_at"]
+            self.latencies.append(latency)
+            JOBS.labels(agent=self.agent, job_type=job["job_type"], outcome="done").inc()
+            JOB_SECONDS.labels(agent=self.agent, job_type=job["job_type"]).observe(latency)
+            self._dispatch_next(job["lane"], job["issued_at"])
+            self._m_in_flight.set(len(self._running))
+            self._cond.notify_all()
+
+    def on_reject(self, r: dict) -> None:
+        with self._cond:
+            job = self._running.get(r["job_id"])
+            if job is None or job["lane"].split("#")[0] != r["machine_id"]:
+                return
+            self.rejected += 1
+            self._drop_lane(r["job_id"], r["reason"])
+            self._cond.notify_all()
+
+    def on_advert(self, a: dict) -> None:
+        with self._cond:
+            if self._machines_lost(self.registry.on_advert(a)):
+                self._cond.notify_all()
+
+    # ---------- Dispatch (lock held) ----------
+
+    def _machines_lost(self, mids: list[str]) -> bool:
+        """Takes the lanes of machines that went offline or silent out of the plan."""
+        lost = set(mids)
+        for jid in [j for j, job in self._running.items() if job["lane"].split("#")[0] in lost]:
+            self.failed_over += 1
+            self._drop_lane(jid, "machine_lost")
+        return bool(lost)
+
+    def _drop_lane(self, jid: str, reason: str) -> None:
+        """The machine will not run this job: it and the rest of its lane are planned again later (the job
+        itself at most max_reissues times)."""
+        job = self._running.pop(jid)
+        jt = job["job_type"]
+        queue = self._queues.pop(job["lane"], deque())
+        reissues = self._reissues.get(jid, 0)
+        jobs = list(queue) if reissues >= self.max_reissues else [(jid, jt)] + list(queue)
+        self._leftover.extend((t, self._dues.get(j), self._reissues.get(j, 0) + (j == jid)) for j, t in jobs)
+        JOBS.labels(agent=self.agent, job_type=jt, outcome=RETRY_OUTCOMES.get(reason, "rejected")).inc()
+        what = {"timeout": "TIMEOUT", "machine_lost": "MACHINE LOST"}.get(reason, f"REJECTED ({reason})")
+        print(f"{self.tag} {what}: job={jid} by {job['lane']}, {len(jobs)} job(s) back to planning")
+        if reissues >= self.max_reissues:
+            self.lost += 1
+            JOBS.labels(agent=self.agent, job_type=jt, outcome="lost").inc()
+            print(f"{self.tag} job={jid} type={jt}: no machine took it, giving up")
+        self._m_in_flight.set(len(self._running))
+
+    def _reply_to(self, kind: str) -> str:
+        return t_replies(self.replies, kind) if self.replies else ""
+
+    def _dispatch_next(self, lane: str, issued_at: float) -> None:
+        queue = self._queues.get(lane)
+        if not queue:
+            return
+        jid, jt = queue.popleft()
+        mid = lane.split("#")[0]
+        eta = float(self._lane_etas.get(lane, {}).get(jt, 0.0))
+        due_at = time.monotonic() + eta * self.done_slack + self.done_timeout_s if self.done_timeout_s > 0 else None
+        self._running[jid] = {"job_type": jt, "lane": lane, "issued_at": issued_at, "due_at": due_at}
+        if self.registry is not None:
+            self.registry.note_award(mid, jid, eta)
+        acc = Accept(jid, jt)
+        props = with_reply(acc, self._reply_to("results"), self.mqtt5)
+        self.client.publish(t_accept(mid), acc.to_msg(), qos=0, properties=props)
+        print(f"{self.tag} ASSIGN: job={jid} type={jt} -> {mid} ({len(queue)} more queued)")
+
+    def _run_block(self, block: list[str], due_s: list, offset: float, last_try: bool = True,
+                   reissues: list | None = None) -> None:
+        """Plans and runs one block starting `offset` s into the run (due times are run-relative);
+        without `last_try`, jobs nobody bid for go to the leftover."""
+        reissues = reissues or [0] * len(block)
+        jobs = [{"job_id": new_job_id(), "job_type": jt} for jt in block]
+        self._dues = {job["job_id"]: due for job, due in zip(jobs, due_s)}
+        self._reissues = {job["job_id"]: n for job, n in zip(jobs, reissues)}
+        # The plan works relative to the block
+        dues = [None if d is None else d - offset for d in due_s]
+        issued = now_s()
+        with self._cond:
+            self._bids = self.registry.batch_bids(block) if self.direct else {}
+            if self._bids:
+                print(f"{self.tag} BATCH from registry: jobs={len(jobs)} idle machines={len(self._bids)}")
+            else:
+                self._batch_id = new_job_id()
+                cfp = BatchCfP(batch_id=self._batch_id, jobs=jobs, deadline_s=self.deadline_s, issued_at=issued)
+                props = with_reply(cfp, self._reply_to("batch_proposals"), self.mqtt5)
+                self.client.publish(t_cfp_batch(), cfp.to_msg(), qos=0, properties=props)
+                print(f"{self.tag} BATCH CFP: batch={self._batch_id} jobs={len(jobs)} deadline={self.deadline_s:.2f}s")
+                self._cond.wait_for(lambda: self.min_bids > 0 and len(self._bids) >= self.min_bids, self.deadline_s)
+                self._batch_id = None
+            bids = {}
+            for mid, (etas, slots) in self._bids.items():
+                for s in range(slots):
+                    bids[mid if slots == 1 else f"{mid}#{s}"] = etas
+
+            t0 = time.perf_counter()
+            plan = self.strategy.plan(block, bids, dues)
+            self.solver_s += time.perf_counter() - t0
+            self._queues = {}
+            self._lane_etas = bids
+            unplanned = set(range(len(jobs)))
+            for lane, idxs in plan.items():
+                self._queues[lane] = deque((jobs[j]["job_id"], jobs[j]["job_type"]) for j in idxs)
+                unplanned.difference_update(idxs)
+            if unplanned and not last_try:
+                self._leftover.extend((jobs[j]["job_type"], due_s[j], reissues[j]) for j in sorted(unplanned))
+                print(f"{self.tag} {len(unplanned)} job(s) of batch without a capable bidder (planned again later)")
+            elif unplanned:
+                for j in unplanned:
+                    self.skipped += 1
+                    JOBS.labels(agent=self.agent, job_type=jobs[j]["job_type"], outcome="skipped").inc()
+                print(f"{self.tag} {len(unplanned)} job(s) of batch without a capable bidder (skipped)")
+            print(f"{self.tag} PLAN ({self.strategy.name}): {len(self._bids)} bidders, {len(jobs) - len(unplanned)} jobs on {len(plan)} lanes, "
+                  f"solver {(time.perf_counter() - t0) * 1000:.1f} ms")
+            self._m_award.observe(now_s() - issued)
+            for lane in plan:
+                self._dispatch_next(lane, issued)
+            self._m_in_flight.set(len(self._running))
+            while self._running:
+                now = time.monotonic()
+                for jid in [j for j, job in self._running.items() if job["due_at"] is not None and job["due_at"] <= now]:
+                    self.timed_out += 1
+                    self._drop_lane(jid, "timeout")
+                if self.registry is not None:
+                    self._machines_lost(self.registry.expire())
+                wakes = [job["due_at"] for job in self._running.values() if job["due_at"] is not None]
+                if self.registry is not None and self.registry.next_expiry() is not None:
+                    wakes.append(self.registry.next_expiry())
+                if self._running:
+                    self._cond.wait(max(0.0, min(wakes) - now) if wakes else None)
+
+    # ---------- Public API ----------
+
+    def run(self) -> dict:
+        """Runs the job list block by block; returns makespan/throughput stats."""
+        t_start = now_s()
+        for start in range(0, len(self.job_types), self.batch_size):
+            end = start + self.batch_size
+            self._run_block(self.job_types[start:end], self.due_s[start:end], now_s() - t_start, last_try=False)
+        # Jobs rejected, timed out or without bidders: plan them again (each job at most max_reissues times
+        # after a Reject or a DONE timeout, see _drop_lane)
+        rounds = 0
+        while self._leftover:
+            if rounds:
+                time.sleep(self.deadline_s)   # every machine was busy: give them time to free up
+            rounds += 1
+            block, self._leftover = self._leftover, []
+            self.reissued += len(block)
+            self._run_block([jt for jt, _d, _n in block], [d for _jt, d, _n in block], now_s() - t_start,
+                            last_try=rounds >= self.max_reissues, reissues=[n for _jt, _d, n in block])
+        makespan = now_s() - t_start
+        return {
+            "jobs": self.total,
+            "done": self.done,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "failed_over": self.failed_over,
+            "reissued": self.reissued,
+            "lost": self.lost,
+            "makespan_s": makespan,
+            "throughput_jobs_s": self.done / makespan if makespan > 0 else 0.0,
+            "mean_latency_s": sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+            "solver_ms": self.solver_s * 1000,
+        }
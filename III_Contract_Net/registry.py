@@ -0,0 +1,389 @@
+import argparse
+import bisect
+import random
+import threading
+import time
+
+from auction import Auction
+from common import Proposal, jdump, jload, now_s
+
+"""
+Machine registry built from the retained Adverts on lab/cnp/registry/<machine_id>.
+
+- on_advert() keeps the latest state of every online machine (an offline Advert, e.g. the LWT of
+  a crashed machine, removes it) and, per job type, the machines sorted by their run time: all of
+  them, and those with room (updated on every Advert and award), so that lookups on a busy fleet
+  do not walk the full machines. The offline Advert of a fleet host (fleet.py, one connection and
+  so one LWT for many machines) removes all of its machines, and its online Advert those that have
+  not advertised since (left over from a larger fleet); their Adverts are ignored while it is offline.
+  on_advert() returns the machines it took offline, so the supervisor can re-auction their jobs.
+- Heartbeats: an Advert with heartbeat_s > 0 (machine.py / fleet.py --heartbeat-s) promises another one
+  within that period; expire() takes offline the machines (or fleet hosts, with their machines) not heard
+  from for HEARTBEAT_MISSES periods: a hung machine whose LWT waits for the keepalive.
+- A machine's ETA for a job = advertised backlog (minus the time since the Advert) + Accepts we sent
+  after that Advert + its run time. best() walks the per-type list in run-time order and stops as
+  soon as the next run time alone cannot beat the best ETA found, so it is O(k) for the k fastest
+  machines instead of a CfP round.
+- note_award() counts an Accept against the machine until an Advert newer than the Accept arrives.
+- expected() is the set of machines that should answer a CfP (online, capable, with room): a round
+  can close as soon as all of them bid.
+- sample() picks the k machines a sampled CfP goes to (power of k choices): uniformly among the
+  capable machines with room ("random", O(k) draws), or the k best-ranked ones ("least-loaded").
+- auction() turns the ranking into an already closed Auction, so the supervisors award from the
+  registry ("direct dispatch") with the same code as after a CfP round; a Reject moves the job to
+  the next machine of the ranking.
+
+Wall-clock timestamps (Advert.at, award times) are compared, as for the Proposal ages; `clock`
+replaces the wall clock (and the timers of the Auctions it builds) with a virtual one (sim.py).
+"""
+
+
+SAMPLE_POLICIES = ("random", "least-loaded")
+AUCTION_DEPTH = 8        # pseudo-proposals of a registry auction: the winner and the next machines for Rejects
+HEARTBEAT_MISSES = 3     # heartbeat periods without an Advert before a machine counts as lost
+
+
+class Registry:
+    def __init__(self, cond: threading.Condition | None = None, clock=None) -> None:
+        self.cond = cond or threading.Condition()
+        self._now = clock or now_s
+        self._mono = clock or time.monotonic
+        self._machines = {}      # machine_id -> latest Advert (dict)
+        self._by_type = {}       # job_type -> sorted [(duration, machine_id)]
+        self._free = {}          # job_type -> sorted [(duration, machine_id)] of the machines with room
+        self._with_room = set()  # machines in the _free lists
+        self._awards = {}        # machine_id -> {job_id: (awarded_at, duration)} not in an Advert yet
+        self._hosts = {}         # fleet host -> its latest Advert (dict)
+        self._expires = {}       # machine / fleet host sending heartbeats -> time.monotonic() it is lost at
+        self._orphans = {}       # fleet host -> {machine_id: Advert} of its machines while it is offline
+
+    # ---------- Updates (MQTT thread) ----------
+
+    def on_advert(self, a: dict) -> list[str]:
+        """Applies an Advert; returns the machines it took offline."""
+        with self.cond:
+            mid = a["machine_id"]
+            host = a.get("host", "")
+            online = a.get("online", True)
+            beat = float(a.get("heartbeat_s", 0.0))
+            if online and beat > 0:
+                self._expires[mid] = self._mono() + HEARTBEAT_MISSES * beat
+            else:
+                self._expires.pop(mid, None)
+            if host and host == mid:
+                self._hosts[host] = a
+                lost = [m for m, ma in self._machines.items() if ma.get("host") == host and self._stale(ma)]
+                orphans = self._orphans.setdefault(host, {})
+                for m in lost:
+                    orphans[m] = self._machines[m]
+                    self._drop(m)
+                    self._awards.pop(m, None)
+                if online:
+                    # Back from a missed heartbeat (same start): its machines' Adverts still hold
+                    for ma in self._orphans.pop(host).values():
+                        if not self._stale(ma) and ma["machine_id"] not in self._machines:
+                            self._machines[ma["machine_id"]] = ma
+                            self._index(self._by_type, ma, add=True)
+                            self._update_room(ma["machine_id"])
+                self.cond.notify_all()
+                return lost
+            lost = [mid] if self._drop(mid) and (not online or self._stale(a)) else []
+            if not online or self._stale(a):
+                self._awards.pop(mid, None)
+                self.cond.notify_all()
+                return lost
+            self._machines[mid] = a
+            self._index(self._by_type, a, add=True)
+            awards = self._awards.get(mid)
+            if awards:
+                for jid in [j for j, (t, _d) in awards.items() if t <= float(a["at"])]:
+                    del awards[jid]
+            self._update_room(mid)
+            self.cond.notify_all()
+            return []
+
+    def expire(self) -> list[str]:
+        """Takes offline the machines and fleet hosts whose heartbeats stopped; returns the machines."""
+        with self.cond:
+            now = self._mono()
+            lost = []
+            for mid in [m for m, at in self._expires.items() if at <= now]:
+                old = self._hosts.get(mid) if mid in self._hosts else self._machines.get(mid)
+                if old is not None:
+                    print(f"[REGISTRY] {mid} silent for {HEARTBEAT_MISSES} heartbeats: offline")
+                    lost += self.on_advert(dict(old, online=False))
+                self._expires.pop(mid, None)
+            return lost
+
+    def next_expiry(self) -> float | None:
+        """time.monotonic() (or clock) of the next heartbeat deadline, None without heartbeats."""
+        with self.cond:
+            return min(self._expires.values(), default=None)
+
+    def _stale(self, a: dict) -> bool:
+        """Advert of a machine whose fleet host is offline, or that predates the host's (re)start."""
+        h = self._hosts.get(a.get("host", ""))
+        return h is not None and (not h.get("online", True) or float(a["at"]) < float(h["at"]))
+
+    def _drop(self, mid: str) -> bool:
+        old = self._machines.pop(mid, None)
+        if old is not None:
+            self._index(self._by_type, old, add=False)
+            if mid in self._with_room:
+                self._with_room.discard(mid)
+                self._index(self._free, old, add=False)
+        return old is not None
+
+    def note_award(self, machine_id: str, job_id: str, duration: float) -> None:
+        with self.cond:
+            self._awards.setdefault(machine_id, {})[job_id] = (self._now(), duration)
+            self._update_room(machine_id)
+
+    def forget_award(self, machine_id: str, job_id: str) -> None:
+        """The machine rejected the job (or it timed out): stop counting it."""
+        with self.cond:
+            self._awards.get(machine_id, {}).pop(job_id, None)
+            self._update_room(machine_id)
+
+    @staticmethod
+    def _index(lists: dict, a: dict, add: bool) -> None:
+        mid = a["machine_id"]
+        for jt, d in a["caps"].items():
+            if add:
+                bisect.insort(lists.setdefault(jt, []), (float(d), mid))
+            else:
+                entries = lists[jt]
+                entries.pop(bisect.bisect_left(entries, (float(d), mid)))
+
+    def _update_room(self, mid: str) -> None:
+        """Moves the machine in or out of the _free lists when its room changes."""
+        a = self._machines.get(mid)
+        if a is None:
+            return
+        has_room = self._room(mid) > 0
+        if has_room != (mid in self._with_room):
+            (self._with_room.add if has_room else self._with_room.discard)(mid)
+            self._index(self._free, a, add=has_room)
+
+    # ---------- Queries ----------
+
+    def _room(self, mid: str) -> int:
+        return int(self._machines[mid]["room"]) - len(self._awards.get(mid, ()))
+
+    def _start_delay(self, mid: str, now: float) -> float:
+        a = self._machines[mid]
+        left = max(0.0, float(a["backlog_s"]) - (now - float(a["at"])))
+        slots = max(1, int(a["slots"]))
+        return left + sum(d for _t, d in self._awards.get(mid, {}).values()) / slots
+
+    def mean_duration(self, job_type: str) -> float | None:
+        """Mean advertised run time of the online machines able to run the job type (None if there is none)."""
+        with self.cond:
+            entries = self._by_type.get(job_type)
+            return sum(d for d, _mid in entries) / len(entries) if entries else None
+
+    def online(self, machine_id: str) -> bool:
+        with self.cond:
+            return machine_id in self._machines
+
+    def capable(self, machine_id: str, job_type: str) -> bool:
+        """True if the machine is online and advertised this job type."""
+        with self.cond:
+            return job_type in self._machines.get(machine_id, {}).get("caps", ())
+
+    def known(self, job_type: str) -> bool:
+        """True if an online machine advertised this job type."""
+        with self.cond:
+            return bool(self._by_type.get(job_type))
+
+    def expected(self, job_type: str, among=None) -> set[str]:
+        """Online machines able to run the job type that have room, i.e. that would bid on its CfP
+        (only those of `among` if given: the machines a sampled CfP went to)."""
+        with self.cond:
+            if among is not None:
+                return {mid for mid in among if mid in self._with_room and job_type in self._machines[mid]["caps"]}
+            return {mid for _d, mid in self._free.get(job_type, ())}
+
+    def ranked(self, job_type: str, exclude=(), limit: int | None = None) -> list[tuple[float, str]]:
+        """[(eta, machine_id)] of the machines with room, lowest ETA first (the `limit` best ones)."""
+        with self.cond:
+            now = self._now()
+            out = []
+            for d, mid in self._free.get(job_type, ()):
+                if limit is not None and len(out) >= limit and d >= out[-1][0]:
+                    break  # run time alone is above the limit-th ETA: the rest cannot enter
+                if mid in exclude:
+                    continue
+                bisect.insort(out, (self._start_delay(mid, now) + d, mid))
+                if limit is not None:
+                    del out[limit:]
+            return out
+
+    def best(self, job_type: str, exclude=()) -> tuple[float, str] | None:
+        ranked = self.ranked(job_type, exclude, limit=1)
+        return ranked[0] if ranked else None
+
+    def sample(self, job_type: str, k: int, policy: str = "random", rng=random) -> list[str]:
+        """Up to k machines able to run the job type to send its CfP to (machines with room first)."""
+        with self.cond:
+            if policy == "least-loaded":
+                picked = [mid for _eta, mid in self.ranked(job_type, limit=k)]
+                if picked:
+                    return picked
+            pool = self._free.get(job_type)
+            if not pool:
+                # Nobody has room: they all bid late or not at all, ask k of them anyway
+                pool = self._by_type.get(job_type, [])
+            return [mid for _d, mid in (pool if len(pool) <= k else rng.sample(pool, k))]
+
+    def auction(self, job_id: str, job_type: str, cond: threading.Condition | None = None, exclude=(),
+                limit: int | None = AUCTION_DEPTH) -> Auction | None:
+        """An already closed Auction holding one pseudo-proposal per machine with room, for the `limit` best
+        machines not in `exclude` (None if there is none)."""
+        with self.cond:
+            ranked = self.ranked(job_type, exclude, limit)
+            if not ranked:
+                return None
+            at = self._now()
+            auction = Auction(job_id, job_type, 0.0, cond=cond, clock=self._mono)
+            for eta, mid in ranked:
+                d = float(self._machines[mid]["caps"][job_type])
+                auction.add({"job_id": job_id, "job_type": job_type, "machine_id": mid, "eta_s": round(eta, 3),
+                             "at": at, "backlog_s": round(eta - d, 3)})
+            auction.try_close()
+            auction.close_reason = "registry"
+            return auction
+
+    def batch_bids(self, job_types: list[str]) -> dict:
+        """{machine_id: ({job_type: eta}, slots)} of the idle machines, like the answers to a batch CfP."""
+        with self.cond:
+            wanted = set(job_types)
+            out = {}
+            for mid, a in self._machines.items():
+                if a["busy"] or a["queued"] or self._awards.get(mid):
+                    continue
+                etas = {jt: float(d) for jt, d in a["caps"].items() if jt in wanted}
+                if etas:
+                    out[mid] = (etas, int(a["slots"]))
+            return out
+
+    def __len__(self) -> int:
+        return len(self._machines)
+
+
+# ---------- Benchmark ----------
+
+def bench(machines: int, lookups: int, seed: int = 5) -> None:
+    """best() on the per-type index vs a full scan of the machines."""
+    rng = random.Random(seed)
+    types = ["cut", "drill", "paint", "weld", "sand"]
+    reg = Registry()
+    t = now_s()
+    for k in range(machines):
+        reg.on_advert({"machine_id": f"M{k:04d}", "caps": {jt: round(rng.uniform(1.0, 5.0), 1) for jt in types},
+                       "slots": 1, "queue_cap": 2, "busy": 0, "queued": 0, "room": 3,
+                       "backlog_s": round(rng.choice([0.0, 0.0, rng.uniform(0.0, 3.0)]), 3), "online": True, "at": t})
+
+    def scan(jt):
+        now = now_s()
+        return min((reg._start_delay(m, now) + float(a["caps"][jt]), m) for m, a in reg._machines.items())
+
+    queries = [rng.choice(types) for _ in range(lookups)]
+    t0 = time.perf_counter()
+    for jt in queries:
+        scan(jt)
+    t1 = time.perf_counter()
+    for jt in queries:
+        reg.best(jt)
+    t2 = time.perf_counter()
+    print(f"{machines} machines: full scan {(t1 - t0) / lookups * 1e6:.1f} us/lookup, "
+          f"index {(t2 - t1) / lookups * 1e6:.1f} us/lookup")
+
+
+def fanout_bench(sizes: list[int], k: int = 3, jobs: int = 2000, cpu_jobs: int = 200, load: float = 0.8,
+                 seed: int = 11) -> None:
+    """Broadcast CfP vs sampled CfP (k random / k least-loaded) on growing fleets.
+
+    Machines know 3 of 5 job types (1-5 s) and queue their jobs; jobs arrive as a Poisson stream at
+    `load` x fleet capacity and go to the lowest ETA among the machines that got the CfP. Messages are
+    broker deliveries per job (CfPs + proposals + Accept); the supervisor CPU is the real ingest path
+    (jload + Auction.add per proposal, best(), registry.sample()) over the first `cpu_jobs` jobs.
+    """
+    types = ["cut", "drill", "paint", "weld", "sand"]
+    print(f"{'machines':>8s} {'mode':14s} {'msgs/job':>9s} {'CPU us/job':>11s} {'mean flow':>10s} {'makespan':>9s}")
+    for n in sizes:
+        rng = random.Random(seed)
+        caps = [{jt: round(rng.uniform(1.0, 5.0), 1) for jt in rng.sample(types, 3)} for _ in range(n)]
+        reg = Registry()
+        t = now_s()
+        for m, c in enumerate(caps):
+            reg.on_advert({"machine_id": f"M{m:05d}", "caps": c, "slots": 1, "queue_cap": 4, "busy": 0, "queued": 0,
+                           "room": 5, "backlog_s": 0.0, "online": True, "at": t})
+        capable = {jt: [m for m in range(n) if jt in caps[m]] for jt in types}
+        rate = load * n / 3.0                       # mean run time is about 3 s
+        arrivals, at = [], 0.0
+        for _ in range(jobs):
+            at += rng.expovariate(rate)
+            arrivals.append((at, rng.choice(types)))
+
+        for mode in ("broadcast", f"random-{k}", f"least-loaded-{k}"):
+            srng = random.Random(seed + 1)
+            ready = [0.0] * n
+            flow, end, msgs, cpu = 0.0, 0.0, 0, 0.0
+            for j, (a, jt) in enumerate(arrivals):
+                pool = capable[jt]
+                if mode != "broadcast" and j < cpu_jobs:
+                    t0 = time.perf_counter()
+                    reg.sample(jt, k, mode.rsplit("-", 1)[0], srng)
+                    cpu += time.perf_counter() - t0
+                if mode == "broadcast":
+                    targets = pool
+                elif mode.startswith("random"):
+                    # registry.sample() with the room test of the simulated state (idle machines first)
+                    targets, seen = [], set()
+                    for _ in range(4 * k):
+                        m = pool[srng.randrange(len(pool))]
+                        if m not in seen:
+                            seen.add(m)
+                            if ready[m] <= a:
+                                targets.append(m)
+                                if len(targets) == k:
+                                    break
+                    targets = targets or list(seen)[:k]
+                else:
+                    targets = sorted(pool, key=lambda m: max(ready[m], a) + caps[m][jt])[:k]
+                msgs += 2 * len(targets) + 1
+                bids = [(max(ready[m], a) - a + caps[m][jt], m) for m in targets]
+                if j < cpu_jobs:
+                    payloads = [jdump(Proposal(f"j{j}", jt, f"M{m:05d}", round(eta, 3), a,
+                                               round(eta - caps[m][jt], 3)).__dict__).encode() for eta, m in bids]
+                    t0 = time.perf_counter()
+                    auction = Auction(f"j{j}", jt, 1.0)
+                    for payload in payloads:
+                        auction.add(jload(payload))
+                    auction.best()
+                    cpu += time.perf_counter() - t0
+                eta, m = min(bids)
+                ready[m] = a + eta
+                flow += eta
+                end = max(end, ready[m])
+            print(f"{n:8d} {mode:14s} {msgs / jobs:9.1f} {cpu / min(jobs, cpu_jobs) * 1e6:11.1f} "
+                  f"{flow / jobs:9.2f}s {end:8.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Registry lookup and CfP fan-out benchmarks")
+    ap.add_argument("--bench", default="12,100,1000", help="Comma-separated machine counts (lookup benchmark)")
+    ap.add_argument("--lookups", type=int, default=20000)
+    ap.add_argument("--fanout", default="", help="Comma-separated machine counts: broadcast vs sampled CfP")
+    ap.add_argument("--k", type=int, default=3, help="Machines per sampled CfP (with --fanout)")
+    args = ap.parse_args()
+    if args.fanout:
+        fanout_bench([int(n) for n in args.fanout.split(",")], args.k)
+        return
+    for n in args.bench.split(","):
+        bench(int(n), args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -30,8 +30,24 @@ PORT="${PORT:-1883}"
 DEADLINE="${DEADLINE:-0.8}"
 WAIT_DONE="${WAIT_DONE:---wait-done}"
 
+# Machine job queue: accepted jobs that may wait behind the running one (0 = bid only while idle)
+QUEUE_CAP="${QUEUE_CAP:-0}"
+# Jobs a machine runs in parallel
+SLOTS="${SLOTS:-1}"
+# Bids reserve room until the CfP deadline + RESERVE_TTL seconds (0 = no reservation)
+RESERVE_TTL="${RESERVE_TTL:-0}"
+
+# Prometheus metrics: supervisor on METRICS_PORT_BASE, machine Mnn on METRICS_PORT_BASE + nn (0 = off)
+METRICS_PORT_BASE="${METRICS_PORT_BASE:-0}"
+
+# All machines in one process on one MQTT connection (fleet.py, metrics on METRICS_PORT_BASE + 1):
+#   FLEET_HOST=1 ./run_all.sh
+FLEET_HOST="${FLEET_HOST:-0}"
+
 # Choose supervisor (default: supervisor.py). To use opt:
 #   SUPERVISOR=supervisor_opt ./run_all.sh
+# Pipelined rounds (supervisor_opt only):
+#   SUPERVISOR=supervisor_opt WAIT_DONE=--pipeline ./run_all.sh
 SUPERVISOR="${SUPERVISOR:-supervisor}"
 
 # Jobs list (comma-separated as in the .bat)
@@ -63,18 +79,46 @@ CAPS["M10"]="cut:3.2,drill:2.0,paint:2.1"
 CAPS["M11"]="cut:2.5,drill:2.7,paint:1.5"
 CAPS["M12"]="cut:1.7,drill:3.9,paint:1.7"
 
-echo "[RUN_ALL] Launching 12 machines..."
-for mid in M01 M02 M03 M04 M05 M06 M07 M08 M09 M10 M11 M12; do
-  python3 -u "$SCRIPT_DIR/machine.py" \
-    --id "$mid" \
-    --caps "${CAPS[$mid]}" \
+if [[ "$FLEET_HOST" != "0" ]]; then
+  echo "[RUN_ALL] Launching 12 machines in one fleet host..."
+  metrics_port=0
+  if [[ "$METRICS_PORT_BASE" != "0" ]]; then
+    metrics_port=$((METRICS_PORT_BASE + 1))
+  fi
+  python3 -u "$SCRIPT_DIR/fleet.py" \
+    --fleet run_all \
+    --queue-cap "$QUEUE_CAP" \
+    --slots "$SLOTS" \
+    --reserve-ttl "$RESERVE_TTL" \
     --broker "$BROKER" \
     --port "$PORT" \
-    > "$SCRIPT_DIR/log_${mid}.txt" 2>&1 &
+    --metrics-port "$metrics_port" \
+    > "$SCRIPT_DIR/log_fleet.txt" 2>&1 &
   PIDS+=($!)
-  echo "  - $mid (pid=${PIDS[-1]}) log=log_${mid}.txt"
-  sleep 0.2
-done
+  echo "  - fleet (pid=${PIDS[-1]}) log=log_fleet.txt"
+  sleep 0.5
+else
+  echo "[RUN_ALL] Launching 12 machines..."
+  for mid in M01 M02 M03 M04 M05 M06 M07 M08 M09 M10 M11 M12; do
+    metrics_port=0
+    if [[ "$METRICS_PORT_BASE" != "0" ]]; then
+      metrics_port=$((METRICS_PORT_BASE + 10#${mid#M}))
+    fi
+    python3 -u "$SCRIPT_DIR/machine.py" \
+      --machine-id "$mid" \
+      --caps "${CAPS[$mid]}" \
+      --queue-cap "$QUEUE_CAP" \
+      --slots "$SLOTS" \
+      --reserve-ttl "$RESERVE_TTL" \
+      --broker "$BROKER" \
+      --port "$PORT" \
+      --metrics-port "$metrics_port" \
+      > "$SCRIPT_DIR/log_${mid}.txt" 2>&1 &
+    PIDS+=($!)
+    echo "  - $mid (pid=${PIDS[-1]}) log=log_${mid}.txt"
+    sleep 0.2
+  done
+fi
 
 echo
 echo "[RUN_ALL] Starting supervisor ($SUPERVISOR.py) in foreground..."
@@ -85,4 +129,5 @@ python3 -u "$SCRIPT_DIR/${SUPERVISOR}.py" \
   --deadline "$DEADLINE" \
   $WAIT_DONE \
   --broker "$BROKER" \
-  --port "$PORT"
+  --port "$PORT" \
+  --metrics-port "$METRICS_PORT_BASE"
@@ -0,0 +1,1089 @@
+import argparse
+import contextlib
+import heapq
+import json
+import os
+import random
+import time
+from collections import deque
+
+from assignment import RUN_ALL_CAPS
+from auction import Auction
+from common import (CfP, Proposal, Accept, Reject, Done, Advert, JobRequest, StealRequest, StealGrant, Reassigned,
+                    jload, new_job_id, with_reply, reply_route, publish_reply, t_cfp, t_cfp_to, t_proposals, t_accept,
+                    t_reject, t_done, t_registry, t_replies, t_jobs, t_intake, t_steal_request, t_steal_grant,
+                    t_reassigned)
+from dag import JobDag, parse_dag
+from deadlines import DeadlineTracker
+from durations import DurationModel
+from intake import JobQueue
+from pipeline import PipelinedSupervisor
+from registry import Registry, SAMPLE_POLICIES
+
+"""
+Discrete-event Contract Net simulator (virtual time, one thread, deterministic per seed).
+
+- Sim: virtual clock and event queue; nothing sleeps, a 1 h run takes as long as its events.
+- SimBroker / SimClient: the subset of MQTT the agents use (publish, retained messages, exact and
+  wildcard subscriptions, message_callback_add), each delivery `latency_s` (+ uniform jitter) late.
+- SimMachine: machine.py's behavior on the virtual clock (slots, job queue, ETA = start delay + run
+  time, Reject when full, retained Advert, reply topics), exchanging the common.py messages as JSON.
+- Supervisors:
+  - "pipeline": pipeline.PipelinedSupervisor itself, driven through step() on the virtual clock, with
+    registry.Registry for --registry / --direct / --sample-k;
+  - "sequential": the supervisor.py / supervisor_opt.py loop (one CfP round at a time on auction.Auction,
+    --min-bids, --quiet-ms, --guard-fast / --alpha, --wait-done, rejected jobs asked again);
+  - both size their rounds with deadlines.DeadlineTracker (--adaptive-deadline) on the virtual clock, and
+    rank bids with durations.DurationModel (--learn-eta).
+- Streaming arrivals (--arrival-rate, pipeline only): SimProducer sends the jobs as JobRequests at Poisson
+  times to the supervisor's intake.JobQueue (--intake-limit, --due-s, --priority-frac), holding them while
+  the retained intake state (refreshed every --intake-status-s) leaves no room, like intake.py's load generator.
+- Job DAGs (--dag, see dag.py): the pipeline releases each job on the Done of its predecessors (--dag-order cp /
+  fifo); the sequential supervisor (or --dag-order serial) runs the DAG serialized, in topological order with
+  --wait-done.
+- Real run times: each machine runs its jobs slowdowns() times slower than it promises (--machine-skew,
+  the same factors as bench.py / fleet.py for a seed), each job times a lognormal factor (--duration-noise).
+- Machine failures (--crash K@T, repeatable): K machines picked by the seed fail T s into the run and lose
+  their jobs; "crash" (the process dies: the broker publishes its LWT at once) or "hang" (--crash-mode: no
+  answer, the LWT comes after 1.5 x --keepalive-s); --restart-s brings them back empty. --heartbeat-s makes
+  the machines re-advertise, so the registry can give up on a hung one (registry.expire()).
+- Priority classes: the intake jobs' priority (--priority-frac) travels in CfP and Accept; machines queue the
+  higher class first, and with --preempt restart / checkpoint (machines and pipeline) a higher-priority Accept
+  takes the slot of a running lower-priority job, which runs again from the start or resumes later.
+- Work stealing (--steal, --steal-margin, --steal-threshold): machines whose queue goes above the threshold
+  announce their backlog, idle machines offer their free slots while a peer has one, the backlogged machines
+  grant them the jobs they finish sooner, and the supervisors move the job on its Reassigned message.
+- Fleets: the run_all.sh machines (--machines 12) or N machines knowing 3 of 5 job types (1-5 s).
+
+Machines do not model reservations (--reserve-ttl) or the spt queue policy; handlers take no time.
+"""
+
+FLEET_TYPES = ["cut", "drill", "paint", "weld", "sand"]
+LENT_TTL_S = 5.0   # as machine.LENT_TTL_S (machine.py needs paho-mqtt)
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """MQTT subscription match (+ = one level, # = the rest)."""
+    p, t = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def fleet(n: int, seed: int = 1) -> dict:
+    """{machine_id: caps}: the run_all.sh machines for n = 12, else n machines with 3 of 5 job types."""
+    if n == len(RUN_ALL_CAPS):
+        return {mid: dict(caps) for mid, caps in RUN_ALL_CAPS.items()}
+    rng = random.Random(seed)
+    return {f"M{k + 1:04d}": {jt: round(rng.uniform(1.0, 5.0), 1) for jt in rng.sample(FLEET_TYPES, 3)}
+            for k in range(n)}
+
+
+def slowdowns(machine_ids, sigma: float, seed: int = 1) -> dict:
+    """{machine_id: real / promised run time}, lognormal with sigma `sigma` (all 1.0 for sigma 0)."""
+    rng = random.Random(f"skew-{seed}")
+    return {mid: round(rng.lognormvariate(0.0, sigma), 3) if sigma > 0 else 1.0 for mid in sorted(machine_ids)}
+
+
+def load_fleet(spec: str, seed: int = 1) -> dict:
+    """{machine_id: caps} from "run_all", a machine count (fleet()) or a JSON file {machine_id: {job_type: s}}."""
+    if spec == "run_all":
+        return fleet(len(RUN_ALL_CAPS))
+    if spec.isdigit():
+        return fleet(int(spec), seed)
+    with open(spec) as f:
+        return {mid: {jt: float(s) for jt, s in caps.items()} for mid, caps in json.load(f).items()}
+
+
+class Sim:
+    def __init__(self, seed: int = 1) -> None:
+        self.now = 0.0
+        self.rng = random.Random(seed)
+        self.events = 0
+        self._heap = []          # (time, seq, fn, args)
+        self._seq = 0
+
+    def clock(self) -> float:
+        return self.now
+
+    def at(self, t: float, fn, *args) -> None:
+        heapq.heappush(self._heap, (max(t, self.now), self._seq, fn, args))
+        self._seq += 1
+
+    def run(self, until: float | None = None) -> None:
+        heap = self._heap
+        while heap:
+            if until is not None and heap[0][0] > until:
+                break
+            t, _seq, fn, args = heapq.heappop(heap)
+            self.now = t
+            self.events += 1
+            fn(*args)
+
+
+class SimMessage:
+    __slots__ = ("topic", "payload", "properties", "retain")
+
+    def __init__(self, topic: str, payload: bytes, properties=None, retain: bool = False) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.properties = properties
+        self.retain = retain
+
+
+class SimBroker:
+    def __init__(self, sim: Sim, latency_s: float = 0.002, jitter_s: float = 0.0) -> None:
+        self.sim = sim
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self._exact = {}         # topic -> [client]
+        self._wild = []          # (pattern, client)
+        self._routes = {}        # topic -> [client], cache of the two above
+        self._retained = {}      # topic -> SimMessage
+        self.delivered = 0
+
+    def subscribe(self, client, pattern: str) -> None:
+        self._routes.clear()
+        if "+" in pattern or "#" in pattern:
+            self._wild.append((pattern, client))
+        else:
+            self._exact.setdefault(pattern, []).append(client)
+            if pattern in self._retained:
+                self._deliver(client, self._retained[pattern])
+            return
+        for topic, msg in self._retained.items():
+            if topic_matches(pattern, topic):
+                self._deliver(client, msg)
+
+    def publish(self, topic: str, payload, retain: bool = False, properties=None) -> None:
+        msg = SimMessage(topic, payload.encode() if isinstance(payload, str) else payload, properties)
+        if retain:
+            # like MQTT, only the copy replayed to later subscribers has the retain flag
+            self._retained[topic] = SimMessage(topic, msg.payload, properties, retain=True)
+        clients = self._routes.get(topic)
+        if clients is None:
+            clients = self._routes[topic] = self._exact.get(topic, []) + [
+                client for pattern, client in self._wild if topic_matches(pattern, topic)]
+        for client in clients:
+            self._deliver(client, msg)
+
+    def _deliver(self, client, msg: SimMessage) -> None:
+        delay = self.latency_s + (self.sim.rng.uniform(0.0, self.jitter_s) if self.jitter_s > 0 else 0.0)
+        self.delivered += 1
+        self.sim.at(self.sim.now + delay, client.on_message, msg)
+
+
+class SimClient:
+    """paho Client stand-in: publish / subscribe / message_callback_add on a SimBroker."""
+
+    def __init__(self, broker: SimBroker, client_id: str) -> None:
+        self.broker = broker
+        self.client_id = client_id
+        self.connected = True     # False: a failed process, sends and receives nothing
+        self._exact = {}         # topic -> [callback]
+        self._wild = []          # (pattern, callback)
+        self._routes = {}        # topic -> [callback], cache of the two above
+        self.sent = 0
+        self.received = 0
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False, properties=None) -> None:
+        if not self.connected:
+            return
+        self.sent += 1
+        self.broker.publish(topic, payload, retain, properties)
+
+    def subscribe(self, topic: str, qos: int = 0) -> None:
+        self.broker.subscribe(self, topic)
+
+    def message_callback_add(self, sub: str, callback) -> None:
+        self._routes.clear()
+        if "+" in sub or "#" in sub:
+            self._wild.append((sub, callback))
+        else:
+            self._exact.setdefault(sub, []).append(callback)
+
+    def on_message(self, msg: SimMessage) -> None:
+        if not self.connected:
+            return
+        self.received += 1
+        callbacks = self._routes.get(msg.topic)
+        if callbacks is None:
+            callbacks = self._routes[msg.topic] = self._exact.get(msg.topic, []) + [
+                callback for pattern, callback in self._wild if topic_matches(pattern, msg.topic)]
+        for callback in callbacks:
+            callback(self, None, msg)
+
+
+class SimMachine:
+    """machine.py on the virtual clock (fifo queue within each priority class, no reservations)."""
+
+    def __init__(self, sim: Sim, broker: SimBroker, machine_id: str, caps: dict, slots: int = 1,
+                 queue_cap: int = 0, adverts: bool = False, slowdown: float = 1.0, noise: float = 0.0,
+                 seed: int = 1, heartbeat_s: float = 0.0, preempt: str = "off", steal: bool = False,
+                 steal_margin: float = 0.5, steal_threshold: int = 1) -> None:
+        self.sim = sim
+        self.broker = broker
+        self.machine_id = machine_id
+        self.caps = caps
+        self.slots = max(1, slots)
+        self.queue_cap = queue_cap
+        self.adverts = adverts
+        self.slowdown = slowdown
+        self.noise = noise
+        self.heartbeat_s = heartbeat_s
+        self.preempt = preempt
+        self.steal = steal
+        self.steal_margin = steal_margin
+        self.steal_threshold = steal_threshold
+        self._rng = random.Random(f"{seed}-{machine_id}")
+        self._epoch = 0                       # bumped by a failure: the jobs of the dead process never end
+        self._seq = 0
+        self.client = SimClient(broker, f"machine-{machine_id}")
+        self._running = [None] * self.slots   # per slot: running job (dict, see _on_accept) or None
+        self._queue = []                      # heap of (-priority, seq, job)
+        self._peers = {}                      # idle peer id -> dict(caps, free), as machine.py
+        self._offered = None
+        self._loaded = {}                     # backlogged peer id -> caps, as machine.py
+        self._announced = False
+        self._lent = {}                       # job_id -> (queue entry, granted at)
+        self.busy_s = 0.0
+        self.jobs = 0
+        self.preemptions = 0
+        self.stolen = 0                       # queued jobs granted to idle peers
+        self.returned = 0                     # grants handed back (busy again)
+
+        for jt in caps:
+            self.client.subscribe(t_cfp(jt))
+            self.client.message_callback_add(t_cfp(jt), self._on_cfp)
+        self.client.subscribe(t_cfp_to(machine_id))
+        self.client.message_callback_add(t_cfp_to(machine_id), self._on_cfp)
+        self.client.subscribe(t_accept(machine_id))
+        self.client.message_callback_add(t_accept(machine_id), self._on_accept)
+        if steal:
+            for topic, handler in ((t_steal_request(), self._on_steal_request),
+                                   (t_steal_grant(machine_id), self._on_steal_grant)):
+                self.client.subscribe(topic)
+                self.client.message_callback_add(topic, handler)
+        self._advertise()
+        self._share_work()
+
+    def _busy_slots(self) -> int:
+        return sum(1 for job in self._running if job is not None)
+
+    def _has_room(self) -> bool:
+        return self._busy_slots() + len(self._queue) < self.slots + self.queue_cap
+
+    def _victim(self, priority: int) -> int | None:
+        """Slot a job of `priority` would preempt (lowest class, then latest start), as machine.py."""
+        if self.preempt == "off":
+            return None
+        slots = [i for i, job in enumerate(self._running) if job is not None and job["priority"] < priority]
+        return min(slots, key=lambda i: (self._running[i]["priority"], -self._running[i]["resumed"]), default=None)
+
+    def _start_delay(self, priority: int | None = None) -> float:
+        preempts = priority is not None and self.preempt != "off"
+        free_at = sorted(0.0 if job is None or (preempts and job["priority"] < priority)
+                         else max(0.0, job["ends_at"] - self.sim.now) for job in self._running)
+        for _p, _seq, job in sorted(self._queue):
+            if priority is None or job["priority"] >= priority:
+                free_at[0] += self.caps[job["jt"]] * job["left_s"] / job["run_s"]
+                free_at.sort()
+        return free_at[0]
+
+    def _advertise(self) -> None:
+        if not self.adverts:
+            return
+        busy, queued = self._busy_slots(), len(self._queue)
+        advert = Advert(machine_id=self.machine_id, caps=self.caps, slots=self.slots, queue_cap=self.queue_cap,
+                        busy=busy, queued=queued, room=max(0, self.slots + self.queue_cap - busy - queued),
+                        backlog_s=round(self._start_delay(), 3), online=True, at=self.sim.now,
+                        heartbeat_s=self.heartbeat_s)
+        self.client.publish(t_registry(self.machine_id), advert.to_msg(), retain=True)
+
+    def fail(self, mode: str = "crash", keepalive_s: float = 60.0, restart_s: float = 0.0) -> None:
+        """The process dies ("crash": the broker publishes the LWT at once) or stops answering ("hang": the
+        LWT waits for 1.5 x keepalive); it is back, empty, `restart_s` later (0 = never)."""
+        self.client.connected = False
+        self._epoch += 1
+        self._running = [None] * self.slots
+        self._queue.clear()
+        self._peers.clear()
+        self._loaded.clear()
+        will_at = self.sim.now + (0.0 if mode == "crash" else 1.5 * keepalive_s)
+        if restart_s > 0:
+            will_at = min(will_at, self.sim.now + restart_s)   # the new connection takes the session over
+            self.sim.at(self.sim.now + restart_s, self._restart)
+        self.sim.at(will_at, self._will)
+
+    def _will(self) -> None:
+        if self.adverts:
+            advert = Advert(machine_id=self.machine_id, caps=self.caps, slots=self.slots, queue_cap=self.queue_cap,
+                            busy=0, queued=0, room=0, backlog_s=0.0, online=False, at=self.sim.now)
+            self.broker.publish(t_registry(self.machine_id), advert.to_msg(), retain=True)
+
+    def _restart(self) -> None:
+        self.client.connected = True
+        self._advertise()
+        self._offered = None
+        self._share_work()
+
+    def _on_cfp(self, _c, _u, msg) -> None:
+        cfp = jload(msg.payload)
+        jt = cfp["job_type"]
+        priority = int(cfp.get("priority", 0))
+        if jt not in self.caps or not (self._has_room() or self._victim(priority) is not None):
+            return
+        duration = self.caps[jt]
+        backlog = self._start_delay(priority)
+        prop = Proposal(job_id=cfp["job_id"], job_type=jt, machine_id=self.machine_id,
+                        eta_s=round(backlog + duration, 3), at=self.sim.now, backlog_s=round(backlog, 3))
+        publish_reply(self.client, reply_route(msg, cfp), t_proposals(), prop)
+
+    def _on_accept(self, _c, _u, msg) -> None:
+        acc = jload(msg.payload)
+        route = reply_route(msg, acc)
+        jid, jt = acc["job_id"], acc["job_type"]
+        priority = int(acc.get("priority", 0))
+        if jt not in self.caps or not (self._has_room() or self._victim(priority) is not None):
+            reason = "incapable" if jt not in self.caps else "busy"
+            publish_reply(self.client, route, t_reject(), Reject(jid, jt, self.machine_id, reason, self.sim.now))
+            return
+        self._enqueue(jid, jt, route, priority)
+        self._advertise()
+        self._share_work()
+
+    def _enqueue(self, jid: str, jt: str, route: tuple, priority: int) -> None:
+        run_s = self.caps[jt] * self.slowdown
+        if self.noise > 0:
+            run_s *= self._rng.lognormvariate(0.0, self.noise)
+        job = {"jid": jid, "jt": jt, "route": route, "priority": priority, "seq": self._seq, "run_s": run_s,
+               "left_s": run_s, "preemptions": 0, "started": None, "resumed": None, "ends_at": None, "run": 0}
+        heapq.heappush(self._queue, (-priority, job["seq"], job))
+        self._seq += 1
+        self._start_queued()
+
+    # ---------- Work stealing (as machine.py) ----------
+
+    def _free_slots(self) -> int:
+        return 0 if self._queue else self.slots - self._busy_slots()
+
+    def _pick_steals(self) -> list:
+        for jid in [j for j, (_e, at) in self._lent.items() if self.sim.now - at > LENT_TTL_S]:
+            del self._lent[jid]
+        grants = []
+        while self._peers and self._queue:
+            free_at = sorted(0.0 if job is None else max(0.0, job["ends_at"] - self.sim.now) for job in self._running)
+            best = None
+            for entry in sorted(self._queue):
+                job = entry[2]
+                free_at[0] += self.caps[job["jt"]] * job["left_s"] / job["run_s"]
+                end = free_at[0]
+                free_at.sort()
+                if job["started"] is not None:
+                    continue
+                for mid, peer in self._peers.items():
+                    d = peer["caps"].get(job["jt"])
+                    if d is not None and (best is None or end - float(d) > best[0]):
+                        best = (end - float(d), entry, mid)
+            if best is None or best[0] <= self.steal_margin:
+                break
+            _gain, entry, mid = best
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            self._lent[entry[2]["jid"]] = (entry, self.sim.now)
+            peer = self._peers[mid]
+            peer["free"] -= 1
+            if peer["free"] <= 0:
+                del self._peers[mid]
+            job = entry[2]
+            topic, corr = job["route"]
+            grants.append(StealGrant(job["jid"], job["jt"], self.machine_id, mid, self.sim.now,
+                                     priority=job["priority"], reply_to=topic, corr=corr))
+            self.stolen += 1
+        return grants
+
+    def _share_work(self) -> None:
+        if not self.steal:
+            return
+        grants = self._pick_steals()
+        for g in grants:
+            self.client.publish(t_steal_grant(g.to_machine), g.to_msg())
+        if grants:
+            self._advertise()
+        free = self._free_slots()
+        loaded = len(self._queue) > self.steal_threshold or (self._announced and bool(self._queue))
+        wanted = any(jt in self.caps for caps in self._loaded.values() for jt in caps)
+        offer = free if free and (wanted or self._offered) else 0
+        if offer != (self._offered or 0) or loaded != self._announced:
+            self._offered, self._announced = offer, loaded
+            self.client.publish(t_steal_request(), StealRequest(self.machine_id, self.caps, offer, self.sim.now,
+                                                                len(self._queue) if loaded else 0).to_msg())
+
+    def _on_steal_request(self, _c, _u, msg) -> None:
+        req = jload(msg.payload)
+        mid = req["machine_id"]
+        if mid == self.machine_id:
+            return
+        if int(req["free"]) > 0 and any(jt in self.caps for jt in req["caps"]):
+            self._peers[mid] = {"caps": req["caps"], "free": int(req["free"])}
+        else:
+            self._peers.pop(mid, None)
+        if int(req.get("backlog", 0)) > 0:
+            self._loaded[mid] = req["caps"]
+        else:
+            self._loaded.pop(mid, None)
+        self._share_work()
+
+    def _on_steal_grant(self, _c, _u, msg) -> None:
+        g = jload(msg.payload)
+        jid, jt, priority = g["job_id"], g["job_type"], int(g.get("priority", 0))
+        route = (g.get("reply_to", ""), g.get("corr", ""))
+        if jt not in self.caps or not (g.get("returned") or self._free_slots() > 0):
+            self.returned += 1
+            back = StealGrant(jid, jt, self.machine_id, g["from_machine"], self.sim.now, priority=priority,
+                              reply_to=route[0], corr=route[1], returned=True)
+            self.client.publish(t_steal_grant(g["from_machine"]), back.to_msg())
+            return
+        eta = self._start_delay(priority) + self.caps[jt]
+        if g.get("returned"):
+            self._peers.pop(g["from_machine"], None)
+        lent = self._lent.pop(jid, None) if g.get("returned") else None
+        if lent is not None:
+            heapq.heappush(self._queue, lent[0])   # back in its old place
+            self._start_queued()
+        else:
+            self._enqueue(jid, jt, route, priority)
+        self._advertise()
+        if not g.get("returned"):
+            publish_reply(self.client, route, t_reassigned(),
+                          Reassigned(jid, jt, g["from_machine"], self.machine_id, round(eta, 3), self.caps[jt],
+                                     self.sim.now))
+        self._share_work()
+
+    def _start_queued(self) -> None:
+        while self._queue:
+            slot = next((i for i, job in enumerate(self._running) if job is None), None)
+            if slot is None:
+                slot = self._victim(-self._queue[0][0])
+                if slot is None:
+                    return
+                self._preempt(slot)
+            job = heapq.heappop(self._queue)[2]
+            now = self.sim.now
+            if job["started"] is None:
+                job["started"] = now
+            job["resumed"] = now
+            job["ends_at"] = now + self.caps[job["jt"]] * job["left_s"] / job["run_s"]
+            job["run"] += 1
+            self._running[slot] = job
+            self.sim.at(now + job["left_s"], self._finish, slot, job, job["run"], self._epoch)
+
+    def _preempt(self, slot: int) -> None:
+        job = self._running[slot]
+        self._running[slot] = None
+        ran = self.sim.now - job["resumed"]
+        self.busy_s += ran
+        job["preemptions"] += 1
+        job["left_s"] = max(0.0, job["left_s"] - ran) if self.preempt == "checkpoint" else job["run_s"]
+        self.preemptions += 1
+        heapq.heappush(self._queue, (-job["priority"], job["seq"], job))   # back at the head of its class
+
+    def _finish(self, slot: int, job: dict, run: int, epoch: int = 0) -> None:
+        if epoch != self._epoch or job["run"] != run or self._running[slot] is not job:
+            return   # the machine failed meanwhile (no Done, the work is lost), or the run was preempted
+        self._running[slot] = None
+        self.busy_s += self.sim.now - job["resumed"]
+        self.jobs += 1
+        self._start_queued()
+        self._advertise()
+        started = job["started"]
+        lost = round(max(0.0, self.sim.now - started - job["run_s"]), 3) if job["preemptions"] else 0.0
+        publish_reply(self.client, job["route"], t_done(),
+                      Done(job["jid"], job["jt"], self.machine_id, started, self.sim.now, slot,
+                           preemptions=job["preemptions"], preempted_s=lost))
+        self._share_work()
+
+
+class SimProducer:
+    """intake.py's load generator on the virtual clock: one JobRequest per job type, at Poisson times from `start`;
+    sends at most the room (limit - depth) of the last retained intake state, holds the other arrivals."""
+
+    def __init__(self, sim: Sim, broker: SimBroker, supervisor: str, job_types: list[str], rate: float,
+                 due_s: float = 0.0, priority_frac: float = 0.0, seed: int = 1, start: float = 0.0,
+                 on_end=None) -> None:
+        self.sim = sim
+        self.broker = broker
+        self.client = SimClient(broker, "producer")
+        self.topic = t_jobs(supervisor)
+        self.on_end = on_end
+        self.credit = None       # jobs we may still send (None: no intake state yet)
+        self.held = 0            # arrivals held back while the intake had no room
+        self._backlog = deque()
+        self._left = len(job_types)
+        self.client.message_callback_add(t_intake(supervisor), self._on_intake)
+        self.client.subscribe(t_intake(supervisor))
+        rng = random.Random(f"arrivals-{seed}")
+        t = start
+        for k, jt in enumerate(job_types):
+            t += rng.expovariate(rate)
+            req = JobRequest(jt, f"r{k}", 1 if rng.random() < priority_frac else 0, due_s)
+            sim.at(t, self._arrive, req)
+
+    def _arrive(self, req: JobRequest) -> None:
+        req.submitted_at = self.sim.now
+        if self.credit != 0 and not self._backlog:
+            self._send(req)
+        else:
+            self.held += 1
+            self._backlog.append(req)
+
+    def _on_intake(self, _c, _u, msg) -> None:
+        st = jload(msg.payload)
+        self.credit = st["limit"] - st["depth"] if st["accepting"] else 0
+        while self.credit and self._backlog:
+            self._send(self._backlog.popleft())
+
+    def _send(self, req: JobRequest) -> None:
+        if self.credit is not None:
+            self.credit -= 1
+        self.client.publish(self.topic, req.to_msg())
+        self._left -= 1
+        if not self._left and self.on_end is not None:
+            # once the last job reached the supervisor
+            self.sim.at(self.sim.now + self.broker.latency_s + self.broker.jitter_s + 1e-6, self.on_end)
+
+
+class SimSupervisor:
+    """Subscriptions and message routing shared by the simulated supervisors (see supervisor_opt.py)."""
+
+    def __init__(self, sim: Sim, broker: SimBroker, name: str = "supervisor_opt", shared_topics: bool = False,
+                 registry: bool = False) -> None:
+        self.sim = sim
+        self.client = SimClient(broker, name)
+        self.replies = "" if shared_topics else name
+        self.started_at = None
+        self.finished_at = None
+        if self.replies:
+            self.client.subscribe(t_replies(self.replies))
+        else:
+            for topic in (t_proposals(), t_done(), t_reject(), t_reassigned()):
+                self.client.subscribe(topic)
+        self.client.message_callback_add(t_replies(name, "proposals"), self._on_proposal)
+        self.client.message_callback_add(t_replies(name, "results"), self._on_result)
+        self.client.message_callback_add(t_proposals(), self._on_proposal)
+        self.client.message_callback_add(t_done(), self._on_done)
+        self.client.message_callback_add(t_reject(), self._on_reject)
+        self.client.message_callback_add(t_reassigned(), self._on_reassigned)
+        if registry:
+            self.client.subscribe(t_registry())
+            self.client.message_callback_add(t_registry(), self._on_advert)
+
+    def reply_to(self, kind: str) -> str:
+        return t_replies(self.replies, kind) if self.replies else ""
+
+    def _on_proposal(self, _c, _u, msg) -> None:
+        self.on_proposal(jload(msg.payload))
+        self.poke()
+
+    def _on_result(self, c, u, msg) -> None:
+        if b'"from_machine":' in msg.payload:
+            self._on_reassigned(c, u, msg)
+        else:
+            (self._on_reject if b'"reason":' in msg.payload else self._on_done)(c, u, msg)
+
+    def _on_done(self, _c, _u, msg) -> None:
+        self.on_done(jload(msg.payload))
+        self.poke()
+
+    def _on_reject(self, _c, _u, msg) -> None:
+        self.on_reject(jload(msg.payload))
+        self.poke()
+
+    def _on_advert(self, _c, _u, msg) -> None:
+        self.on_advert(jload(msg.payload))
+        self.poke()
+
+    def _on_reassigned(self, _c, _u, msg) -> None:
+        self.on_reassigned(jload(msg.payload))
+        self.poke()
+
+    def start(self) -> None:
+        self.started_at = self.sim.now
+        self.poke()
+
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def on_proposal(self, p: dict) -> None: ...
+    def on_done(self, d: dict) -> None: ...
+    def on_reject(self, r: dict) -> None: ...
+    def on_advert(self, a: dict) -> None: ...
+    def on_reassigned(self, s: dict) -> None: ...
+    def poke(self) -> None: ...
+
+
+class SimPipelined(SimSupervisor):
+    """pipeline.PipelinedSupervisor on the virtual clock: step() after every message and at its timers."""
+
+    def __init__(self, sim, broker, job_types, deadline_s=1.0, max_auctions=4, max_jobs=12, min_bids=0,
+                 quiet_ms=0, per_machine=1, registry=False, direct=False, sample_k=0, sample_policy="random",
+                 shared_topics=False, deadlines=None, durations=None, intake=None, status_s=1.0, dag=None,
+                 done_timeout_s=10.0, done_slack=1.0, preempt=False) -> None:
+        registry = registry or direct or sample_k > 0
+        super().__init__(sim, broker, shared_topics=shared_topics, registry=registry)
+        self.core = PipelinedSupervisor(self.client, job_types, deadline_s, max_auctions, max_jobs, min_bids,
+                                        quiet_ms, per_machine=per_machine, done_timeout_s=done_timeout_s,
+                                        done_slack=done_slack,
+                                        registry=Registry(clock=sim.clock) if registry else None, direct=direct,
+                                        sample_k=sample_k, sample_policy=sample_policy, replies=self.replies,
+                                        clock=sim.clock, tag="[SIM]", deadlines=deadlines, durations=durations,
+                                        intake=intake, dag=dag, preempt=preempt)
+        self._timer_at = None
+        if intake is not None:
+            intake.on_state = self._publish_intake
+            self.client.subscribe(t_jobs(self.client.client_id))
+            self.client.message_callback_add(t_jobs(self.client.client_id), self._on_job)
+            self.status_s = status_s
+
+    def start(self) -> None:
+        super().start()
+        if self.core.intake is not None:
+            self._refresh_intake()
+
+    def _refresh_intake(self) -> None:
+        if not self.finished():
+            self._publish_intake(self.core.intake.accepting)
+            self.sim.at(self.sim.now + self.status_s, self._refresh_intake)
+
+    def _on_job(self, _c, _u, msg) -> None:
+        self.core.on_job(jload(msg.payload))
+        self.poke()
+
+    def _publish_intake(self, _accepting: bool) -> None:
+        name = self.client.client_id
+        self.client.publish(t_intake(name), self.core.intake.state(name).to_msg(), retain=True)
+
+    def close_intake(self) -> None:
+        self.core.close_intake()
+        self.poke()
+
+    def on_proposal(self, p):
+        self.core.on_proposal(p)
+
+    def on_done(self, d):
+        self.core.on_done(d)
+
+    def on_reject(self, r):
+        self.core.on_reject(r)
+
+    def on_advert(self, a):
+        self.core.on_advert(a)
+
+    def on_reassigned(self, s):
+        self.core.on_reassigned(s)
+
+    def _on_timer(self) -> None:
+        self._timer_at = None
+        self.poke()
+
+    def poke(self) -> None:
+        if self.started_at is None or self.finished():
+            return
+        with self.core._cond:
+            wake = self.core.step()
+            if self.core.finished():
+                self.finished_at = self.sim.now
+                return
+        if wake is not None and (self._timer_at is None or wake < self._timer_at):
+            self._timer_at = wake
+            self.sim.at(wake, self._on_timer)
+
+    def stats(self) -> dict:
+        return self.core.stats(self.finished_at - self.started_at)
+
+
+class SimSequential(SimSupervisor):
+    """The supervisor.py / supervisor_opt.py loop: one CfP round at a time, best ETA (or --guard-fast)."""
+
+    def __init__(self, sim, broker, job_types, deadline_s=1.0, min_bids=0, quiet_ms=0, guard_fast=False,
+                 alpha=1.15, wait_done=False, max_reissues=20, shared_topics=False, deadlines=None,
+                 durations=None, done_timeout_s=10.0, done_slack=1.0) -> None:
+        super().__init__(sim, broker, shared_topics=shared_topics)
+        self.job_types = job_types
+        self.deadline_s = deadline_s
+        self.deadlines = deadlines or DeadlineTracker(deadline_s, adaptive=False, clock=sim.clock)
+        self.durations = durations
+        self.min_bids = min_bids
+        self.quiet_s = quiet_ms / 1000.0
+        self.guard_fast = guard_fast
+        self.alpha = alpha
+        self.wait_done = wait_done
+        self.max_reissues = max_reissues
+        self.done_timeout_s = done_timeout_s
+        self.done_slack = done_slack
+        self._next = 0                # index of the next job of the list
+        self._retry = deque()         # (job_type, reissues) of rejected jobs
+        self._auction = None          # open round: (Auction, issued_at, reissues, static)
+        self._guard = None            # (job_type, reissues, first CfP) to CfP again at the static deadline
+        self._issued = {}             # job_id -> (issued_at, job_type, machine_id, reissues, promised run time)
+        self._closing = False
+        self.counts = {"skipped": 0, "rejected": 0, "timed_out": 0, "reassigned": 0, "reissued": 0, "parked": 0,
+                       "lost": 0}
+        self.latencies = []
+        self.done_at = []
+
+    def on_proposal(self, p):
+        self.deadlines.on_bid(p["job_id"])
+        if self._auction is not None and self._auction[0].job_id == p["job_id"]:
+            self._auction[0].add(p)
+
+    def on_done(self, d):
+        job = self._issued.pop(d["job_id"], None)
+        if job is not None:
+            if self.durations is not None:
+                self.durations.observe(job[2], job[1], job[4], d["finished_at"] - d["started_at"])
+            self.latencies.append(self.sim.now - job[0])
+            self.done_at.append(self.sim.now)
+
+    def on_reject(self, r):
+        job = self._issued.get(r["job_id"])
+        if job is None or job[2] != r["machine_id"]:
+            return
+        self._again(r["job_id"], "rejected")
+
+    def on_reassigned(self, s):
+        job = self._issued.get(s["job_id"])
+        if job is None or job[2] != s["from_machine"]:
+            return
+        job = self._issued[s["job_id"]] = (job[0], job[1], s["machine_id"], job[3], float(s["duration_s"]))
+        self.counts["reassigned"] += 1
+        if self.done_timeout_s > 0:
+            self.sim.at(self.sim.now + float(s["eta_s"]) * self.done_slack + self.done_timeout_s,
+                        self._on_due, s["job_id"], job)
+
+    def _on_due(self, jid: str, job: tuple) -> None:
+        """No DONE --done-timeout-s after ETA x --done-slack: ask again."""
+        if self._issued.get(jid) is job:
+            self._again(jid, "timed_out")
+            self.poke()
+
+    def _again(self, jid: str, outcome: str) -> None:
+        job = self._issued.pop(jid)
+        self.counts[outcome] += 1
+        if job[3] < self.max_reissues:
+            self.counts["reissued"] += 1
+            self._retry.append((job[1], job[3] + 1))
+        else:
+            self.counts["lost"] += 1
+
+    def _open(self) -> None:
+        issued_at, static = self.sim.now, False
+        if self._guard is not None:
+            (jt, reissues, issued_at), static = self._guard, True
+            self._guard = None
+        elif self._retry:
+            jt, reissues = self._retry.popleft()
+        else:
+            jt, reissues = self.job_types[self._next], 0
+            self._next += 1
+        jid = new_job_id()
+        deadline = self.deadlines.opened(jid, jt, static)
+        auction = Auction(jid, jt, deadline, self.min_bids, self.quiet_s, clock=self.sim.clock)
+        self._auction = (auction, issued_at, reissues, static)
+        cfp = CfP(job_id=jid, job_type=jt, deadline_s=deadline, issued_at=self.sim.now)
+        props = with_reply(cfp, self.reply_to("proposals"))
+        self.client.publish(t_cfp(jt), cfp.to_msg(), properties=props)
+
+    def _close(self) -> None:
+        auction, issued_at, reissues, static = self._auction
+        self._auction = None
+        jt = auction.job_type
+        retry = self.deadlines.closed(auction)
+        if not len(auction) and (retry or static and self._issued):
+            # Guardrail of --adaptive-deadline (as supervisor_opt.run_round): the same job at the static deadline
+            self.counts["parked"] += not retry
+            self._guard = (jt, reissues, issued_at)
+            return
+        eta = self.durations.eta if self.durations is not None else (lambda p: float(p["eta_s"]))
+        ranked = auction.ranked(key=eta if self.durations is not None else None)
+        if not ranked:
+            self.counts["skipped"] += 1
+            return
+        winner = ranked[0]
+        nxt = self._retry[0][0] if self._retry else (self.job_types[self._next] if self._next < len(self.job_types) else None)
+        if self.guard_fast and nxt == jt and len(ranked) >= 2 and eta(ranked[1]) <= self.alpha * eta(ranked[0]):
+            winner = ranked[1]
+        promised = float(winner["eta_s"]) - float(winner.get("backlog_s", 0.0))
+        job = self._issued[auction.job_id] = (issued_at, jt, winner["machine_id"], reissues, promised)
+        if self.done_timeout_s > 0:
+            self.sim.at(self.sim.now + float(winner["eta_s"]) * self.done_slack + self.done_timeout_s,
+                        self._on_due, auction.job_id, job)
+        acc = Accept(auction.job_id, jt)
+        props = with_reply(acc, self.reply_to("results"))
+        self.client.publish(t_accept(winner["machine_id"]), acc.to_msg(), properties=props)
+
+    def poke(self) -> None:
+        if self.started_at is None or self.finished():
+            return
+        while True:
+            if self._auction is not None:
+                auction = self._auction[0]
+                if not auction.try_close():
+                    if not self._closing:
+                        self._closing = True
+                        self.sim.at(auction.wakeup_at(), self._on_timer)
+                    return
+                self._close()
+            if self.wait_done and self._issued:
+                return
+            if self._next >= len(self.job_types) and not self._retry and self._guard is None:
+                if not self._issued:
+                    self.finished_at = self.done_at[-1] if self.done_at else self.sim.now
+                return
+            self._open()
+
+    def _on_timer(self) -> None:
+        self._closing = False
+        self.poke()
+
+    def stats(self) -> dict:
+        makespan = self.finished_at - self.started_at
+        done = len(self.done_at)
+        return {
+            "jobs": len(self.job_types),
+            "done": done,
+            **self.counts,
+            "makespan_s": makespan,
+            "throughput_jobs_s": done / makespan if makespan > 0 else 0.0,
+            "mean_latency_s": sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+            **self.deadlines.stats(),
+        }
+
+
+def random_jobs(caps: dict, n: int, seed: int = 1) -> list[str]:
+    """n job types drawn uniformly from the types of the fleet."""
+    types = sorted({jt for c in caps.values() for jt in c})
+    rng = random.Random(seed)
+    return [rng.choice(types) for _ in range(n)]
+
+
+def crash_plan(specs: list[str], machine_ids: list[str], seed: int = 1) -> list[tuple[float, str]]:
+    """[(seconds into the run, machine_id)] for --crash K@T specs; distinct machines picked by the seed."""
+    rng = random.Random(f"crash-{seed}")
+    left = sorted(machine_ids)
+    out = []
+    for spec in specs:
+        k, _, t = spec.partition("@")
+        for mid in rng.sample(left, min(int(k), len(left))):
+            left.remove(mid)
+            out.append((float(t or 0.0), mid))
+    return out
+
+
+def simulate(args, job_types: list[str], caps: dict, observer=None, dag: dict | None = None) -> dict:
+    """One simulated run; returns the supervisor stats plus simulation counters.
+
+    dag ({name: (job_type, [predecessors])}, see dag.parse_dag()) runs after `job_types` in pipeline mode;
+    the fleet's mean run time per job type sizes its critical paths.
+
+    observer(client, clock), if given, is called with a client of its own before the supervisor starts
+    (e.g. bench.Tracer.attach); the messages it receives are not counted in `messages`.
+    """
+    random.seed(args.seed)   # registry.sample() draws from the module RNG
+    sim = Sim(args.seed)
+    broker = SimBroker(sim, args.latency_ms / 1000.0, args.jitter_ms / 1000.0)
+    use_registry = args.registry or args.direct or args.sample_k > 0
+    deadlines = DeadlineTracker(args.deadline, args.deadline_quantile, args.deadline_margin_ms / 1000.0,
+                                args.deadline_floor_ms / 1000.0, args.deadline_samples, adaptive=args.adaptive_deadline,
+                                clock=sim.clock)
+    durations = DurationModel(args.eta_alpha, args.eta_risk) if args.learn_eta else None
+    slow = slowdowns(caps, args.machine_skew, args.seed)
+    machines = [SimMachine(sim, broker, mid, c, args.slots, args.queue_cap, adverts=use_registry, slowdown=slow[mid],
+                           noise=args.duration_noise, seed=args.seed, heartbeat_s=args.heartbeat_s,
+                           preempt=args.preempt, steal=args.steal, steal_margin=args.steal_margin,
+                           steal_threshold=args.steal_threshold)
+                for mid, c in caps.items()]
+    crashes = crash_plan(args.crash, [m.machine_id for m in machines], args.seed)
+    streaming = args.arrival_rate > 0
+    if streaming and args.mode != "pipeline":
+        raise SystemExit("[SIM] --arrival-rate needs --mode pipeline")
+    if dag is not None and args.mode != "pipeline":
+        raise SystemExit("[SIM] a DAG needs --mode pipeline (run dag topological() sequentially instead)")
+    job_dag = None
+    if dag is not None:
+        runs = {}
+        for c in caps.values():
+            for jt, s in c.items():
+                runs.setdefault(jt, []).append(s)
+        job_dag = JobDag(dag, args.dag_order, est=lambda jt: sum(runs.get(jt, [1.0])) / len(runs.get(jt, [1.0])))
+    if args.mode == "pipeline":
+        intake = JobQueue(args.intake_limit, args.intake_resume, check_due=not args.admit_late,
+                          drop_expired=args.drop_expired, clock=sim.clock) if streaming else None
+        sup = SimPipelined(sim, broker, [] if streaming else job_types, args.deadline, args.max_auctions,
+                           args.max_jobs, args.min_bids, args.quiet_ms, args.per_machine, args.registry, args.direct,
+                           args.sample_k, args.sample_policy, args.shared_topics, deadlines, durations, intake,
+                           args.intake_status_s, job_dag, args.done_timeout_s, args.done_slack,
+                           args.preempt != "off")
+    else:
+        sup = SimSequential(sim, broker, job_types, args.deadline, args.min_bids, args.quiet_ms, args.guard_fast,
+                            args.alpha, args.wait_done, shared_topics=args.shared_topics, deadlines=deadlines,
+                            durations=durations, done_timeout_s=args.done_timeout_s, done_slack=args.done_slack)
+    watcher = None
+    if observer is not None:
+        watcher = SimClient(broker, "observer")
+        observer(watcher, sim.clock)
+    t0 = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        sim.run()   # retained adverts reach the supervisor before its first round
+        sup.start()
+        by_id = {m.machine_id: m for m in machines}
+        for t, mid in crashes:
+            sim.at(sim.now + t, by_id[mid].fail, args.crash_mode, args.keepalive_s, args.restart_s)
+        if args.heartbeat_s > 0 and use_registry:
+            def beat():
+                if not sup.finished():
+                    for m in machines:
+                        m._advertise()
+                    sim.at(sim.now + args.heartbeat_s, beat)
+            sim.at(sim.now + args.heartbeat_s, beat)
+        if streaming:
+            producer = SimProducer(sim, broker, sup.client.client_id, job_types, args.arrival_rate, args.due_s,
+                                   args.priority_frac, args.seed, sim.now, on_end=sup.close_intake)
+        sim.run()
+    wall = time.perf_counter() - t0
+    if not sup.finished():
+        raise SystemExit(f"[SIM] supervisor stalled at t={sim.now:.1f}s (no events left)")
+    stats = sup.stats()
+    slots = sum(m.slots for m in machines)
+    if crashes:
+        stats["crashes"] = len(crashes)
+    if streaming:
+        stats["held"] = producer.held
+    if args.preempt != "off":
+        stats["preemptions"] = sum(m.preemptions for m in machines)
+    if args.steal:
+        stats["stolen"] = sum(m.stolen for m in machines)
+        stats["steals_returned"] = sum(m.returned for m in machines)
+    messages = broker.delivered - (watcher.received if watcher is not None else 0)
+    stats.update({
+        "utilization": sum(m.busy_s for m in machines) / (stats["makespan_s"] * slots) if stats["makespan_s"] > 0 else 0.0,
+        "messages": messages,
+        "msgs_per_job": messages / max(1, stats["jobs"]),
+        "sup_in_per_job": sup.client.received / max(1, stats["jobs"]),
+        "events": sim.events,
+        "wall_s": wall,
+    })
+    return stats
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Contract Net simulator (virtual time)")
+    ap.add_argument("--machines", type=int, default=12, help="Fleet size (12 = the run_all.sh machines)")
+    ap.add_argument("--jobs", type=int, default=15, help="Number of jobs (types drawn from the fleet's)")
+    ap.add_argument("--job-list", default="", help="Comma-separated job types instead of --jobs")
+    ap.add_argument("--mode", choices=("sequential", "pipeline"), default="pipeline")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=2.0, help="Broker delivery latency per message")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform random latency per message")
+    ap.add_argument("--verbose", action="store_true", help="Keep the supervisor's log lines")
+
+    # Machines
+    ap.add_argument("--slots", type=int, default=1)
+    ap.add_argument("--queue-cap", type=int, default=0)
+    ap.add_argument("--machine-skew", type=float, default=0.0,
+                    help="Lognormal sigma of each machine's real / promised run time (0 = machines keep their word)")
+    ap.add_argument("--duration-noise", type=float, default=0.0, help="Lognormal sigma of each job's run time")
+    ap.add_argument("--heartbeat-s", type=float, default=0.0, help="Machines re-advertise this often (registry)")
+    ap.add_argument("--keepalive-s", type=float, default=60.0, help="MQTT keepalive: a hung machine's LWT after 1.5x")
+    ap.add_argument("--preempt", choices=("off", "restart", "checkpoint"), default="off",
+                    help="A higher-priority job takes the slot of a running one (machine.py / supervisor_opt.py "
+                         "--preempt)")
+
+    ap.add_argument("--steal", action="store_true",
+                    help="Idle machines take queued jobs of their peers that they finish sooner (machine.py --steal)")
+    ap.add_argument("--steal-margin", type=float, default=0.5,
+                    help="Seconds an idle machine must finish a queued job sooner to be granted it")
+    ap.add_argument("--steal-threshold", type=int, default=1,
+                    help="Queued jobs above which a machine announces its backlog; idle machines only offer "
+                         "while a peer has one")
+
+    # Machine failures
+    ap.add_argument("--crash", action="append", default=[],
+                    help="K@T: K machines (picked by --seed) fail T s into the run (repeatable)")
+    ap.add_argument("--crash-mode", choices=("crash", "hang"), default="crash",
+                    help="crash: LWT at once; hang: the machine goes silent, LWT after 1.5 x --keepalive-s")
+    ap.add_argument("--restart-s", type=float, default=0.0,
+                    help="Failed machines come back, empty, after N s (0 = never)")
+
+    # Supervisor (same meaning as in supervisor_opt.py)
+    ap.add_argument("--deadline", type=float, default=0.8)
+    ap.add_argument("--min-bids", type=int, default=0)
+    ap.add_argument("--quiet-ms", type=int, default=0)
+    ap.add_argument("--adaptive-deadline", action="store_true")
+    ap.add_argument("--deadline-quantile", type=float, default=0.99)
+    ap.add_argument("--deadline-margin-ms", type=int, default=20)
+    ap.add_argument("--deadline-floor-ms", type=int, default=50)
+    ap.add_argument("--deadline-samples", type=int, default=20)
+    ap.add_argument("--learn-eta", action="store_true")
+    ap.add_argument("--eta-alpha", type=float, default=0.3)
+    ap.add_argument("--eta-risk", type=float, default=0.0)
+    ap.add_argument("--guard-fast", action="store_true")
+    ap.add_argument("--alpha", type=float, default=1.15)
+    ap.add_argument("--wait-done", action="store_true")
+    ap.add_argument("--done-timeout-s", type=float, default=10.0)
+    ap.add_argument("--done-slack", type=float, default=1.0)
+    ap.add_argument("--max-auctions", type=int, default=4)
+    ap.add_argument("--max-jobs", type=int, default=12)
+    ap.add_argument("--per-machine", type=int, default=1)
+    ap.add_argument("--registry", action="store_true")
+    ap.add_argument("--direct", action="store_true")
+    ap.add_argument("--sample-k", type=int, default=0)
+    ap.add_argument("--sample-policy", choices=SAMPLE_POLICIES, default="random")
+    ap.add_argument("--shared-topics", action="store_true")
+
+    # Streaming arrivals (intake.py)
+    ap.add_argument("--arrival-rate", type=float, default=0.0,
+                    help="Jobs per second sent to the intake at Poisson times (0 = every job at the start)")
+    ap.add_argument("--due-s", type=float, default=0.0, help="Due time of each job after its arrival (0 = none)")
+    ap.add_argument("--priority-frac", type=float, default=0.0, help="Share of the jobs with priority 1")
+    ap.add_argument("--intake-limit", type=int, default=1000)
+    ap.add_argument("--intake-resume", type=int, default=None)
+    ap.add_argument("--admit-late", action="store_true")
+    ap.add_argument("--drop-expired", action="store_true")
+    ap.add_argument("--intake-status-s", type=float, default=1.0)
+
+    # Job DAG (dag.py)
+    ap.add_argument("--dag", default="", help="DAG file or chains (cut>drill>paint*10): pipeline releases jobs on "
+                                              "Done, sequential runs them serialized (--wait-done)")
+    ap.add_argument("--dag-order", choices=("cp", "fifo", "serial"), default="cp",
+                    help="Released jobs by critical path or release order; serial = --mode sequential")
+    return ap
+
+
+def main():
+    args = build_parser().parse_args()
+    caps = fleet(args.machines, args.seed)
+    dag = parse_dag(args.dag) if args.dag else None
+    if args.job_list:
+        job_types = [jt.strip() for jt in args.job_list.split(",") if jt.strip()]
+    elif dag is not None:
+        job_types = []
+    else:
+        job_types = random_jobs(caps, args.jobs, args.seed)
+    if dag is not None and args.dag_order == "serial":
+        args.mode = "sequential"
+    if dag is not None and args.mode == "sequential":
+        job_types, dag = job_types + JobDag(dag).topological(), None
+        args.wait_done = True
+    stats = simulate(args, job_types, caps, dag=dag)
+    print("[SIM] SUMMARY: " + " ".join(
+        f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in stats.items() if v is not None))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import random
+import time
+
+from assignment import INF, RUN_ALL_CAPS, evaluate, greedy_schedule, lower_bound, plan_batch
+
+"""
+Scheduling strategies for a whole job list, given known machine ETAs
+({machine_id: {job_type: seconds}}, e.g. from a batch CfP).
+
+Every strategy returns {machine_id: [job index, ...] in run order}:
+- fifo          list order, lowest ETA among the machines free at issue time (what the auction does)
+- list          list order, each job to the machine that finishes it first (ECT)
+- lpt           longest best-case job first, then ECT
+- edf           earliest deadline first (jobs without one last), then ECT
+- min-min       repeatedly place the job with the smallest earliest completion time
+- max-min       repeatedly place the job with the largest earliest completion time
+- lookahead-k   list order; the machine of each job is the one minimizing the finish time of
+                the next k jobs placed by ECT (--guard-fast generalized to k jobs)
+- hungarian     assignment.plan_batch() (Hungarian rounds + local search)
+
+Select one with get_strategy("lookahead-3").
+"""
+
+
+def parse_jobs(spec: str) -> tuple[list[str], list[float | None]]:
+    """ "cut,drill@12,paint" -> (["cut", "drill", "paint"], [None, 12.0, None]); @ is a due time in seconds."""
+    types, dues = [], []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        jt, _, due = item.partition("@")
+        types.append(jt.strip())
+        dues.append(float(due) if due else None)
+    return types, dues
+
+
+class Strategy:
+    name = ""
+
+    def plan(self, job_types: list[str], etas: dict, deadlines: list | None = None) -> dict[str, list[int]]:
+        raise NotImplementedError
+
+
+class FifoStrategy(Strategy):
+    name = "fifo"
+
+    def plan(self, job_types, etas, deadlines=None):
+        return greedy_schedule(job_types, etas)
+
+
+class ListStrategy(Strategy):
+    """Jobs in order(), each to the machine with the earliest completion time."""
+    name = "list"
+
+    def order(self, job_types, etas, deadlines) -> list[int]:
+        return list(range(len(job_types)))
+
+    def plan(self, job_types, etas, deadlines=None):
+        machines = sorted(etas)
+        ready = {m: 0.0 for m in machines}
+        plan = {m: [] for m in machines}
+        for j in self.order(job_types, etas, deadlines):
+            jt = job_types[j]
+            m = min(machines, key=lambda m: ready[m] + etas[m].get(jt, INF))
+            if jt not in etas[m]:
+                continue  # nobody can run it
+            plan[m].append(j)
+            ready[m] += etas[m][jt]
+        return {m: js for m, js in plan.items() if js}
+
+
+def _best_eta(job_types, etas) -> list[float]:
+    return [min(e.get(jt, INF) for e in etas.values()) for jt in job_types]
+
+
+class LptStrategy(ListStrategy):
+    name = "lpt"
+
+    def order(self, job_types, etas, deadlines):
+        best = _best_eta(job_types, etas)
+        return sorted(range(len(job_types)), key=lambda j: -best[j])
+
+
+class EdfStrategy(ListStrategy):
+    name = "edf"
+
+    def order(self, job_types, etas, deadlines):
+        deadlines = deadlines or [None] * len(job_types)
+        return sorted(range(len(job_types)), key=lambda j: (deadlines[j] is None, deadlines[j] or 0.0, j))
+
+
+class MinMinStrategy(Strategy):
+    name = "min-min"
+    pick_max = False
+
+    def plan(self, job_types, etas, deadlines=None):
+        machines = sorted(etas)
+        ready = {m: 0.0 for m in machines}
+        plan = {m: [] for m in machines}
+        # Jobs of one type are interchangeable: keep the remaining ones per type, in list order
+        remaining = {}
+        for j, jt in enumerate(job_types):
+            if any(jt in etas[m] for m in machines):
+                remaining.setdefault(jt, []).append(j)
+        for jobs in remaining.values():
+            jobs.reverse()
+        while remaining:
+            choice = None  # (completion, job_type, machine)
+            for jt in remaining:
+                m = min((m for m in machines if jt in etas[m]), key=lambda m: ready[m] + etas[m][jt])
+                done_at = ready[m] + etas[m][jt]
+                if choice is None or (done_at > choice[0] if self.pick_max else done_at < choice[0]):
+                    choice = (done_at, jt, m)
+            done_at, jt, m = choice
+            plan[m].append(remaining[jt].pop())
+            ready[m] = done_at
+            if not remaining[jt]:
+                del remaining[jt]
+        return {m: js for m, js in plan.items() if js}
+
+
+class MaxMinStrategy(MinMinStrategy):
+    name = "max-min"
+    pick_max = True
+
+
+class LookaheadStrategy(Strategy):
+    name = "lookahead"
+
+    def __init__(self, k: int = 2) -> None:
+        self.k = k
+        self.name = f"lookahead-{k}"
+
+    def plan(self, job_types, etas, deadlines=None):
+        machines = sorted(etas)
+        ready = {m: 0.0 for m in machines}
+        plan = {m: [] for m in machines}
+        for j, jt in enumerate(job_types):
+            capable = [m for m in machines if jt in etas[m]]
+            if not capable:
+                continue
+            window = job_types[j + 1:j + 1 + self.k]
+            best = None  # ((window finish, own completion), machine)
+            for m in capable:
+                sim = dict(ready)
+                sim[m] += etas[m][jt]
+                finish = sim[m]
+                for nt in window:
+                    mm = min(machines, key=lambda x: sim[x] + etas[x].get(nt, INF))
+                    if nt in etas[mm]:
+                        sim[mm] += etas[mm][nt]
+                        finish = max(finish, sim[mm])
+                score = (finish, ready[m] + etas[m][jt])
+                if best is None or score < best[0]:
+                    best = (score, m)
+            m = best[1]
+            plan[m].append(j)
+            ready[m] += etas[m][jt]
+        return {m: js for m, js in plan.items() if js}
+
+
+class HungarianStrategy(Strategy):
+    name = "hungarian"
+
+    def plan(self, job_types, etas, deadlines=None):
+        return plan_batch(job_types, etas)
+
+
+STRATEGIES = {cls.name: cls for cls in (FifoStrategy, ListStrategy, LptStrategy, EdfStrategy,
+                                        MinMinStrategy, MaxMinStrategy, HungarianStrategy)}
+
+
+def get_strategy(spec: str) -> Strategy:
+    """Strategy by name; "lookahead-k" takes the window size (lookahead = lookahead-2)."""
+    if spec.startswith("lookahead"):
+        _, _, k = spec.partition("-")
+        return LookaheadStrategy(int(k) if k else 2)
+    if spec not in STRATEGIES:
+        raise ValueError(f"unknown strategy {spec!r} (choose from {', '.join(list(STRATEGIES) + ['lookahead-k'])})")
+    return STRATEGIES[spec]()
+
+
+# ---------- Comparison harness ----------
+
+def workloads(n: int, seed: int) -> dict:
+    """Synthetic (job_types, deadlines, etas) sets."""
+    rng = random.Random(seed)
+    types = ["cut", "drill", "paint"]
+    out = {}
+
+    jobs = [rng.choice(types) for _ in range(n)]
+    out["uniform"] = (jobs, None, RUN_ALL_CAPS)
+
+    jobs = [rng.choices(types, weights=(1, 8, 1))[0] for _ in range(n)]
+    out["drill-heavy"] = (jobs, None, RUN_ALL_CAPS)
+
+    # Few long jobs at the end of the list: the classic LPT case
+    jobs = [rng.choice(["cut", "paint"]) for _ in range(n - n // 10)] + ["drill"] * (n // 10)
+    out["long-tail"] = (jobs, None, RUN_ALL_CAPS)
+
+    # Due dates spread over the ideal makespan
+    jobs = [rng.choice(types) for _ in range(n)]
+    horizon = lower_bound(jobs, RUN_ALL_CAPS) * 1.3
+    out["due-dates"] = (jobs, [rng.uniform(0.1, 1.0) * horizon for _ in jobs], RUN_ALL_CAPS)
+
+    # Unrelated machines: 6 types, 16 machines, each good at two types
+    kinds = ["cut", "drill", "paint", "weld", "sand", "mill"]
+    caps = {f"U{k + 1:02d}": {t: round(rng.uniform(1.0, 2.0) if h in (k % 6, (k + 1) % 6) else rng.uniform(3.0, 8.0), 1)
+                              for h, t in enumerate(kinds)} for k in range(16)}
+    jobs = [rng.choice(kinds) for _ in range(n)]
+    out["unrelated"] = (jobs, None, caps)
+    return out
+
+
+def compare(n: int, names: list[str], seed: int = 3) -> None:
+    print(f"{'workload':12s} {'strategy':12s} {'makespan':>9s} {'mean flow':>10s} {'util':>6s} {'late':>6s} {'plan ms':>8s}")
+    for wl, (jobs, deadlines, caps) in workloads(n, seed).items():
+        for name in names:
+            strategy = get_strategy(name)
+            t0 = time.perf_counter()
+            plan = strategy.plan(jobs, caps, deadlines)
+            plan_ms = (time.perf_counter() - t0) * 1000
+            r = evaluate(plan, jobs, caps, deadlines)
+            late = f"{r['late_ratio'] * 100:5.1f}%" if deadlines else "     -"
+            print(f"{wl:12s} {strategy.name:12s} {r['makespan_s']:9.1f} {r['mean_flow_s']:10.1f} "
+                  f"{r['utilization'] * 100:5.1f}% {late} {plan_ms:8.1f}")
+        print()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare scheduling strategies on synthetic workloads")
+    ap.add_argument("--jobs", type=int, default=300, help="Jobs per workload")
+    ap.add_argument("--strategies", default="fifo,list,lpt,edf,min-min,max-min,lookahead-1,lookahead-3,hungarian")
+    ap.add_argument("--seed", type=int, default=3)
+    args = ap.parse_args()
+    compare(args.jobs, [s.strip() for s in args.strategies.split(",") if s.strip()], args.seed)
+
+
+if __name__ == "__main__":
+    main()
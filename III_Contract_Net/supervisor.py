@@ -1,20 +1,32 @@
 import argparse
 import time
 import threading
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import paho.mqtt.client as mqtt
 from common import (
     CfP, Accept, now_s, jload, new_job_id,
-    t_cfp, t_proposals, t_accept, t_done
+    t_cfp, t_proposals, t_accept, t_done, t_reject
 )
+from metrics import REGISTRY, start_http_server
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
+JOBS = REGISTRY.counter("cnp_jobs_total", "Jobs by outcome", ("agent", "job_type", "outcome"))
+JOB_SECONDS = REGISTRY.histogram("cnp_job_seconds", "Job latency (machine: run time, supervisor: CfP to Done)",
+                                 ("agent", "job_type"))
+AWARD_SECONDS = REGISTRY.histogram("cnp_award_seconds", "CfP to Accept latency (bid collection)", ("agent",))
+IN_FLIGHT = REGISTRY.gauge("cnp_jobs_in_flight", "Jobs awarded and not Done yet", ("agent",))
 
 """
 Supervisor:
 - Publishes CfP for each job type with a deadline.
 - Collects proposals until the deadline.
-- Picks the lowest ETA and sends Accept to that machine.
-- Optionally waits for DONE.
+- Picks the lowest ETA and sends Accept to that machine; on a Reject (the machine has no room left) the next-lowest
+  bid of the round gets the job, else a new CfP round (at most --max-reissues).
+- Optionally waits for DONE, at most --done-timeout-s after ETA x --done-slack: a machine that died
+  after its Accept never sends it, so the job goes back to a new CfP round instead of hanging the run.
 """
 
 def main():
@@ -35,8 +47,15 @@ def main():
         action="store_true",
         help="Wait for DONE before moving to the next job"
     )
+    ap.add_argument("--done-timeout-s", type=float, default=10.0,
+                    help="With --wait-done, ask again if no DONE arrives this many seconds after the ETA "
+                         "(0 = wait forever)")
+    ap.add_argument("--done-slack", type=float, default=1.0, help="The DONE timeout starts after ETA x this factor")
+    ap.add_argument("--max-reissues", type=int, default=3,
+                    help="New CfP rounds for a timed-out or rejected job before giving up")
     ap.add_argument("--broker", default="localhost", help="MQTT broker host")
     ap.add_argument("--port", type=int, default=1883, help="MQTT broker port")
+    ap.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port (0 = off)")
     args = ap.parse_args()
 
     job_types = [x.strip() for x in args.jobs.split(",") if x.strip()]
@@ -44,17 +63,35 @@ def main():
     client = mqtt.Client(client_id="supervisor", clean_session=True)
 
     proposals = defaultdict(list)    # job_id -> list of proposals
+    issued = {}                      # job_id -> (CfP time, job_type)
     done_events = {}                 # job_id -> threading.Event
+    winners = {}                     # job_id -> (machine_id, reissues, machines tried)
+    rejected = deque()               # (job_id, job_type, CfP time) rejected by their winner
 
     def on_connect(client, _userdata, _flags, rc):
         if rc == 0:
             client.subscribe(t_proposals(), qos=0)
             client.subscribe(t_done(), qos=0)
+            client.subscribe(t_reject(), qos=0)
             print("[SUP] Connected")
         else:
             print(f"[SUP] Connect failed rc={rc}")
 
+    m_in_proposal = MSGS_IN.labels(agent="supervisor", topic_class="proposal")
+    m_in_done = MSGS_IN.labels(agent="supervisor", topic_class="done")
+    m_in_reject = MSGS_IN.labels(agent="supervisor", topic_class="reject")
+    m_out_cfp = MSGS_OUT.labels(agent="supervisor", topic_class="cfp")
+    m_out_accept = MSGS_OUT.labels(agent="supervisor", topic_class="accept")
+    m_handler_proposal = HANDLER_SECONDS.labels(agent="supervisor", topic_class="proposal")
+    m_handler_done = HANDLER_SECONDS.labels(agent="supervisor", topic_class="done")
+    m_award = AWARD_SECONDS.labels(agent="supervisor")
+    m_in_flight = IN_FLIGHT.labels(agent="supervisor")
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
     def on_proposal(_client, _userdata, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        m_in_proposal.inc()
         try:
             p = jload(msg.payload)
             jid = p["job_id"]
@@ -62,11 +99,20 @@ def main():
             print(f"[SUP] Proposal: job={jid} type={p['job_type']} from={p['machine_id']} eta={p['eta_s']}s")
         except Exception as e:
             print(f"[SUP] on_proposal error: {e}")
+        if t0:
+            m_handler_proposal.observe(time.perf_counter() - t0)
 
     def on_done(_client, _userdata, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        m_in_done.inc()
         try:
             d = jload(msg.payload)
             jid = d["job_id"]
+            if jid in issued:
+                t_cfp_sent, jt = issued.pop(jid)
+                JOBS.labels(agent="supervisor", job_type=jt, outcome="done").inc()
+                JOB_SECONDS.labels(agent="supervisor", job_type=jt).observe(now_s() - t_cfp_sent)
+                m_in_flight.dec()
             elapsed = d["finished_at"] - d["started_at"]
             print(f"[SUP] DONE: job={jid} by={d['machine_id']} elapsed={elapsed:.2f}s")
             ev = done_events.get(jid)
@@ -74,15 +120,93 @@ def main():
                 ev.set()
         except Exception as e:
             print(f"[SUP] on_done error: {e}")
+        if t0:
+            m_handler_done.observe(time.perf_counter() - t0)
+
+    def on_reject(_client, _userdata, msg):
+        m_in_reject.inc()
+        try:
+            r = jload(msg.payload)
+            jid = r["job_id"]
+            winner = winners.get(jid)
+            if winner is None or winner[0] != r["machine_id"]:
+                return
+            entry = issued.pop(jid, None)
+            if entry is None:
+                return
+            t_cfp_sent, jt = entry
+            JOBS.labels(agent="supervisor", job_type=jt, outcome="rejected").inc()
+            m_in_flight.dec()
+            print(f"[SUP] REJECTED ({r['reason']}): job={jid} type={jt} by {r['machine_id']}")
+            rejected.append((jid, jt, t_cfp_sent))
+            ev = done_events.get(jid)
+            if ev:
+                ev.set()
+        except Exception as e:
+            print(f"[SUP] on_reject error: {e}")
 
     client.on_connect = on_connect
     client.message_callback_add(t_proposals(), on_proposal)
     client.message_callback_add(t_done(), on_done)
+    client.message_callback_add(t_reject(), on_reject)
     client.connect(args.broker, args.port, 60)
     client.loop_start()
 
+    def award(jid, jt, issued_at):
+        """Sends Accept to the lowest-ETA bid of the round not tried yet; False if none is left."""
+        _mid, reissues, tried = winners[jid]
+        ps = [p for p in proposals[jid] if p["machine_id"] not in tried]
+        if not ps:
+            return False
+        win = min(ps, key=lambda p: float(p["eta_s"]))
+        tried.add(win["machine_id"])
+        winners[jid] = (win["machine_id"], reissues, tried)
+        print(f"[SUP] WIN: job={jid} type={jt} -> {win['machine_id']} (eta={win['eta_s']}s)")
+
+        # Send Accept to the winner only
+        done_events[jid].clear()
+        issued[jid] = (issued_at, jt)
+        client.publish(t_accept(win["machine_id"]), Accept(jid, jt).to_msg(), qos=0)
+        m_out_accept.inc()
+        m_award.observe(now_s() - issued_at)
+        m_in_flight.inc()
+
+        # Optionally wait for DONE (or a Reject)
+        if args.wait_done:
+            timeout = (float(win["eta_s"]) * args.done_slack + args.done_timeout_s
+                       if args.done_timeout_s > 0 else None)
+            if not done_events[jid].wait(timeout) and issued.pop(jid, None) is not None:
+                m_in_flight.dec()
+                JOBS.labels(agent="supervisor", job_type=jt, outcome="timed_out").inc()
+                print(f"[SUP] TIMEOUT: job={jid} type={jt} by {win['machine_id']}")
+                if reissues < args.max_reissues:
+                    jobs.appendleft((jt, reissues + 1))
+        return True
+
+    def settled():
+        """Nothing left to award; without --wait-done the last Accepts get one deadline for a Reject."""
+        if jobs or rejected:
+            return False
+        t0 = now_s()
+        while not args.wait_done and issued and not rejected and now_s() - t0 < args.deadline:
+            time.sleep(0.02)
+        return not rejected
+
+    jobs = deque((jt, 0) for jt in job_types)   # (job_type, reissues)
     try:
-        for jt in job_types:
+        while not settled():
+            if rejected:
+                # The winner had no room left: next-best bid of the round, else a new CfP round
+                jid, jt, issued_at = rejected.popleft()
+                if not award(jid, jt, issued_at):
+                    reissues = winners[jid][1]
+                    if reissues < args.max_reissues:
+                        jobs.appendleft((jt, reissues + 1))
+                    else:
+                        JOBS.labels(agent="supervisor", job_type=jt, outcome="lost").inc()
+                        print(f"[SUP] job={jid} type={jt}: no machine took it, giving up")
+                continue
+            jt, reissues = jobs.popleft()
             jid = new_job_id()
             proposals[jid].clear()
             done_events[jid] = threading.Event()
@@ -90,6 +214,7 @@ def main():
             # Send CfP for this job
             cfp = CfP(job_id=jid, job_type=jt, deadline_s=args.deadline, issued_at=now_s())
             client.publish(t_cfp(jt), cfp.to_msg(), qos=0)
+            m_out_cfp.inc()
             print(f"\n[SUP] CFP: job={jid} type={jt} deadline={args.deadline:.2f}s")
 
             # Wait for proposals until deadline
@@ -100,18 +225,12 @@ def main():
             ps = proposals[jid]
             if not ps:
                 print(f"[SUP] No proposals for job={jid} (skipped)")
+                JOBS.labels(agent="supervisor", job_type=jt, outcome="skipped").inc()
                 continue
 
             # Pick lowest ETA
-            win = min(ps, key=lambda p: float(p["eta_s"]))
-            print(f"[SUP] WIN: job={jid} type={jt} -> {win['machine_id']} (eta={win['eta_s']}s)")
-
-            # Send Accept to the winner only
-            client.publish(t_accept(win["machine_id"]), Accept(jid, jt).to_msg(), qos=0)
-
-            # Optionally wait for DONE
-            if args.wait_done:
-                done_events[jid].wait()
+            winners[jid] = (None, reissues, set())
+            award(jid, jt, cfp.issued_at)
     finally:
         client.loop_stop()
         client.disconnect()
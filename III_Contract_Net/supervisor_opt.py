@@ -1,21 +1,72 @@
-import argparse, time, threading
-from collections import defaultdict
+import argparse, signal, time, threading
 import paho.mqtt.client as mqtt
-from common import CfP, Accept, now_s, jload, new_job_id, t_cfp, t_proposals, t_accept, t_done
+from common import (JobStatus, IntakeStatus, now_s, jload, t_proposals, t_reject, t_done, t_batch_proposals,
+                    t_registry, t_replies, t_jobs, t_intake, t_reassigned)
+from metrics import REGISTRY, start_http_server
+from dag import JobDag, parse_dag
+from deadlines import DeadlineTracker
+from durations import DurationModel
+from intake import JobQueue, tail_jobs
+from pipeline import SequentialSupervisor, PipelinedSupervisor, BatchSupervisor
+from registry import Registry, SAMPLE_POLICIES
+from strategies import get_strategy, parse_jobs
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
 
 """
 Optimized Supervisor:
-- Early stop: end bidding when min bids reached or after a quiet period.
+- Early stop: end bidding when min bids reached or after a quiet period (event-driven, see auction.py).
+- Adaptive deadline (--adaptive-deadline): each round waits the p99 (--deadline-quantile) of the proposal
+  latency seen for its job type plus a margin, within [--deadline-floor-ms, --deadline] (see deadlines.py).
+- Learned ETAs (--learn-eta): the run times reported by Done correct the machines' bids before ranking
+  them, optionally risk-adjusted (see durations.py).
 - Lookahead (n=1): if next job has same type, optionally keep the fastest free by picking second-best
   when it's close enough (factor alpha).
 - Dedicated topics are already used via t_cfp(job_type).
+- Sequential (default): one CfP round at a time (pipeline.SequentialSupervisor).
+- Pipeline (--pipeline): several CfP rounds and jobs in flight at once (see pipeline.py).
+- Batch (--batch K): one CfP per block of K jobs, planned as a whole by --strategy (see strategies.py).
+- Reject: a winner that has no room left answers the Accept with a Reject; the job goes to the next-best
+  bid of its round whose reservation is still valid, else to a new CfP round (--max-reissues). A job
+  without DONE --done-timeout-s after ETA x --done-slack is handled the same way.
+- Machine failures (with the registry): the running jobs of a machine whose offline Advert arrives (its
+  LWT) or whose heartbeats stop (machine.py --heartbeat-s) are awarded again at once, without waiting
+  for their DONE timeout.
+- Work stealing (machines started with --steal): an idle machine may take over one of our queued jobs; its
+  Reassigned message (on the reply topic of the Accept) moves the job, its ETA and Done timeout to the new
+  machine, so a Reject, a timeout or the loss of the machine is judged against the machine that runs it.
+- Registry (--registry): machines advertise caps and state as retained messages (see registry.py); a round
+  closes as soon as every registered machine able to take the job has bid. --direct awards from the
+  registry without any CfP round (a CfP is only used when no registered machine has room).
+  --sample-k K sends each CfP to K machines picked by the registry instead of broadcasting it.
+- Reply topics: every CfP and Accept names lab/cnp/replies/<--name>/... as its reply topic (and its job id
+  as correlation id), so the machines answer this supervisor alone and it only receives the answers to its
+  own jobs. --mqtt5 carries both as Response Topic / Correlation Data properties as well; --shared-topics
+  uses the shared proposals / done / reject topics instead (every supervisor receives every answer).
+- Intake (--intake, --intake-file): a service taking jobs while it runs, from lab/cnp/jobs/<--name> and/or
+  a followed file, into a priority / due time queue with admission control (see intake.py); the retained
+  lab/cnp/intake/<--name> state tells the producers when to hold. SIGINT / SIGTERM stop the intake, the
+  queued and running jobs are finished, then the summary is printed. Each CfP / Accept carries the job's
+  priority, which the machines queue by; --preempt (machines started with --preempt) lets a higher class
+  past --max-jobs / --per-machine onto machines running lower-priority jobs (see pipeline.py).
+- Job DAG (--dag): each job starts once the jobs it depends on are Done, independent branches in parallel,
+  released jobs by critical path (see dag.py); --dag-order serial runs the DAG one job at a time instead.
 """
 
+def report(stats: dict) -> None:
+    print("\n[SUP+] SUMMARY: " + " ".join(
+        f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in stats.items() if v is not None))
+
 def main():
     ap = argparse.ArgumentParser(description="Contract Net Supervisor (optimized)")
-    ap.add_argument("--jobs", default="cut,drill,cut,paint,drill", help="Comma-separated job types")
+    ap.add_argument("--jobs", default=None,
+                    help="Comma-separated job types, optionally with a due time in seconds (paint@12) "
+                         "(default cut,drill,cut,paint,drill; none with --dag / --intake / --intake-file)")
     ap.add_argument("--deadline", type=float, default=1.0, help="Max seconds to wait per round")
     ap.add_argument("--wait-done", action="store_true", help="Wait for DONE before next job")
+    ap.add_argument("--drain-s", type=float, default=30.0,
+                    help="Without --wait-done: wait up to N s for outstanding DONEs before the summary")
 
     # Optimizations
     ap.add_argument("--min-bids", type=int, default=0, help="Early-stop when at least this many proposals arrive")
@@ -25,106 +76,334 @@ def main():
     ap.add_argument("--alpha", type=float, default=1.15,
                     help="Second-best ETA must be <= alpha * best ETA to be chosen (with --guard-fast)")
 
+    # Adaptive deadlines
+    ap.add_argument("--adaptive-deadline", action="store_true",
+                    help="Size each round's deadline from the observed proposal latency (--deadline is the cap)")
+    ap.add_argument("--deadline-quantile", type=float, default=0.99,
+                    help="Proposal latency quantile a round waits for (with --adaptive-deadline)")
+    ap.add_argument("--deadline-margin-ms", type=int, default=20, help="Added to the quantile (with --adaptive-deadline)")
+    ap.add_argument("--deadline-floor-ms", type=int, default=50, help="Shortest deadline (with --adaptive-deadline)")
+    ap.add_argument("--deadline-samples", type=int, default=20,
+                    help="Bids of a job type seen before its deadline adapts (with --adaptive-deadline)")
+
+    # Learned run times
+    ap.add_argument("--learn-eta", action="store_true",
+                    help="Rank bids by ETAs corrected with the run times seen in Done messages")
+    ap.add_argument("--eta-alpha", type=float, default=0.3, help="EWMA weight of a new run time (with --learn-eta)")
+    ap.add_argument("--eta-risk", type=float, default=0.0,
+                    help="Standard deviations of run time added to a corrected ETA (with --learn-eta)")
+
+    # Pipelining
+    ap.add_argument("--pipeline", action="store_true",
+                    help="Overlap CfP rounds and jobs instead of one job at a time (implies waiting for DONE)")
+    ap.add_argument("--max-auctions", type=int, default=4, help="Max CfP rounds open at once (with --pipeline)")
+    ap.add_argument("--max-jobs", type=int, default=12,
+                    help="Max jobs in the pipeline, open rounds included (with --pipeline)")
+    ap.add_argument("--per-machine", type=int, default=1,
+                    help="Max of our jobs one machine may hold (with --pipeline; >1 for machines with --queue-cap)")
+
+    # Job DAG
+    ap.add_argument("--dag", default="",
+                    help="Job DAG: JSON file {name: {type, after: [names]}} or chains cut>drill>paint*4; a job starts "
+                         "once its predecessors are Done (implies --pipeline)")
+    ap.add_argument("--dag-order", choices=("cp", "fifo", "serial"), default="cp",
+                    help="Released DAG jobs by critical path or release order; serial: one job at a time in "
+                         "topological order (sequential loop, --wait-done)")
+
+    # Streaming intake
+    ap.add_argument("--intake", action="store_true",
+                    help="Take JobRequests from lab/cnp/jobs/<name> until SIGINT / SIGTERM (implies --pipeline)")
+    ap.add_argument("--intake-file", default="",
+                    help="Take jobs from this file, followed like tail -f: job_type[@due_s][!priority] or a "
+                         "JSON JobRequest per item (implies --pipeline)")
+    ap.add_argument("--intake-eof", action="store_true",
+                    help="Stop taking jobs at the end of --intake-file, finish them and exit")
+    ap.add_argument("--intake-limit", type=int, default=1000,
+                    help="Queued jobs at which the intake stops accepting (backpressure)")
+    ap.add_argument("--intake-resume", type=int, default=None,
+                    help="Queued jobs at which it accepts again (default half of --intake-limit)")
+    ap.add_argument("--intake-status-s", type=float, default=1.0,
+                    help="Publish the retained intake state (accepting, depth) every N s, and when accepting changes")
+    ap.add_argument("--preempt", action="store_true",
+                    help="The machines preempt lower-priority jobs (machine.py --preempt): intake jobs of a higher "
+                         "class may exceed --max-jobs / --per-machine")
+    ap.add_argument("--admit-late", action="store_true",
+                    help="Admit jobs whose due time the queue ahead of them would miss (refused by default)")
+    ap.add_argument("--drop-expired", action="store_true",
+                    help="Drop queued jobs whose due time passed instead of running them late")
+    ap.add_argument("--batch", type=int, default=0,
+                    help="Plan blocks of this many jobs with one batch CfP (implies waiting for DONE)")
+    ap.add_argument("--strategy", default="",
+                    help="Batch planning strategy: fifo, list, lpt, edf, min-min, max-min, lookahead-k, hungarian "
+                         "(default hungarian; without --batch the whole job list is one block)")
+
+    # Registry
+    ap.add_argument("--registry", action="store_true",
+                    help="Track the machines' retained adverts; close a round once every free capable machine bid")
+    ap.add_argument("--direct", action="store_true",
+                    help="Award from the registry without a CfP round (implies --registry)")
+    ap.add_argument("--sample-k", type=int, default=0,
+                    help="Send each CfP to K capable machines of the registry instead of all (implies --registry)")
+    ap.add_argument("--sample-policy", choices=SAMPLE_POLICIES, default="random",
+                    help="Machines of a sampled CfP: random ones with room, or the K best-ranked (least-loaded)")
+
+    # Rejects and timeouts
+    ap.add_argument("--max-reissues", type=int, default=20,
+                    help="New CfP rounds for a job rejected by every bidder before giving up")
+    ap.add_argument("--done-timeout-s", type=float, default=10.0,
+                    help="Award the job again if no DONE arrives this many seconds after its ETA (0 = wait forever)")
+    ap.add_argument("--done-slack", type=float, default=1.0,
+                    help="The DONE timeout starts after ETA x this factor (>= 1: room for machines running late)")
+
+    # Reply routing
+    ap.add_argument("--name", default="supervisor_opt",
+                    help="Supervisor id: MQTT client id and lab/cnp/replies/<name>/... reply topics")
+    ap.add_argument("--shared-topics", action="store_true",
+                    help="Receive answers on the shared topics instead of our reply topics")
+    ap.add_argument("--mqtt5", action="store_true",
+                    help="Connect with MQTT v5 (reply topic and correlation id as PUBLISH properties)")
+
     ap.add_argument("--broker", default="localhost")
     ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port (0 = off)")
     args = ap.parse_args()
 
-    job_types = [x.strip() for x in args.jobs.split(",") if x.strip()]
-    client = mqtt.Client(client_id="supervisor_opt", clean_session=True)
+    use_intake = args.intake or bool(args.intake_file)
+    if args.jobs is None:
+        args.jobs = "" if use_intake or args.dag else "cut,drill,cut,paint,drill"
+    if (use_intake or args.dag) and (args.batch > 0 or args.strategy):
+        raise SystemExit("[SUP+] --dag / --intake / --intake-file run the pipeline, not --batch / --strategy")
+    job_types, due_s = parse_jobs(args.jobs)
+    dag = JobDag(parse_dag(args.dag), "fifo" if args.dag_order == "serial" else args.dag_order) if args.dag else None
+    if dag is not None and args.dag_order == "serial":
+        if use_intake:
+            raise SystemExit("[SUP+] --dag-order serial runs the sequential loop, not --intake / --intake-file")
+        job_types, due_s, dag = job_types + dag.topological(), due_s + [None] * dag.total, None
+        args.wait_done, args.pipeline = True, False
+    if use_intake or dag is not None:
+        args.pipeline = True
+    if args.strategy and args.batch <= 0:
+        args.batch = len(job_types)
+    registry = Registry() if args.registry or args.direct or args.sample_k > 0 else None
+    if args.mqtt5:
+        client = mqtt.Client(client_id=args.name, protocol=mqtt.MQTTv5)
+    else:
+        client = mqtt.Client(client_id=args.name, clean_session=True)
+    replies = "" if args.shared_topics else args.name
+    deadlines = DeadlineTracker(args.deadline, args.deadline_quantile, args.deadline_margin_ms / 1000.0,
+                                args.deadline_floor_ms / 1000.0, args.deadline_samples, adaptive=args.adaptive_deadline)
+    durations = DurationModel(args.eta_alpha, args.eta_risk) if args.learn_eta else None
+
+    connected = threading.Event()
+    intake = None
+    if use_intake:
+        def job_status(req: dict, status: str, reason: str, machine_id: str) -> None:
+            if status != "queued":
+                print(f"[SUP+] JOB {status.upper()}: request={req['request_id']} type={req['job_type']} "
+                      f"priority={req.get('priority', 0)}" + (f" ({reason})" if reason else ""))
+            if req.get("reply_to"):
+                st = JobStatus(req["request_id"], status, now_s(), reason, machine_id)
+                client.publish(req["reply_to"], st.to_msg(), qos=1)
+
+        def publish_intake(_accepting: bool = True) -> None:
+            client.publish(t_intake(args.name), intake.state(args.name).to_msg(), qos=1, retain=True)
 
-    proposals = defaultdict(list)  # job_id -> list[proposal]
-    last_rx = {}                   # job_id -> last proposal time (seconds)
-    done_events = {}               # job_id -> Event
+        intake = JobQueue(args.intake_limit, args.intake_resume, check_due=not args.admit_late,
+                          drop_expired=args.drop_expired,
+                          capable=(lambda jt: len(registry) == 0 or registry.known(jt)) if registry is not None else None,
+                          notify=job_status, on_state=publish_intake)
+        # A supervisor gone without closing its intake must not be sent jobs
+        client.will_set(t_intake(args.name), IntakeStatus(args.name, False, 0, args.intake_limit, 0.0).to_msg(),
+                        qos=1, retain=True)
+    if args.batch > 0:
+        core = BatchSupervisor(client, job_types, args.deadline, args.batch, args.min_bids,
+                               get_strategy(args.strategy or "hungarian"), due_s,
+                               max_reissues=args.max_reissues, done_timeout_s=args.done_timeout_s,
+                               done_slack=args.done_slack, registry=registry, direct=args.direct, replies=replies,
+                               mqtt5=args.mqtt5)
+    elif args.pipeline:
+        core = PipelinedSupervisor(client, job_types, args.deadline, args.max_auctions, args.max_jobs,
+                                   args.min_bids, args.quiet_ms, args.max_reissues, args.per_machine,
+                                   args.done_timeout_s, args.done_slack, registry, args.direct, args.sample_k,
+                                   args.sample_policy, replies, args.mqtt5, deadlines=deadlines, durations=durations,
+                                   intake=intake, dag=dag, preempt=args.preempt)
+    else:
+        core = SequentialSupervisor(client, job_types, args.deadline, args.min_bids, args.quiet_ms, args.max_reissues,
+                                    args.done_timeout_s, args.done_slack, registry, args.direct, args.sample_k,
+                                    args.sample_policy, replies, args.mqtt5, wait_done=args.wait_done,
+                                    drain_s=args.drain_s, guard_fast=args.guard_fast, alpha=args.alpha,
+                                    deadlines=deadlines, durations=durations)
 
-    def on_connect(client, _u, _f, rc):
+    def on_connect(client, _u, _f, rc, _props=None):
         if rc == 0:
-            client.subscribe(t_proposals(), qos=0)
-            client.subscribe(t_done(), qos=0)
+            if replies:
+                client.subscribe(t_replies(replies), qos=0)
+            else:
+                client.subscribe(t_proposals(), qos=0)
+                client.subscribe(t_done(), qos=0)
+                client.subscribe(t_reject(), qos=0)
+                client.subscribe(t_reassigned(), qos=0)
+                if args.batch > 0:
+                    client.subscribe(t_batch_proposals(), qos=0)
+            if registry is not None:
+                client.subscribe(t_registry(), qos=0)
+            if args.intake:
+                client.subscribe(t_jobs(args.name), qos=1)
+            connected.set()
             print("[SUP+] Connected")
         else:
             print(f"[SUP+] Connect failed rc={rc}")
 
+    m_in_proposal = MSGS_IN.labels(agent="supervisor_opt", topic_class="proposal")
+    m_in_done = MSGS_IN.labels(agent="supervisor_opt", topic_class="done")
+    m_in_reject = MSGS_IN.labels(agent="supervisor_opt", topic_class="reject")
+    m_handler_proposal = HANDLER_SECONDS.labels(agent="supervisor_opt", topic_class="proposal")
+    m_handler_done = HANDLER_SECONDS.labels(agent="supervisor_opt", topic_class="done")
+    m_handler_reject = HANDLER_SECONDS.labels(agent="supervisor_opt", topic_class="reject")
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
     def on_proposal(_c, _u, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        m_in_proposal.inc()
         try:
             p = jload(msg.payload)
-            jid = p["job_id"]
-            proposals[jid].append(p)
-            last_rx[jid] = now_s()
-            print(f"[SUP+] Proposal: job={jid} type={p['job_type']} from={p['machine_id']} eta={p['eta_s']}s")
+            core.on_proposal(p)
+            print(f"[SUP+] Proposal: job={p['job_id']} type={p['job_type']} from={p['machine_id']} eta={p['eta_s']}s")
         except Exception as e:
             print(f"[SUP+] on_proposal error: {e}")
+        if t0:
+            m_handler_proposal.observe(time.perf_counter() - t0)
+
+    def on_batch_proposal(_c, _u, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        m_in_proposal.inc()
+        try:
+            p = jload(msg.payload)
+            core.on_batch_proposal(p)
+            print(f"[SUP+] Batch proposal: batch={p['batch_id']} from={p['machine_id']} etas={p['etas']}")
+        except Exception as e:
+            print(f"[SUP+] on_batch_proposal error: {e}")
+        if t0:
+            m_handler_proposal.observe(time.perf_counter() - t0)
+
+    def on_advert(_c, _u, msg):
+        try:
+            if not msg.payload:
+                return  # retained advert cleared
+            core.on_advert(jload(msg.payload))
+        except Exception as e:
+            print(f"[SUP+] on_advert error: {e}")
 
     def on_done(_c, _u, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        m_in_done.inc()
         try:
             d = jload(msg.payload)
-            jid = d["job_id"]
+            core.on_done(d)
             elapsed = d["finished_at"] - d["started_at"]
-            print(f"[SUP+] DONE: job={jid} by={d['machine_id']} elapsed={elapsed:.2f}s")
-            ev = done_events.get(jid)
-            if ev: ev.set()
+            print(f"[SUP+] DONE: job={d['job_id']} by={d['machine_id']} elapsed={elapsed:.2f}s")
         except Exception as e:
             print(f"[SUP+] on_done error: {e}")
+        if t0:
+            m_handler_done.observe(time.perf_counter() - t0)
+
+    def on_reject(_c, _u, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        m_in_reject.inc()
+        try:
+            r = jload(msg.payload)
+            core.on_reject(r)
+            print(f"[SUP+] REJECT: job={r['job_id']} by={r['machine_id']} ({r['reason']})")
+        except Exception as e:
+            print(f"[SUP+] on_reject error: {e}")
+        if t0:
+            m_handler_reject.observe(time.perf_counter() - t0)
+
+    def on_reassigned(_c, _u, msg):
+        try:
+            if hasattr(core, "on_reassigned"):   # batch lanes hold one job per machine: none is queued
+                core.on_reassigned(jload(msg.payload))
+        except Exception as e:
+            print(f"[SUP+] on_reassigned error: {e}")
+
+    def on_job(_c, _u, msg):
+        try:
+            core.on_job(jload(msg.payload))
+        except Exception as e:
+            print(f"[SUP+] on_job error: {e}")
+
+    def on_result(c, u, msg):
+        # Done, Reject and Reassigned share the reply topic of the Accept
+        if b'"from_machine":' in msg.payload:
+            on_reassigned(c, u, msg)
+        else:
+            (on_reject if b'"reason":' in msg.payload else on_done)(c, u, msg)
 
     client.on_connect = on_connect
+    client.message_callback_add(t_replies(args.name, "proposals"), on_proposal)
+    client.message_callback_add(t_replies(args.name, "batch_proposals"), on_batch_proposal)
+    client.message_callback_add(t_replies(args.name, "results"), on_result)
     client.message_callback_add(t_proposals(), on_proposal)
     client.message_callback_add(t_done(), on_done)
+    client.message_callback_add(t_reject(), on_reject)
+    client.message_callback_add(t_reassigned(), on_reassigned)
+    client.message_callback_add(t_registry(), on_advert)
+    client.message_callback_add(t_batch_proposals(), on_batch_proposal)
+    client.message_callback_add(t_jobs(args.name), on_job)
     client.connect(args.broker, args.port, 60)
     client.loop_start()
+    # The first CfP must not go out before we listen for its proposals
+    if not connected.wait(10.0):
+        raise SystemExit("[SUP+] Not connected to the broker")
+    if registry is not None:
+        # The retained adverts arrive right after the subscription
+        with registry.cond:
+            registry.cond.wait_for(lambda: len(registry) > 0, args.deadline)
+        time.sleep(0.05)
+        print(f"[SUP+] Registry: {len(registry)} machine(s)")
+        if dag is not None:
+            # Critical paths in advertised run times instead of job counts
+            dag.rank(lambda jt: registry.mean_duration(jt) or 1.0)
+    if dag is not None:
+        print(f"[SUP+] DAG: {dag.total} jobs, critical path {dag.critical_path_s():.1f} "
+              f"{'s' if registry is not None else 'jobs'}, order {dag.order}")
 
+    stop_intake = threading.Event()
     try:
-        for idx, jt in enumerate(job_types):
-            jid = new_job_id()
-            proposals[jid].clear()
-            done_events[jid] = threading.Event()
-            last_rx[jid] = now_s()
-
-            cfp = CfP(job_id=jid, job_type=jt, deadline_s=args.deadline, issued_at=now_s())
-            client.publish(t_cfp(jt), cfp.to_msg(), qos=0)
-            print(f"\n[SUP+] CFP: job={jid} type={jt} deadline={args.deadline:.2f}s")
-
-            # Wait for proposals with early-stop conditions
-            t0 = now_s()
-            while True:
-                elapsed = now_s() - t0
-                if elapsed >= args.deadline:
-                    break
-                # early stop: min bids reached?
-                if args.min_bids > 0:
-                    uniq = {p["machine_id"] for p in proposals[jid]}
-                    if len(uniq) >= args.min_bids:
-                        break
-                # early stop: quiet period?
-                if args.quiet_ms > 0:
-                    if (now_s() - last_rx[jid]) * 1000.0 >= args.quiet_ms:
-                        break
-                time.sleep(0.02)
-
-            ps = proposals[jid]
-            if not ps:
-                print(f"[SUP+] No proposals for job={jid} (skipped)")
-                continue
-
-            # Sort by ETA (ascending)
-            ps_sorted = sorted(ps, key=lambda p: float(p["eta_s"]))
-            winner = ps_sorted[0]
-
-            # Light lookahead: keep fastest free if next job is the same type
-            same_next = (idx + 1 < len(job_types) and job_types[idx + 1] == jt)
-            if args.guard_fast and same_next and len(ps_sorted) >= 2:
-                best_eta = float(ps_sorted[0]["eta_s"])
-                second_eta = float(ps_sorted[1]["eta_s"])
-                if second_eta <= args.alpha * best_eta:
-                    winner = ps_sorted[1]
-                    print(f"[SUP+] GUARD-FAST: picked 2nd best to keep fastest free "
-                          f"(best={best_eta}s, second={second_eta}s, alpha={args.alpha})")
-
-            print(f"[SUP+] WIN: job={jid} type={jt} -> {winner['machine_id']} (eta={winner['eta_s']}s)")
-            client.publish(t_accept(winner["machine_id"]), Accept(jid, jt).to_msg(), qos=0)
-
-            if args.wait_done:
-                done_events[jid].wait()
+        if intake is not None:
+            def close_intake(_sig, _frame):
+                print("[SUP+] Intake closed, finishing the queued jobs")
+                stop_intake.set()
+                core.close_intake()
+
+            signal.signal(signal.SIGINT, close_intake)
+            signal.signal(signal.SIGTERM, close_intake)
+            def refresh_intake():
+                while not stop_intake.wait(args.intake_status_s):
+                    publish_intake()
+
+            publish_intake()
+            threading.Thread(target=refresh_intake, daemon=True).start()
+            if args.intake_file:
+                def feed_file():
+                    tail_jobs(args.intake_file, lambda req: core.on_job(vars(req)), stop_intake,
+                              follow=not args.intake_eof, hold=lambda: not intake.accepting)
+                    if args.intake_eof and not args.intake:
+                        core.close_intake()
+
+                threading.Thread(target=feed_file, daemon=True).start()
+            print(f"[SUP+] Intake open (limit {args.intake_limit})")
+
+        report(core.run())
 
     finally:
+        stop_intake.set()
+        if intake is not None:
+            publish_intake()
+        if durations is not None:
+            ratios = " ".join(f"{mid}={r:.2f}" for mid, r in sorted(durations.summary().items()))
+            print(f"[SUP+] Run time / promised: {ratios}")
         client.loop_stop()
         client.disconnect()
 
@@ -4,6 +4,8 @@ import threading
 import time
 import random
 
+import paho.mqtt.client as mqtt
+
 from sensor import Sensor
 from averaging_agent import AveragingAgent
 from multiprocessing import Process
@@ -53,6 +55,15 @@ AA_ON_RANGE = (3 * TW_AA, 6 * TW_AA)
 AA_OFF_RANGE = (1 * TW_AA, 3 * TW_AA)
 
 
+# Enter/leave events, recorded by the II.3 journal agent
+TOPIC_DYNAMICS = f"{REFUGE_NAME}/event/dynamics"
+
+
+def publish_dynamics_event(client, event, agent_type, agent_id):
+    payload = json.dumps({"event": event, "agent_type": agent_type, "id": agent_id, "timestamp": time.time()})
+    client.publish(TOPIC_DYNAMICS, payload=payload, qos=0)
+
+
 # Small helper to allow interruption during sleep
 def sleep_interruptible(total, stop_event, step=0.5):
     end = time.time() + total
@@ -61,7 +72,7 @@ def sleep_interruptible(total, stop_event, step=0.5):
 
 
 # Sensor life-cycle: randomly appears and disappears
-def sensor_lifecycle(cfg, stop_event):
+def sensor_lifecycle(cfg, stop_event, events_client):
     sid = cfg["sensor_id"]
 
     while not stop_event.is_set():
@@ -89,18 +100,20 @@ def sensor_lifecycle(cfg, stop_event):
         t.start()
 
         print(f"[DYNAMICS] Sensor {sid} ENTERS the system")
+        publish_dynamics_event(events_client, "enter", "sensor", sid)
 
         on_t = random.uniform(*SENSOR_ON_RANGE)
         sleep_interruptible(on_t, stop_event)
 
         print(f"[DYNAMICS] Sensor {sid} LEAVES the system")
+        publish_dynamics_event(events_client, "leave", "sensor", sid)
         sensor.stop()
         t.join(timeout=1.5)
 
 
 # Averaging Agent life-cycle
 
-def aa_lifecycle(cfg, stop_event):
+def aa_lifecycle(cfg, stop_event, events_client):
     aid = cfg["agent_id"]
 
     while not stop_event.is_set():
@@ -125,11 +138,13 @@ def aa_lifecycle(cfg, stop_event):
         t.start()
 
         print(f"[DYNAMICS] AveragingAgent {aid} ENTERS the system")
+        publish_dynamics_event(events_client, "enter", "averaging_agent", aid)
 
         on_t = random.uniform(*AA_ON_RANGE)
         sleep_interruptible(on_t, stop_event)
 
         print(f"[DYNAMICS] AveragingAgent {aid} LEAVES the system")
+        publish_dynamics_event(events_client, "leave", "averaging_agent", aid)
         agent.stop()
         t.join(timeout=1.5)
 
@@ -141,6 +156,11 @@ def main():
 
     stop_event = threading.Event()
 
+    # One shared client publishes the enter/leave events of every lifecycle
+    events_client = mqtt.Client()
+    events_client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
+    events_client.loop_start()
+
     # Start GUI in separate process
     num_aa = len(AVERAGING_AGENTS)
     gui_process = Process(target=gui_main, args=(num_aa,))
@@ -153,7 +173,7 @@ def main():
     for cfg in SENSORS:
         t = threading.Thread(
             target=sensor_lifecycle,
-            args=(cfg, stop_event),
+            args=(cfg, stop_event, events_client),
             daemon=True
         )
         t.start()
@@ -163,7 +183,7 @@ def main():
     for cfg in AVERAGING_AGENTS:
         t = threading.Thread(
             target=aa_lifecycle,
-            args=(cfg, stop_event),
+            args=(cfg, stop_event, events_client),
             daemon=True
         )
         t.start()
@@ -184,6 +204,9 @@ def main():
         for t in lifecycle_threads:
             t.join(timeout=2)
 
+        events_client.loop_stop()
+        events_client.disconnect()
+
         print("[MAIN] Shutdown complete.")
 
 
@@ -4,6 +4,13 @@ import statistics as stat
 
 import paho.mqtt.client as mqtt
 
+from metrics import REGISTRY
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
+WINDOW_SIZE = REGISTRY.gauge("mas_window_size", "Values currently held in the agent's window", ("agent", "measurement_type"))
+
 
 class AveragingAgent:
     """
@@ -38,6 +45,11 @@ class AveragingAgent:
         self._values = []
         self._lock = threading.Lock()
 
+        self._m_in = MSGS_IN.labels(agent=agent_id, topic_class="reading")
+        self._m_out = MSGS_OUT.labels(agent=agent_id, topic_class="average")
+        self._m_handler = HANDLER_SECONDS.labels(agent=agent_id, topic_class="reading")
+        self._m_window = WINDOW_SIZE.labels(agent=agent_id, measurement_type=measurement_type)
+
     # ---------- MQTT callbacks ----------
 
     def _on_connect(self, client, userdata, flags, rc):
@@ -49,6 +61,8 @@ class AveragingAgent:
         client.subscribe(self.topic_in)
 
     def _on_message(self, client, userdata, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        self._m_in.inc()
         try:
             value = float(msg.payload.decode())
         except ValueError:
@@ -57,6 +71,9 @@ class AveragingAgent:
 
         with self._lock:
             self._values.append(value)
+            self._m_window.set(len(self._values))
+        if t0:
+            self._m_handler.observe(time.perf_counter() - t0)
 
     # ---------- Public API ----------
 
@@ -81,8 +98,10 @@ class AveragingAgent:
                             self._values.clear()
                         else:
                             avg = None
+                        self._m_window.set(0)
                     if avg is not None:
                         self.client.publish(self.topic_out, payload=str(avg), qos=0)
+                        self._m_out.inc()
                         # print(
                         #     f"[{self.agent_id}] Average {self.measurement_type} "
                         #     f"in last {self.window_s}s -> {avg}"
@@ -6,6 +6,14 @@ from collections import defaultdict
 
 import paho.mqtt.client as mqtt
 
+from metrics import REGISTRY
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
+WINDOW_SIZE = REGISTRY.gauge("mas_window_size", "Values currently held in the agent's window", ("agent", "measurement_type"))
+ALERTS = REGISTRY.counter("mas_alerts_total", "Anomaly alerts raised", ("agent", "measurement_type"))
+
 
 class DetectionAgent:
     """
@@ -65,6 +73,13 @@ class DetectionAgent:
         self._last_avg_by_type: dict[str, float] = {}
         self._lock = threading.Lock()
 
+        self._m_in_reading = MSGS_IN.labels(agent="DETECT", topic_class="reading")
+        self._m_in_average = MSGS_IN.labels(agent="DETECT", topic_class="average")
+        self._m_out = MSGS_OUT.labels(agent="DETECT", topic_class="alert")
+        self._m_handler_reading = HANDLER_SECONDS.labels(agent="DETECT", topic_class="reading")
+        self._m_handler_average = HANDLER_SECONDS.labels(agent="DETECT", topic_class="average")
+        self._m_window_by_type = {}
+
     # ---------- MQTT callbacks ----------
 
     def _on_connect(self, client, userdata, flags, rc):
@@ -89,15 +104,23 @@ class DetectionAgent:
 
         if second == "AA":
             # Average from AveragingAgent: refuge/AA/<measurement_type>/<agent_id>
+            t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+            self._m_in_average.inc()
             agent_id = last
             with self._lock:
                 self._last_avg_by_type[measurement_type] = value
             # print(f"[DETECT] New average from {agent_id} for {measurement_type}: {value}")
+            if t0:
+                self._m_handler_average.observe(time.perf_counter() - t0)
         else:
             # Raw sensor reading: refuge/<room>/<measurement_type>/<sensor_id>
+            t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+            self._m_in_reading.inc()
             room = second
             sensor_id = last
             self._process_reading(measurement_type, sensor_id, value, room)
+            if t0:
+                self._m_handler_reading.observe(time.perf_counter() - t0)
 
     # ---------- Internal helpers ----------
 
@@ -108,6 +131,11 @@ class DetectionAgent:
             if len(values) > self.window_size:
                 # Keep a bounded history
                 values.pop(0)
+            m_window = self._m_window_by_type.get(measurement_type)
+            if m_window is None:
+                m_window = WINDOW_SIZE.labels(agent="DETECT", measurement_type=measurement_type)
+                self._m_window_by_type[measurement_type] = m_window
+            m_window.set(len(values))
 
             if len(values) < 2:
                 # Not enough data yet to compute a standard deviation
@@ -135,6 +163,8 @@ class DetectionAgent:
                 }
                 payload = json.dumps(alert)
                 self.client.publish(self.topic_alerts, payload=payload, qos=0)
+                self._m_out.inc()
+                ALERTS.labels(agent="DETECT", measurement_type=measurement_type).inc()
                 print(
                     f"[DETECT] Anomaly detected for sensor {sensor_id} ({measurement_type}): "
                     f"value={value:.2f}, mean={mean:.2f}, stdev={stdev:.2f}"
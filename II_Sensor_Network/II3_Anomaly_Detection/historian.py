@@ -0,0 +1,599 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+
+"""
+Historian: columnar time-series storage for readings, averages and alerts.
+
+On-disk layout (one directory):
+    series.json          series name -> series id
+    seg_<start>.open     active segment, memory-mapped, preallocated columns
+                         [header | ts int64[cap] | sid uint32[cap] | value float64[cap]]
+    seg_<start>.seg      sealed segment, points sorted by (series id, timestamp)
+                         [header | index | per-series ts column | per-series value column]
+
+Timestamps are stored as int64 microseconds since the epoch.
+Sealed segments use one of two codecs:
+    raw  columns are stored as-is, reads return views on the mmap (no copy)
+    dxz  delta-of-delta timestamps and XOR'ed float bits, zlib-packed
+"""
+
+OPEN_MAGIC = b"HISTOPN1"
+SEAL_MAGIC = b"HISTSEG1"
+
+# magic, capacity, count, t_start_us, t_min_us, t_max_us
+OPEN_HEADER = struct.Struct("<8sqqqqq")
+OPEN_HEADER_SIZE = 64
+# magic, codec, n_series, n_points, t_start_us, t_min_us, t_max_us
+SEAL_HEADER = struct.Struct("<8sqqqqqq")
+SEAL_HEADER_SIZE = 64
+# sid, count, t_min_us, t_max_us, ts_off, ts_len, val_off, val_len
+SEAL_INDEX = struct.Struct("<qqqqqqqq")
+
+CODEC_RAW = 0
+CODEC_DXZ = 1
+CODECS = {"raw": CODEC_RAW, "dxz": CODEC_DXZ}
+
+US = 1_000_000
+
+
+def now_us() -> int:
+    return int(time.time() * US)
+
+
+# ---------- Codec helpers ----------
+
+def encode_timestamps(ts: np.ndarray) -> bytes:
+    """[t0, t1 - t0, delta-of-delta...] as int64, zlib-packed."""
+    enc = np.empty(len(ts), dtype=np.int64)
+    if len(ts):
+        enc[0] = ts[0]
+    if len(ts) > 1:
+        enc[1] = ts[1] - ts[0]
+        enc[2:] = np.diff(ts, 2)
+    return zlib.compress(enc.tobytes(), 1)
+
+
+def decode_timestamps(buf: bytes, count: int) -> np.ndarray:
+    enc = np.frombuffer(zlib.decompress(buf), dtype=np.int64, count=count)
+    ts = np.empty(count, dtype=np.int64)
+    if count:
+        ts[0] = enc[0]
+        ts[1:] = enc[0] + np.cumsum(np.cumsum(enc[1:]))
+    return ts
+
+
+def encode_values(values: np.ndarray) -> bytes:
+    """Each float's bits XOR'ed with the previous one, zlib-packed."""
+    bits = values.view(np.uint64)
+    enc = bits.copy()
+    enc[1:] ^= bits[:-1]
+    return zlib.compress(enc.tobytes(), 1)
+
+
+def decode_values(buf: bytes, count: int) -> np.ndarray:
+    enc = np.frombuffer(zlib.decompress(buf), dtype=np.uint64, count=count)
+    return np.bitwise_xor.accumulate(enc).view(np.float64)
+
+
+# ---------- Segments ----------
+
+class OpenSegment:
+    """Active, append-only segment with preallocated mmap'ed columns."""
+
+    def __init__(self, path: str, t_start_us: int, capacity: int) -> None:
+        self.path = path
+        self.t_start_us = t_start_us
+        exists = os.path.exists(path)
+        if not exists:
+            with open(path, "wb") as f:
+                f.truncate(OPEN_HEADER_SIZE + 20 * capacity)
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        if exists:
+            magic, capacity, self.count, self.t_start_us, self.t_min_us, self.t_max_us = \
+                OPEN_HEADER.unpack_from(self._mm, 0)
+            if magic != OPEN_MAGIC:
+                raise ValueError(f"{path}: not an open historian segment")
+        else:
+            self.count = 0
+            self.t_min_us = self.t_max_us = t_start_us
+        self.capacity = capacity
+        self.ts = np.frombuffer(self._mm, np.int64, capacity, OPEN_HEADER_SIZE)
+        self.sid = np.frombuffer(self._mm, np.uint32, capacity, OPEN_HEADER_SIZE + 8 * capacity)
+        self.val = np.frombuffer(self._mm, np.float64, capacity, OPEN_HEADER_SIZE + 12 * capacity)
+        self._write_header()
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self.count
+
+    def _write_header(self) -> None:
+        OPEN_HEADER.pack_into(
+            self._mm, 0, OPEN_MAGIC, self.capacity, self.count,
+            self.t_start_us, self.t_min_us, self.t_max_us,
+        )
+
+    def append(self, ts: np.ndarray, sid: np.ndarray, val: np.ndarray) -> None:
+        n = len(ts)
+        lo, hi = self.count, self.count + n
+        self.ts[lo:hi] = ts
+        self.sid[lo:hi] = sid
+        self.val[lo:hi] = val
+        if lo == 0:
+            self.t_min_us, self.t_max_us = int(ts.min()), int(ts.max())
+        else:
+            self.t_min_us = min(self.t_min_us, int(ts.min()))
+            self.t_max_us = max(self.t_max_us, int(ts.max()))
+        self.count = hi
+        # The header is updated last, so a crash never exposes half-written points
+        self._write_header()
+
+    def read(self, sid: int, start_us: int, end_us: int):
+        n = self.count
+        mask = (self.sid[:n] == sid) & (self.ts[:n] >= start_us) & (self.ts[:n] < end_us)
+        return self.ts[:n][mask], self.val[:n][mask]
+
+    def seal(self, codec: int) -> str:
+        """Rewrite this segment sorted by series and return the sealed file path."""
+        n = self.count
+        ts, sid, val = self.ts[:n], self.sid[:n], self.val[:n]
+        order = np.lexsort((ts, sid))
+        ts, sid, val = ts[order], sid[order], val[order]
+        sids, starts, counts = np.unique(sid, return_index=True, return_counts=True)
+
+        blobs = []
+        for s, i, c in zip(sids, starts, counts):
+            s_ts, s_val = ts[i:i + c], val[i:i + c]
+            if codec == CODEC_DXZ:
+                blobs.append((int(s), int(c), s_ts, encode_timestamps(s_ts), encode_values(s_val)))
+            else:
+                blobs.append((int(s), int(c), s_ts, s_ts.tobytes(), s_val.tobytes()))
+
+        # Columns first (all timestamps, then all values), 8-byte aligned for views
+        off = SEAL_HEADER_SIZE + SEAL_INDEX.size * len(blobs)
+        index, ts_parts, val_parts = [], [], []
+        for _s, _c, _t, ts_b, _v in blobs:
+            ts_parts.append((off, ts_b))
+            off += len(ts_b) + (-len(ts_b) % 8)
+        for _s, _c, _t, _ts_b, val_b in blobs:
+            val_parts.append((off, val_b))
+            off += len(val_b) + (-len(val_b) % 8)
+        for (s, c, s_ts, ts_b, val_b), (ts_off, _), (val_off, _) in zip(blobs, ts_parts, val_parts):
+            index.append(SEAL_INDEX.pack(
+                s, c, int(s_ts[0]), int(s_ts[-1]), ts_off, len(ts_b), val_off, len(val_b)
+            ))
+
+        sealed_path = self.path[:-len(".open")] + ".seg"
+        tmp_path = sealed_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            header = SEAL_HEADER.pack(
+                SEAL_MAGIC, codec, len(blobs), n,
+                self.t_start_us, self.t_min_us, self.t_max_us,
+            )
+            f.write(header.ljust(SEAL_HEADER_SIZE, b"\0"))
+            f.write(b"".join(index))
+            for _off, b in ts_parts + val_parts:
+                f.write(b)
+                f.write(b"\0" * (-len(b) % 8))
+        os.replace(tmp_path, sealed_path)
+        self.close()
+        os.remove(self.path)
+        return sealed_path
+
+    def close(self) -> None:
+        self.ts = self.sid = self.val = None
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+
+class SealedSegment:
+    """Read-only segment; raw columns are exposed as zero-copy views."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.codec, n_series, self.count, self.t_start_us, self.t_min_us, self.t_max_us = \
+            SEAL_HEADER.unpack_from(self._mm, 0)
+        if magic != SEAL_MAGIC:
+            raise ValueError(f"{path}: not a sealed historian segment")
+        self.index = {}
+        for i in range(n_series):
+            entry = SEAL_INDEX.unpack_from(self._mm, SEAL_HEADER_SIZE + i * SEAL_INDEX.size)
+            self.index[entry[0]] = entry[1:]
+
+    def columns(self, sid: int):
+        entry = self.index.get(sid)
+        if entry is None:
+            return None
+        count, _t_min, _t_max, ts_off, ts_len, val_off, val_len = entry
+        if self.codec == CODEC_RAW:
+            ts = np.frombuffer(self._mm, np.int64, count, ts_off)
+            val = np.frombuffer(self._mm, np.float64, count, val_off)
+        else:
+            ts = decode_timestamps(self._mm[ts_off:ts_off + ts_len], count)
+            val = decode_values(self._mm[val_off:val_off + val_len], count)
+        return ts, val
+
+    def read(self, sid: int, start_us: int, end_us: int):
+        entry = self.index.get(sid)
+        if entry is None or entry[2] < start_us or entry[1] >= end_us:
+            return None
+        ts, val = self.columns(sid)
+        lo, hi = np.searchsorted(ts, [start_us, end_us])
+        return ts[lo:hi], val[lo:hi]
+
+    def close(self) -> None:
+        # Views handed out by read() keep the mapping alive; only drop our reference
+        self._mm = None
+        self._file.close()
+
+
+# ---------- Store ----------
+
+class Historian:
+    """
+    Append-only store of (timestamp, series, value) points.
+
+    Points are buffered and written to the active segment in batches of
+    `batch_size`; the active segment is sealed when it is older than
+    `segment_s` or full, and a new one is started.
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        segment_s: float = 3600.0,
+        capacity: int = 1 << 20,
+        batch_size: int = 4096,
+        codec: str = "raw",
+        read_only: bool = False,
+    ) -> None:
+        self.data_dir = data_dir
+        self.segment_us = int(segment_s * US)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.codec = CODECS[codec]
+        os.makedirs(data_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._series_path = os.path.join(data_dir, "series.json")
+        self._series: dict[str, int] = {}
+        if os.path.exists(self._series_path):
+            with open(self._series_path, "r") as f:
+                self._series = json.load(f)
+
+        self._buf_ts = array("q")
+        self._buf_sid = array("I")
+        self._buf_val = array("d")
+
+        # Leftovers from a previous run are sealed before we start appending.
+        # A read-only historian only sees sealed segments, the writer may still own the open one.
+        self._sealed: list[SealedSegment] = []
+        for name in sorted(os.listdir(data_dir)):
+            if name.endswith(".open") and not read_only:
+                seg = OpenSegment(os.path.join(data_dir, name), 0, 0)
+                if seg.count:
+                    seg.seal(self.codec)
+                else:
+                    seg.close()
+                    os.remove(seg.path)
+        self._scanned = None
+        self.refresh()
+        self._active: OpenSegment | None = None
+
+    def refresh(self) -> int:
+        """Picks up the segments sealed (and series added) by a writer since the last scan; returns how many.
+
+        Cheap when nothing changed: only the directory and series.json are stat'ed.
+        """
+        stamp = (os.stat(self.data_dir).st_mtime_ns,
+                 os.stat(self._series_path).st_mtime_ns if os.path.exists(self._series_path) else 0)
+        if stamp == self._scanned:
+            return 0
+        self._scanned = stamp
+        if stamp[1]:
+            with open(self._series_path, "r") as f:
+                series = json.load(f)
+            with self._lock:
+                for name, sid in series.items():
+                    self._series.setdefault(name, sid)
+        known = {seg.path for seg in self._sealed}
+        new = [SealedSegment(os.path.join(self.data_dir, name)) for name in sorted(os.listdir(self.data_dir))
+               if name.endswith(".seg") and os.path.join(self.data_dir, name) not in known]
+        if new:
+            # Segment names start with their start time: keep the list in time order for read()
+            self._sealed = sorted(self._sealed + new, key=lambda seg: os.path.basename(seg.path))
+        return len(new)
+
+    # ---------- Series ----------
+
+    def series_id(self, name: str) -> int:
+        sid = self._series.get(name)
+        if sid is None:
+            with self._lock:
+                sid = self._series.get(name)
+                if sid is None:
+                    sid = len(self._series)
+                    self._series[name] = sid
+                    with open(self._series_path, "w") as f:
+                        json.dump(self._series, f)
+        return sid
+
+    def series(self) -> list[str]:
+        return list(self._series)
+
+    # ---------- Write path ----------
+
+    def append(self, series: str, value: float, ts_us: int | None = None) -> None:
+        """Buffers one point; the buffer is written out every `batch_size` points."""
+        sid = self.series_id(series)
+        with self._lock:
+            self._buf_ts.append(now_us() if ts_us is None else ts_us)
+            self._buf_sid.append(sid)
+            self._buf_val.append(value)
+            if len(self._buf_ts) >= self.batch_size:
+                self._flush_locked()
+
+    def append_batch(self, ts_us: np.ndarray, sids: np.ndarray, values: np.ndarray) -> None:
+        """Writes already-columnar points (series ids from `series_id()`)."""
+        with self._lock:
+            self._flush_locked()
+            self._write(
+                np.asarray(ts_us, dtype=np.int64),
+                np.asarray(sids, dtype=np.uint32),
+                np.asarray(values, dtype=np.float64),
+            )
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buf_ts:
+            return
+        ts = np.frombuffer(self._buf_ts, dtype=np.int64)
+        sid = np.frombuffer(self._buf_sid, dtype=np.uint32)
+        val = np.frombuffer(self._buf_val, dtype=np.float64)
+        self._write(ts, sid, val)
+        del ts, sid, val  # release buffer exports before resizing the arrays
+        self._buf_ts = array("q")
+        self._buf_sid = array("I")
+        self._buf_val = array("d")
+
+    def _write(self, ts: np.ndarray, sid: np.ndarray, val: np.ndarray) -> None:
+        pos = 0
+        while pos < len(ts):
+            seg = self._active
+            if seg is None or seg.free == 0 or ts[pos] >= seg.t_start_us + self.segment_us:
+                seg = self._rotate(int(ts[pos]))
+            n = min(seg.free, len(ts) - pos)
+            seg.append(ts[pos:pos + n], sid[pos:pos + n], val[pos:pos + n])
+            pos += n
+
+    def _rotate(self, t_us: int) -> OpenSegment:
+        if self._active is not None:
+            self._sealed.append(SealedSegment(self._active.seal(self.codec)))
+        t_start = t_us - t_us % self.segment_us
+        path = os.path.join(self.data_dir, f"seg_{t_start:020d}_{len(self._sealed):06d}.open")
+        self._active = OpenSegment(path, t_start, self.capacity)
+        return self._active
+
+    # ---------- Read path ----------
+
+    def read(self, series: str, start_s: float | None = None, end_s: float | None = None):
+        """
+        Returns a list of (timestamps_us, values) chunks, one per segment, in time order.
+        Chunks from raw sealed segments are views on the mapped file (no copy);
+        dxz segments are decoded and the active segment is filtered (copies).
+        """
+        sid = self._series.get(series)
+        if sid is None:
+            return []
+        start_us = -2 ** 63 if start_s is None else int(start_s * US)
+        end_us = 2 ** 63 - 1 if end_s is None else int(end_s * US)
+
+        chunks = []
+        for seg in list(self._sealed):
+            if seg.t_max_us < start_us or seg.t_min_us >= end_us:
+                continue
+            res = seg.read(sid, start_us, end_us)
+            if res is not None and len(res[0]):
+                chunks.append(res)
+        with self._lock:
+            self._flush_locked()
+            if self._active is not None and self._active.count:
+                ts, val = self._active.read(sid, start_us, end_us)
+                if len(ts):
+                    chunks.append((ts, val))
+        return chunks
+
+    def read_concat(self, series: str, start_s: float | None = None, end_s: float | None = None):
+        """Same as read() but as two arrays; concatenates (copies) when several segments match."""
+        chunks = self.read(series, start_s, end_s)
+        if not chunks:
+            return np.empty(0, np.int64), np.empty(0, np.float64)
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+    def compact(self, older_than_s: float) -> int:
+        """Re-encodes raw sealed segments older than `older_than_s` with the dxz codec."""
+        limit = now_us() - int(older_than_s * US)
+        done = 0
+        for i, seg in enumerate(list(self._sealed)):
+            if seg.codec != CODEC_RAW or seg.t_max_us >= limit:
+                continue
+            tmp = OpenSegment(seg.path[:-len(".seg")] + ".open", seg.t_start_us, max(seg.count, 1))
+            for sid in seg.index:
+                ts, val = seg.columns(sid)
+                tmp.append(ts, np.full(len(ts), sid, dtype=np.uint32), val)
+            seg.close()
+            self._sealed[i] = SealedSegment(tmp.seal(CODEC_DXZ))
+            done += 1
+        return done
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            if self._active is not None:
+                if self._active.count:
+                    self._sealed.append(SealedSegment(self._active.seal(self.codec)))
+                else:
+                    self._active.close()
+                    os.remove(self._active.path)
+                self._active = None
+
+
+# ---------- Agent ----------
+
+class HistorianAgent:
+    """
+    Subscribes to:
+        {refuge_name}/+/+/+          (raw readings and AA averages)
+        {refuge_name}/alert/anomaly  (alerts from DetectionAgent)
+    and records every numeric value in a Historian. Series names are:
+        <room>/<measurement_type>/<sensor_id>    readings
+        AA/<measurement_type>/<agent_id>         averages
+        alert/<sensor_id>                        alerts (value of the anomalous reading)
+    """
+
+    def __init__(
+        self,
+        broker_host: str,
+        broker_port: int,
+        refuge_name: str,
+        data_dir: str,
+        segment_s: float = 3600.0,
+        flush_interval_s: float = 1.0,
+    ) -> None:
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.refuge_name = refuge_name
+        self.flush_interval_s = flush_interval_s
+
+        self.topic_all = f"{refuge_name}/+/+/+"
+        self.topic_alerts = f"{refuge_name}/alert/anomaly"
+
+        self.historian = Historian(data_dir, segment_s=segment_s)
+        self.client = mqtt.Client()
+        self._stop_event = threading.Event()
+
+    # ---------- MQTT callbacks ----------
+
+    def _on_connect(self, client, userdata, flags, rc):
+        status = "OK" if rc == 0 else f"ERROR rc={rc}"
+        print(f"[HIST] Connected to broker ({status}). Subscribing to: {self.topic_all} and {self.topic_alerts}")
+        client.subscribe(self.topic_all)
+        client.subscribe(self.topic_alerts)
+
+    def _on_message(self, client, userdata, msg):
+        if msg.topic == self.topic_alerts:
+            try:
+                alert = json.loads(msg.payload.decode())
+                series = f"alert/{alert['sensor_id']}"
+                value = float(alert["value"])
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                return
+            ts = alert.get("timestamp")
+            self.historian.append(series, value, None if ts is None else int(ts * US))
+            return
+
+        try:
+            value = float(msg.payload.decode())
+        except ValueError:
+            # e.g. RESET commands on {refuge}/cmd/<sensor_id>/reset
+            return
+        self.historian.append(msg.topic[len(self.refuge_name) + 1:], value)
+
+    # ---------- Public API ----------
+
+    def connect(self) -> None:
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+        self.client.loop_start()
+
+    def run(self) -> None:
+        self.connect()
+        try:
+            while not self._stop_event.wait(self.flush_interval_s):
+                self.historian.flush()
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.historian.close()
+            print("[HIST] stopped successfully")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+# ---------- Benchmark ----------
+
+def bench(points: int, n_series: int, batch: int, codec: str) -> None:
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as d:
+        h = Historian(d, segment_s=3600.0, capacity=1 << 22, codec=codec)
+        sids = np.array([h.series_id(f"bench/s{i}") for i in range(n_series)], dtype=np.uint32)
+        t0 = now_us()
+        ts = t0 + np.arange(points, dtype=np.int64) * 100
+        sid = sids[np.arange(points) % n_series]
+        val = np.round(rng.uniform(15.0, 25.0, points), 2)
+
+        start = time.perf_counter()
+        for lo in range(0, points, batch):
+            h.append_batch(ts[lo:lo + batch], sid[lo:lo + batch], val[lo:lo + batch])
+        h.close()
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+        print(f"write: {points} points in {elapsed:.3f}s -> {points / elapsed / 1e6:.2f} M points/s "
+              f"({size / points:.2f} bytes/point on disk, codec={codec})")
+
+        h = Historian(d, codec=codec)
+        start = time.perf_counter()
+        ts_r, val_r = h.read_concat("bench/s0", t0 / US, (t0 + points * 100) / US)
+        elapsed = time.perf_counter() - start
+        print(f"read: {len(ts_r)} points of one series in {elapsed * 1e3:.3f} ms")
+        h.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Historian agent (MQTT -> columnar segments)")
+    ap.add_argument("--data-dir", default=os.path.join(os.path.dirname(__file__), "history"))
+    ap.add_argument("--segment-s", type=float, default=3600.0, help="Segment rotation period (seconds)")
+    ap.add_argument("--broker", default="localhost")
+    ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--refuge", default="refuge_Monviso")
+    ap.add_argument("--bench", type=int, default=0, help="Run the write/read benchmark with N points instead")
+    ap.add_argument("--bench-series", type=int, default=10)
+    ap.add_argument("--bench-batch", type=int, default=65536)
+    ap.add_argument("--codec", choices=sorted(CODECS), default="raw")
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(args.bench, args.bench_series, args.bench_batch, args.codec)
+        return
+
+    agent = HistorianAgent(args.broker, args.port, args.refuge, args.data_dir, args.segment_s)
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,13 @@ import time
 
 import paho.mqtt.client as mqtt
 
+from metrics import REGISTRY
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
+RESETS = REGISTRY.counter("mas_resets_total", "RESET commands sent or received", ("agent",))
+
 
 class IdentificationAgent:
     """
@@ -30,6 +37,11 @@ class IdentificationAgent:
         self.client = mqtt.Client()
         self._stop_event = threading.Event()
 
+        self._m_in = MSGS_IN.labels(agent="ID", topic_class="alert")
+        self._m_out = MSGS_OUT.labels(agent="ID", topic_class="cmd")
+        self._m_handler = HANDLER_SECONDS.labels(agent="ID", topic_class="alert")
+        self._m_resets = RESETS.labels(agent="ID")
+
     # ---------- MQTT callbacks ----------
 
     def _on_connect(self, client, userdata, flags, rc):
@@ -38,6 +50,15 @@ class IdentificationAgent:
         client.subscribe(self.topic_in_alerts)
 
     def _on_message(self, client, userdata, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        self._m_in.inc()
+        try:
+            self._handle_alert(msg)
+        finally:
+            if t0:
+                self._m_handler.observe(time.perf_counter() - t0)
+
+    def _handle_alert(self, msg):
         try:
             alert = json.loads(msg.payload.decode())
         except json.JSONDecodeError:
@@ -58,6 +79,8 @@ class IdentificationAgent:
         for sensor_id in sensor_ids:
             topic = f"{self.topic_out_cmd_prefix}/{sensor_id}/reset"
             self.client.publish(topic, payload="RESET", qos=0)
+            self._m_out.inc()
+            self._m_resets.inc()
             print(f"[ID] Sent RESET to {sensor_id} on topic {topic}")
 
     # ---------- Public API ----------
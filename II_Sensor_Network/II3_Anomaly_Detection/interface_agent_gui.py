@@ -7,6 +7,9 @@ from tkinter import ttk
 
 import paho.mqtt.client as mqtt
 
+from journal_agent import EventJournal
+from metrics import REGISTRY, start_http_server
+
 
 BROKER_HOST = "localhost"
 BROKER_PORT = 1883
@@ -18,6 +21,13 @@ with open(CONFIG_PATH, "r") as f:
     config = json.load(f)
 
 REFRESH_PERIOD_S = config["TW_AA"]
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), config.get("journal_db", "journal.db"))
+# main.py serves the agents' metrics on metrics_port, the GUI process uses the next port
+METRICS_PORT = config.get("metrics_port", 0)
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+HANDLER_SECONDS = REGISTRY.histogram("mas_handler_seconds", "Message handler latency", ("agent", "topic_class"))
+QUEUE_DEPTH = REGISTRY.gauge("mas_queue_depth", "Events waiting in the agent's queue", ("agent",))
 
 
 class InterfaceAgent:
@@ -36,6 +46,10 @@ class InterfaceAgent:
         self.client = mqtt.Client()
         self.queue: "queue.Queue[dict]" = queue.Queue()
 
+        self._m_in = {}
+        self._m_handler = HANDLER_SECONDS.labels(agent="IA", topic_class="all")
+        self._m_queue = QUEUE_DEPTH.labels(agent="IA")
+
     def _on_connect(self, client, userdata, flags, rc):
         status = "OK" if rc == 0 else f"ERROR rc={rc}"
         print(f"[IA] Connected to MQTT broker ({status}).")
@@ -44,6 +58,19 @@ class InterfaceAgent:
         client.subscribe(self.topic_alerts)
 
     def _on_message(self, client, userdata, msg):
+        t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+        etype = self._handle_message(msg)
+        if etype is not None:
+            m_in = self._m_in.get(etype)
+            if m_in is None:
+                m_in = self._m_in[etype] = MSGS_IN.labels(agent="IA", topic_class=etype)
+            m_in.inc()
+            self._m_queue.set(self.queue.qsize())
+        if t0:
+            self._m_handler.observe(time.perf_counter() - t0)
+
+    def _handle_message(self, msg) -> str | None:
+        """Turns one MQTT message into a GUI event; returns the event type (None if skipped)."""
         topic = msg.topic
         parts = topic.split("/")
 
@@ -65,7 +92,7 @@ class InterfaceAgent:
                 "timestamp": alert.get("timestamp", time.time()),
             }
             self.queue.put(event)
-            return
+            return event["type"]
 
         if len(parts) != 4:
             return
@@ -87,7 +114,7 @@ class InterfaceAgent:
                 "timestamp": time.time(),
             }
             self.queue.put(event)
-            return
+            return event["type"]
 
         if second == "cmd" and last == "reset":
             sensor_id = measurement_type
@@ -97,7 +124,7 @@ class InterfaceAgent:
                 "timestamp": time.time(),
             }
             self.queue.put(event)
-            return
+            return event["type"]
 
         room = second
         sensor_id = last
@@ -116,6 +143,7 @@ class InterfaceAgent:
             "timestamp": time.time(),
         }
         self.queue.put(event)
+        return event["type"]
 
     def connect(self) -> None:
         self.client.on_connect = self._on_connect
@@ -134,11 +162,15 @@ class InterfaceGUI:
     Graphic interface with two tables
     One table shows averages from agents
     One table shows sensor status
+    One table shows the last events of the selected sensor (from the event journal)
     """
 
-    def __init__(self, root: tk.Tk, ia: InterfaceAgent, refresh_period_s: int = REFRESH_PERIOD_S, averages_height: int = 5, sensors_height: int = 10):
+    def __init__(self, root: tk.Tk, ia: InterfaceAgent, refresh_period_s: int = REFRESH_PERIOD_S, averages_height: int = 5, sensors_height: int = 10,
+                 journal: EventJournal | None = None, events_height: int = 6):
         self.root = root
         self.ia = ia
+        self.journal = journal
+        self.selected_sensor: str | None = None
         self.refresh_period_s = refresh_period_s
         self.total_reset_sent = 0
 
@@ -185,6 +217,20 @@ class InterfaceGUI:
         self.sensor_tree.tag_configure("RESET_SENT", background="#ccffcc")
 
         self.sensor_tree.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        self.sensor_tree.bind("<<TreeviewSelect>>", self._on_sensor_select)
+
+        self.events_label = ttk.Label(root, text="Recent events (select a sensor)")
+        self.events_label.pack(padx=10, pady=(0, 0), anchor="w")
+
+        event_columns = ("timestamp", "kind", "value")
+        self.events_tree = ttk.Treeview(root, columns=event_columns, show="headings", height=events_height)
+        self.events_tree.heading("timestamp", text="Timestamp")
+        self.events_tree.heading("kind", text="Event")
+        self.events_tree.heading("value", text="Value")
+        self.events_tree.column("timestamp", width=160, anchor="center")
+        self.events_tree.column("kind", width=100, anchor="center")
+        self.events_tree.column("value", width=100, anchor="center")
+        self.events_tree.pack(fill="x", expand=False, padx=10, pady=(5, 10))
 
         self.status_label = ttk.Label(root, text="No data yet")
         self.status_label.pack(pady=(0, 10))
@@ -272,6 +318,22 @@ class InterfaceGUI:
             tags=(state["status"],),
         )
 
+    def _on_sensor_select(self, _event=None):
+        selection = self.sensor_tree.selection()
+        if not selection:
+            return
+        self.selected_sensor = self.sensor_tree.item(selection[0], "values")[0]
+        self._refresh_events()
+
+    def _refresh_events(self, n: int = 10):
+        if self.journal is None or self.selected_sensor is None:
+            return
+        self.events_label.config(text=f"Recent events for {self.selected_sensor}")
+        self.events_tree.delete(*self.events_tree.get_children())
+        for ev in self.journal.last_events(self.selected_sensor, n):
+            value = "" if ev["value"] is None else ev["value"]
+            self.events_tree.insert("", "end", values=(self._format_timestamp(ev["ts"]), ev["kind"], value))
+
     def _update_status_label(self):
         total = len(self.sensors_state)
         reset_sent = self.total_reset_sent
@@ -286,6 +348,7 @@ class InterfaceGUI:
                     msg += f" - Next averages expected in about {remaining} seconds"
 
         self.status_label.config(text=msg)
+        self._refresh_events()
         self.root.after(1000, self._update_status_label)
 
     def _process_queue(self):
@@ -370,15 +433,22 @@ class InterfaceGUI:
                 self._schedule_reset_clear(sensor_id)
                 sensors_updated = True
 
+        QUEUE_DEPTH.labels(agent="IA").set(self.ia.queue.qsize())
         self.root.after(200, self._process_queue)
 
 
 def main(num_sensors: int = 10, num_aa: int = 3):
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT + 1)
+
     ia = InterfaceAgent(BROKER_HOST, BROKER_PORT, REFUGE_NAME)
     ia.connect()
 
+    # Read-only use of the journal written by JournalAgent (WAL allows concurrent readers)
+    journal = EventJournal(JOURNAL_PATH)
+
     root = tk.Tk()
-    gui = InterfaceGUI(root, ia, refresh_period_s=REFRESH_PERIOD_S,averages_height=num_aa,sensors_height=num_sensors)
+    gui = InterfaceGUI(root, ia, refresh_period_s=REFRESH_PERIOD_S,averages_height=num_aa,sensors_height=num_sensors, journal=journal)
 
     try:
         root.mainloop()
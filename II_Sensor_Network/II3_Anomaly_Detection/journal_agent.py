@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+
+"""
+Event journal: alerts, resets and dynamics (enter/leave) events stored in SQLite.
+
+MQTT callbacks only enqueue (never block); a single background writer drains the
+bounded queue and commits batches with executemany in WAL mode. When the queue
+is full events are dropped and counted, so an alert storm can't stall the
+network loop. Readers (e.g. the GUI, in another process) open their own
+connection and query the last N events of a sensor through the
+(sensor_id, ts) index.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id        INTEGER PRIMARY KEY,
+    ts        REAL NOT NULL,
+    kind      TEXT NOT NULL,
+    sensor_id TEXT,
+    value     REAL,
+    details   TEXT
+);
+CREATE INDEX IF NOT EXISTS events_sensor_ts ON events (sensor_id, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+"""
+
+
+class EventJournal:
+    """
+    SQLite-backed event store. Call start() to run the background writer;
+    a journal that is never started can still be used for queries.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval_s: float = 0.2,
+        retention_s: float | None = 7 * 86400,
+        prune_interval_s: float = 60.0,
+    ) -> None:
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.retention_s = retention_s
+        self.prune_interval_s = prune_interval_s
+
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._writer: threading.Thread | None = None
+        self._local = threading.local()
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One read connection per thread (sqlite3 connections are not shared across threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # ---------- Write path ----------
+
+    def record(self, kind: str, sensor_id: str | None, value: float | None = None,
+               details: dict | None = None, ts: float | None = None) -> bool:
+        """Enqueues one event; returns False (and counts a drop) if the queue is full."""
+        row = (
+            time.time() if ts is None else ts,
+            kind,
+            sensor_id,
+            value,
+            None if details is None else json.dumps(details),
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def start(self) -> None:
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self) -> None:
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        next_prune = time.time()
+        try:
+            while not (self._stop_event.is_set() and self._queue.empty()):
+                try:
+                    batch = [self._queue.get(timeout=self.flush_interval_s)]
+                except queue.Empty:
+                    batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO events (ts, kind, sensor_id, value, details) VALUES (?, ?, ?, ?, ?)",
+                            batch,
+                        )
+                    self.written += len(batch)
+                if self.retention_s is not None and time.time() >= next_prune:
+                    self._prune(conn, time.time() - self.retention_s)
+                    next_prune = time.time() + self.prune_interval_s
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _prune(conn: sqlite3.Connection, before_ts: float) -> int:
+        with conn:
+            cur = conn.execute("DELETE FROM events WHERE ts < ?", (before_ts,))
+        return cur.rowcount
+
+    def prune(self, older_than_s: float) -> int:
+        return self._prune(self._conn(), time.time() - older_than_s)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stops the writer after the queued events have been committed."""
+        self._stop_event.set()
+        if self._writer is not None:
+            self._writer.join(timeout=timeout)
+
+    # ---------- Queries ----------
+
+    def last_events(self, sensor_id: str, n: int = 10) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT ts, kind, sensor_id, value, details FROM events "
+            "WHERE sensor_id = ? ORDER BY ts DESC LIMIT ?",
+            (sensor_id, n),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+class JournalAgent:
+    """
+    Subscribes to:
+        {refuge_name}/alert/anomaly      alerts from DetectionAgent       -> kind "alert"
+        {refuge_name}/cmd/+/reset        resets from IdentificationAgent  -> kind "reset"
+        {refuge_name}/event/dynamics     II.2 enter/leave events          -> kind "enter" / "leave"
+    and records them in an EventJournal.
+    """
+
+    def __init__(self, broker_host: str, broker_port: int, refuge_name: str, db_path: str) -> None:
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.refuge_name = refuge_name
+
+        self.topic_alerts = f"{refuge_name}/alert/anomaly"
+        self.topic_resets = f"{refuge_name}/cmd/+/reset"
+        self.topic_dynamics = f"{refuge_name}/event/dynamics"
+
+        self.journal = EventJournal(db_path)
+        self.client = mqtt.Client()
+        self._stop_event = threading.Event()
+
+    # ---------- MQTT callbacks ----------
+
+    def _on_connect(self, client, userdata, flags, rc):
+        status = "OK" if rc == 0 else f"ERROR rc={rc}"
+        print(f"[JOURNAL] Connected to broker ({status}).")
+        for topic in (self.topic_alerts, self.topic_resets, self.topic_dynamics):
+            client.subscribe(topic)
+
+    def _on_message(self, client, userdata, msg):
+        topic = msg.topic
+        if topic.endswith("/reset"):
+            # {refuge}/cmd/<sensor_id>/reset
+            self.journal.record("reset", topic.split("/")[2])
+            return
+
+        try:
+            event = json.loads(msg.payload.decode())
+        except json.JSONDecodeError:
+            print(f"[JOURNAL] Invalid JSON on {topic}: {msg.payload!r}")
+            return
+
+        if topic == self.topic_alerts:
+            self.journal.record(
+                "alert",
+                event.get("sensor_id"),
+                value=event.get("value"),
+                details=event,
+                ts=event.get("timestamp"),
+            )
+        elif topic == self.topic_dynamics:
+            self.journal.record(
+                event.get("event", "dynamics"),
+                event.get("id"),
+                details=event,
+                ts=event.get("timestamp"),
+            )
+
+    # ---------- Public API ----------
+
+    def connect(self) -> None:
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+        self.client.loop_start()
+
+    def run(self) -> None:
+        self.journal.start()
+        self.connect()
+        try:
+            while not self._stop_event.is_set():
+                time.sleep(0.1)
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.journal.close()
+            print(f"[JOURNAL] stopped successfully ({self.journal.written} written, {self.journal.dropped} dropped)")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+# ---------- Benchmark ----------
+
+def bench(events: int, sensors: int) -> None:
+    """Alert storm: enqueue cost seen by the callback, writer throughput, last-N query latency."""
+    with tempfile.TemporaryDirectory() as d:
+        journal = EventJournal(os.path.join(d, "journal.db"), max_queue=events)
+        journal.start()
+        t0 = time.perf_counter()
+        for i in range(events):
+            journal.record("alert", f"S{i % sensors}", value=float(i), details={"k_sigma": 2.0})
+        t_enqueue = time.perf_counter() - t0
+        journal.close(timeout=600)
+        t_total = time.perf_counter() - t0
+        print(f"enqueue: {t_enqueue / events * 1e6:.2f} us/event (callback cost)")
+        print(f"writer:  {journal.written} events committed in {t_total:.2f}s "
+              f"-> {journal.written / t_total:.0f} events/s, dropped={journal.dropped}")
+
+        t0 = time.perf_counter()
+        for i in range(1000):
+            journal.last_events(f"S{i % sensors}", 10)
+        print(f"last 10 events for a sensor: {(time.perf_counter() - t0):.3f} ms/query "
+              f"over {journal.count()} rows")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Event journal agent (MQTT -> SQLite)")
+    ap.add_argument("--db", default=os.path.join(os.path.dirname(__file__), "journal.db"))
+    ap.add_argument("--broker", default="localhost")
+    ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--refuge", default="refuge_Monviso")
+    ap.add_argument("--bench", type=int, default=0, help="Run the alert-storm benchmark with N events instead")
+    ap.add_argument("--bench-sensors", type=int, default=10)
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(args.bench, args.bench_sensors)
+        return
+
+    agent = JournalAgent(args.broker, args.port, args.refuge, args.db)
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,11 @@ from sensor import Sensor
 from averaging_agent import AveragingAgent
 from detection_agent import DetectionAgent
 from identification_agent import IdentificationAgent
+from historian import HistorianAgent
+from telemetry_query import QueryAgent
+from journal_agent import JournalAgent
 from interface_agent_gui import main as gui_main
+from metrics import start_http_server
 
 
 BROKER_HOST = "localhost"
@@ -22,6 +26,9 @@ with open(CONFIG_PATH, "r") as f:
 
 TIME_SENSORS = config["time_sensors"]
 TW_AA = config["TW_AA"]
+HISTORY_DIR = os.path.join(os.path.dirname(__file__), config.get("history_dir", "history"))
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), config.get("journal_db", "journal.db"))
+METRICS_PORT = config.get("metrics_port", 0)
 
 # Configurations of sensors
 SENSORS = [
@@ -48,7 +55,7 @@ AVERAGING_AGENTS = [
 def main():
     sensors = []
     averaging_agents = []
-    other_agents = []  # detection + identification
+    other_agents = []  # detection + identification + historian + query + journal
     threads = []
 
     # Create Sensor objects
@@ -96,10 +103,32 @@ def main():
         broker_port=BROKER_PORT,
         refuge_name=REFUGE_NAME,
     )
-    other_agents.extend([detection_agent, id_agent])
+    historian_agent = HistorianAgent(
+        broker_host=BROKER_HOST,
+        broker_port=BROKER_PORT,
+        refuge_name=REFUGE_NAME,
+        data_dir=HISTORY_DIR,
+    )
+    # Rollups are backfilled from the historian and share it for raw edge reads
+    query_agent = QueryAgent(
+        broker_host=BROKER_HOST,
+        broker_port=BROKER_PORT,
+        refuge_name=REFUGE_NAME,
+        historian=historian_agent.historian,
+    )
+    journal_agent = JournalAgent(
+        broker_host=BROKER_HOST,
+        broker_port=BROKER_PORT,
+        refuge_name=REFUGE_NAME,
+        db_path=JOURNAL_PATH,
+    )
+    other_agents.extend([detection_agent, id_agent, historian_agent, query_agent, journal_agent])
 
     threads.append(threading.Thread(target=detection_agent.run, name="agent-detect", daemon=True))
     threads.append(threading.Thread(target=id_agent.run, name="agent-id", daemon=True))
+    threads.append(threading.Thread(target=historian_agent.run, name="agent-historian", daemon=True))
+    threads.append(threading.Thread(target=query_agent.run, name="agent-query", daemon=True))
+    threads.append(threading.Thread(target=journal_agent.run, name="agent-journal", daemon=True))
 
     # Start GUI interface agent
     num_sensors = len(SENSORS)
@@ -107,6 +136,11 @@ def main():
     gui_process = Process(target=gui_main, args=(num_sensors, num_aa))
     gui_process.start()
 
+    # Prometheus endpoint for every agent of this process (the GUI process serves METRICS_PORT + 1)
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+
     # Start all threads
     for t in threads:
         t.start()
@@ -0,0 +1,386 @@
+import argparse
+import bisect
+import io
+import itertools
+import json
+import statistics
+import threading
+import time
+from threading import get_ident
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Minimal metrics registry (counters, gauges, fixed-bucket histograms) with
+Prometheus text exposition over HTTP.
+
+Updates take no lock: a counter child's inc() counts one and is the next()
+of an itertools.count (one C call, atomic under the GIL); add(x) and every
+gauge update go to the caller thread's own cell, and the cells are summed at
+scrape time. Look children up once (e.g. in
+__init__) and keep the reference on hot paths:
+
+    MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+    self._m_in = MSGS_IN.labels(agent="S1", topic_class="reading")
+    self._m_in.inc()
+
+Handler latency is sampled and opt-in: REGISTRY.timed() is False until
+start_http_server() serves the registry (--metrics-port / metrics_port), then
+True for one message in HANDLER_SAMPLE, so the handler histograms count that
+share of the messages (the message counters have every one) and an agent
+nobody scrapes pays for its counters alone:
+
+    t0 = time.perf_counter() if REGISTRY.timed() else 0.0
+    ...
+    if t0:
+        self._m_handler.observe(time.perf_counter() - t0)
+"""
+
+HANDLER_SAMPLE = 16  # a served registry times one message in this many
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+_READ_LOCK = threading.Lock()
+
+
+class _Cells:
+    # One cell per writer thread: a thread only ever updates its own cell,
+    # so no lock is needed, readers sum the cells.
+    __slots__ = ("_cells",)
+
+    def __init__(self) -> None:
+        self._cells: dict[int, float] = {}
+
+    def add(self, amount: float) -> None:
+        try:
+            self._cells[get_ident()] += amount
+        except KeyError:  # first update from this thread
+            self._cells[get_ident()] = amount
+
+    @property
+    def value(self) -> float:
+        return sum(list(self._cells.values()))
+
+
+class _CounterChild(_Cells):
+    # inc() (every message counter) is the bound __next__ of an itertools.count:
+    # one C call, no Python frame; add() takes any other amount.
+    __slots__ = ("_ones", "_reads", "inc")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._ones = itertools.count()
+        self._reads = 0  # next() calls made by readers
+        self.inc = self._ones.__next__
+
+    @property
+    def value(self) -> float:
+        with _READ_LOCK:
+            ones = next(self._ones) - self._reads
+            self._reads += 1
+        return float(ones) + super().value
+
+
+class _GaugeChild(_Cells):
+    __slots__ = ()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.add(amount)
+
+    def set(self, value: float) -> None:
+        self._cells = {get_ident(): value}
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.add(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_cells")
+
+    def __init__(self, bounds) -> None:
+        self._bounds = bounds
+        # thread id -> [count per bucket..., +Inf count, sum]
+        self._cells: dict[int, list] = {}
+
+    def observe(self, value: float) -> None:
+        tid = get_ident()
+        cell = self._cells.get(tid)
+        if cell is None:
+            cell = self._cells[tid] = [0] * (len(self._bounds) + 1) + [0.0]
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        counts = [0] * (len(self._bounds) + 1)
+        total = 0.0
+        for cell in list(self._cells.values()):
+            for i, n in enumerate(cell[:-1]):
+                counts[i] += n
+            total += cell[-1]
+        return counts, total
+
+
+class _Timer:
+    __slots__ = ("_child", "_t0")
+
+    def __init__(self, child) -> None:
+        self._child = child
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._t0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount == 1:
+            self._default.inc()
+        else:
+            self._default.add(amount)
+
+    def expose(self) -> list[str]:
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(c.value)}" for k, c in self.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> None:
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def expose(self) -> list[str]:
+        lines = []
+        for key, child in self.items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_fmt_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.timed = itertools.repeat(False).__next__  # one C call per message: time this one?
+
+    def time_handlers(self, every: int = HANDLER_SAMPLE) -> None:
+        """Makes timed() True for one call in `every` (all of them with 1)."""
+        self.timed = itertools.cycle([True] + [False] * (every - 1)).__next__
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kw):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, labelnames, **kw)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name} already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def expose(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(port: int, registry: Registry = REGISTRY, addr: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves GET /metrics on a daemon thread; returns the server (call shutdown() to stop)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.expose().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    registry.time_handlers()
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    return server
+
+
+# ---------- Benchmark ----------
+
+def bench(n: int) -> None:
+    """Cost of the primitives and of instrumenting two typical message handlers."""
+    reg = Registry()
+    c = reg.counter("bench_total", "bench", ("agent",)).labels(agent="a")
+    h = reg.histogram("bench_seconds", "bench", ("agent",)).labels(agent="a")
+    g = reg.gauge("bench_depth", "bench", ("agent",)).labels(agent="a")
+
+    def per_op(fn, iterations=n) -> float:
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return (time.perf_counter() - t0) / iterations * 1e9
+
+    print(f"counter.inc:       {per_op(c.inc):7.0f} ns")
+    print(f"gauge.set:         {per_op(lambda: g.set(3)):7.0f} ns")
+    print(f"histogram.observe: {per_op(lambda: h.observe(0.0012)):7.0f} ns")
+
+    # Proposal-like handler: parse JSON, store it, log a line (the agents print every message)
+    payload = json.dumps({"job_id": "abc123", "job_type": "cut", "machine_id": "M01", "eta_s": 1.8, "at": time.time()}).encode()
+    proposals: dict[str, list] = {}
+    log = io.StringIO()
+
+    def on_proposal():
+        p = json.loads(payload.decode())
+        lst = proposals.setdefault(p["job_id"], [])
+        lst.append(p)
+        if len(lst) > 64:
+            lst.clear()
+        print(f"[SUP] Proposal: job={p['job_id']} type={p['job_type']} from={p['machine_id']} eta={p['eta_s']}s", file=log)
+        log.seek(0)
+
+    # Detection-like handler: sliding window of 50 readings, mean/stdev
+    window: list[float] = []
+
+    def on_reading():
+        window.append(20.0 + (len(window) % 7))
+        if len(window) > 50:
+            window.pop(0)
+        if len(window) >= 2:
+            statistics.stdev(window, statistics.mean(window))
+
+    # The instrumentation's own cost, inline as in the agents' handlers (a message counter, the handler
+    # histogram while the registry is served): an empty handler with it minus one without (comparing whole
+    # handlers drowns a few hundred ns in the noise of one run). Best of interleaved rounds.
+    def noop():
+        pass
+
+    def wrapped():
+        t0 = time.perf_counter() if reg.timed() else 0.0
+        c.inc()
+        if t0:
+            h.observe(time.perf_counter() - t0)
+
+    bare = inst = timed = every = float("inf")
+    for _ in range(9):
+        bare = min(bare, per_op(noop))
+        reg.timed = itertools.repeat(False).__next__
+        inst = min(inst, per_op(wrapped))
+        reg.time_handlers()
+        timed = min(timed, per_op(wrapped))
+        reg.time_handlers(1)
+        every = min(every, per_op(wrapped))
+    inst, timed, every = inst - bare, timed - bare, every - bare
+    print(f"instrumentation:   {inst:7.0f} ns per message, {timed:7.0f} ns served "
+          f"(1 in {HANDLER_SAMPLE} timed), {every:7.0f} ns timing every message")
+
+    for name, handler in (("proposal handler", on_proposal), ("detection handler", on_reading)):
+        base = min(per_op(handler, max(1000, n // 100)) for _ in range(9))
+        print(f"{name + ':':19s}{base:7.0f} ns: +{inst / base * 100:.1f}% instrumented, "
+              f"+{timed / base * 100:.1f}% served, +{every / base * 100:.1f}% timing every message")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Metrics registry benchmark")
+    ap.add_argument("--bench", type=int, default=1_000_000, help="Iterations per measurement")
+    args = ap.parse_args()
+    bench(args.bench)
+
+
+if __name__ == "__main__":
+    main()
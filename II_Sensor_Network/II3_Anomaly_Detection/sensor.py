@@ -4,6 +4,12 @@ import threading
 
 import paho.mqtt.client as mqtt
 
+from metrics import REGISTRY
+
+MSGS_IN = REGISTRY.counter("mas_messages_in_total", "Messages received", ("agent", "topic_class"))
+MSGS_OUT = REGISTRY.counter("mas_messages_out_total", "Messages published", ("agent", "topic_class"))
+RESETS = REGISTRY.counter("mas_resets_total", "RESET commands sent or received", ("agent",))
+
 
 class Sensor:
     """
@@ -55,6 +61,10 @@ class Sensor:
         self.client = mqtt.Client()
         self._stop_event = threading.Event()
 
+        self._m_out = MSGS_OUT.labels(agent=sensor_id, topic_class="reading")
+        self._m_in = MSGS_IN.labels(agent=sensor_id, topic_class="cmd")
+        self._m_resets = RESETS.labels(agent=sensor_id)
+
     # MQTT callbacks
 
     def _on_connect(self, client, userdata, flags, rc):
@@ -65,6 +75,7 @@ class Sensor:
         print(f"[{self.sensor_id}] Subscribed to reset topic: {self.reset_topic}")
 
     def _on_message(self, client, userdata, msg):
+        self._m_in.inc()
         if msg.topic == self.reset_topic:
             command = msg.payload.decode().strip().upper()
             if command == "RESET":
@@ -76,6 +87,7 @@ class Sensor:
         For this exercise we simply disable the faulty behaviour and print a log.
         """
         print(f"[{self.sensor_id}] Received RESET command -> disabling faulty mode.")
+        self._m_resets.inc()
         self.can_fail = False
 
     # Public API
@@ -113,6 +125,7 @@ class Sensor:
                 reading = self._generate_reading()
                 payload = str(reading)
                 self.client.publish(self.topic, payload=payload, qos=0)
+                self._m_out.inc()
                 # print(f"[{self.sensor_id}] [published] {self.topic} <- {payload}")
 
                 slept = 0.0
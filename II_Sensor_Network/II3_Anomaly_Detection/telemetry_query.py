@@ -0,0 +1,359 @@
+import argparse
+import json
+import math
+import tempfile
+import threading
+import time
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+from historian import Historian, US
+
+
+"""
+Telemetry query engine.
+
+Keeps (count, sum, min, max) rollups per series at 1 min, 1 h and 1 day
+resolution, updated at ingest. A range query is answered from the coarsest
+buckets that fit entirely inside the range; the leftover edges go down one
+level at a time, and sub-minute edges are read from the Historian if one is
+attached (otherwise the overlapping minute buckets are used as-is).
+
+Series names are the ones used by the Historian:
+    <room>/<measurement_type>/<sensor_id>    readings
+    AA/<measurement_type>/<agent_id>         averages
+"""
+
+LEVELS = (60, 3600, 86400)  # seconds, finest first
+MAX_BUCKETS = 10000         # per buckets() query
+
+
+def empty_agg() -> list:
+    # count, sum, min, max
+    return [0, 0.0, math.inf, -math.inf]
+
+
+def merge_agg(acc: list, other) -> None:
+    acc[0] += other[0]
+    acc[1] += other[1]
+    if other[2] < acc[2]:
+        acc[2] = other[2]
+    if other[3] > acc[3]:
+        acc[3] = other[3]
+
+
+def agg_to_dict(acc: list, start: float, end: float) -> dict:
+    count = acc[0]
+    return {
+        "start": start,
+        "end": end,
+        "count": count,
+        "avg": acc[1] / count if count else None,
+        "min": acc[2] if count else None,
+        "max": acc[3] if count else None,
+    }
+
+
+class RollupIndex:
+    """Multi-resolution rollups: series -> level -> bucket index -> [count, sum, min, max]."""
+
+    def __init__(self, levels=LEVELS, historian: Historian | None = None) -> None:
+        self.levels = tuple(sorted(levels))
+        self.historian = historian
+        self._rollups: dict[str, dict[int, dict[int, list]]] = {}
+        self._lock = threading.Lock()
+
+    def _series_levels(self, series: str) -> dict[int, dict[int, list]]:
+        lv = self._rollups.get(series)
+        if lv is None:
+            lv = {level: {} for level in self.levels}
+            self._rollups[series] = lv
+        return lv
+
+    def series(self) -> list[str]:
+        return list(self._rollups)
+
+    # ---------- Ingest ----------
+
+    def ingest(self, series: str, value: float, ts: float | None = None) -> None:
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            for level, buckets in self._series_levels(series).items():
+                b = int(ts // level)
+                acc = buckets.get(b)
+                if acc is None:
+                    buckets[b] = [1, value, value, value]
+                else:
+                    acc[0] += 1
+                    acc[1] += value
+                    if value < acc[2]:
+                        acc[2] = value
+                    if value > acc[3]:
+                        acc[3] = value
+
+    def ingest_batch(self, series: str, ts_s: np.ndarray, values: np.ndarray) -> None:
+        """Vectorized ingest, used to backfill from the Historian."""
+        if not len(ts_s):
+            return
+        with self._lock:
+            for level, buckets in self._series_levels(series).items():
+                idx = (ts_s // level).astype(np.int64)
+                keys, inverse = np.unique(idx, return_inverse=True)
+                count = np.bincount(inverse, minlength=len(keys))
+                total = np.bincount(inverse, weights=values, minlength=len(keys))
+                vmin = np.full(len(keys), np.inf)
+                vmax = np.full(len(keys), -np.inf)
+                np.minimum.at(vmin, inverse, values)
+                np.maximum.at(vmax, inverse, values)
+                for row in zip(keys.tolist(), count.tolist(), total.tolist(), vmin.tolist(), vmax.tolist()):
+                    acc = buckets.get(row[0])
+                    if acc is None:
+                        buckets[row[0]] = list(row[1:])
+                    else:
+                        merge_agg(acc, row[1:])
+
+    def backfill(self, historian: Historian, start_s: float | None = None, end_s: float | None = None) -> int:
+        total = 0
+        for series in historian.series():
+            for ts_us, values in historian.read(series, start_s, end_s):
+                self.ingest_batch(series, ts_us / US, values)
+                total += len(values)
+        return total
+
+    # ---------- Queries ----------
+
+    def _cover(self, series: str, series_levels, acc: list, lo: float, hi: float, li: int) -> None:
+        """Adds [lo, hi) to `acc` using level index `li` and finer levels for the edges."""
+        if lo >= hi:
+            return
+        if li < 0:
+            # Below the finest rollup: raw points if we can, else whole minute buckets
+            if self.historian is not None:
+                for _ts, values in self.historian.read(series, lo, hi):
+                    if len(values):
+                        merge_agg(acc, (len(values), float(values.sum()), float(values.min()), float(values.max())))
+            else:
+                level = self.levels[0]
+                buckets = series_levels[level]
+                for b in range(int(lo // level), int(math.ceil(hi / level))):
+                    other = buckets.get(b)
+                    if other is not None:
+                        merge_agg(acc, other)
+            return
+
+        level = self.levels[li]
+        first = int(math.ceil(lo / level))
+        last = int(hi // level)
+        if first >= last:
+            self._cover(series, series_levels, acc, lo, hi, li - 1)
+            return
+        buckets = series_levels[level]
+        for b in range(first, last):
+            other = buckets.get(b)
+            if other is not None:
+                merge_agg(acc, other)
+        self._cover(series, series_levels, acc, lo, first * level, li - 1)
+        self._cover(series, series_levels, acc, last * level, hi, li - 1)
+
+    def aggregate(self, series: str, start: float, end: float) -> dict:
+        """count/avg/min/max of `series` over [start, end) (seconds since epoch)."""
+        acc = empty_agg()
+        with self._lock:
+            series_levels = self._rollups.get(series)
+            if series_levels is not None:
+                self._cover(series, series_levels, acc, start, end, len(self.levels) - 1)
+        return agg_to_dict(acc, start, end)
+
+    def buckets(self, series: str, start: float, end: float, step: float) -> list[dict]:
+        """One aggregate per `step` seconds over [start, end), e.g. hourly avg/min/max."""
+        if not step > 0:
+            raise ValueError(f"step must be > 0, got {step}")
+        if (end - start) / step > MAX_BUCKETS:
+            raise ValueError(f"{(end - start) / step:.0f} buckets requested, at most {MAX_BUCKETS}")
+        out = []
+        t = start
+        while t < end:
+            out.append(self.aggregate(series, t, min(t + step, end)))
+            t += step
+        return out
+
+
+class QueryAgent:
+    """
+    Subscribes to:
+        {refuge_name}/+/+/+           readings and averages, ingested into the rollups
+        {refuge_name}/query/request   JSON requests
+    and answers on the request's "reply_to" topic, or on
+        {refuge_name}/query/response
+
+    Request:  {"id": "...", "series": "kitchen/temperature/S5",
+               "start": <epoch s>, "end": <epoch s>, "step": 3600 (optional), "reply_to": "..." (optional)}
+    Response: {"id": "...", "series": "...", "result": {...} or [{...}, ...]}  (or "error")
+    """
+
+    def __init__(
+        self,
+        broker_host: str,
+        broker_port: int,
+        refuge_name: str,
+        historian: Historian | None = None,
+    ) -> None:
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.refuge_name = refuge_name
+
+        self.topic_all = f"{refuge_name}/+/+/+"
+        self.topic_request = f"{refuge_name}/query/request"
+        self.topic_response = f"{refuge_name}/query/response"
+
+        self.historian = historian
+        self.index = RollupIndex(historian=historian)
+        if historian is not None:
+            n = self.index.backfill(historian)
+            print(f"[QUERY] Backfilled {n} points from the historian")
+
+        self.client = mqtt.Client()
+        self._stop_event = threading.Event()
+
+    # ---------- MQTT callbacks ----------
+
+    def _on_connect(self, client, userdata, flags, rc):
+        status = "OK" if rc == 0 else f"ERROR rc={rc}"
+        print(f"[QUERY] Connected to broker ({status}). Subscribing to: {self.topic_all} and {self.topic_request}")
+        client.subscribe(self.topic_all)
+        client.subscribe(self.topic_request)
+
+    def _on_message(self, client, userdata, msg):
+        if msg.topic == self.topic_request:
+            self._handle_request(msg.payload)
+            return
+        try:
+            value = float(msg.payload.decode())
+        except ValueError:
+            return
+        self.index.ingest(msg.topic[len(self.refuge_name) + 1:], value)
+
+    def _handle_request(self, payload: bytes) -> None:
+        try:
+            req = json.loads(payload.decode())
+        except json.JSONDecodeError:
+            print(f"[QUERY] Invalid JSON request: {payload!r}")
+            return
+        reply_to = req.get("reply_to") or self.topic_response
+        resp = {"id": req.get("id"), "series": req.get("series")}
+        try:
+            if self.historian is not None:
+                self.historian.refresh()  # segments the writer sealed since the last query
+            end = float(req.get("end", time.time()))
+            start = float(req["start"])
+            if req.get("step") is not None:
+                resp["result"] = self.index.buckets(req["series"], start, end, float(req["step"]))
+            else:
+                resp["result"] = self.index.aggregate(req["series"], start, end)
+        except (KeyError, TypeError, ValueError) as e:
+            resp["error"] = str(e)
+        self.client.publish(reply_to, payload=json.dumps(resp), qos=0)
+
+    # ---------- Public API ----------
+
+    def connect(self) -> None:
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+        self.client.loop_start()
+
+    def run(self) -> None:
+        self.connect()
+        try:
+            while not self._stop_event.is_set():
+                time.sleep(0.1)
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+            print("[QUERY] stopped successfully")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+# ---------- Benchmark ----------
+
+def bench(days: int, period_s: float, repeat: int) -> None:
+    """Hourly avg/min/max over the last `days` days: rollups vs raw scan of the Historian."""
+    series = "kitchen/temperature/S5"
+    end = time.time()
+    start = end - days * 86400
+    rng = np.random.default_rng(0)
+    ts = np.arange(start, end, period_s)
+    values = np.round(rng.uniform(15.0, 25.0, len(ts)), 2)
+
+    with tempfile.TemporaryDirectory() as d:
+        h = Historian(d, segment_s=86400, capacity=1 << 20)
+        sid = h.series_id(series)
+        h.append_batch((ts * US).astype(np.int64), np.full(len(ts), sid), values)
+        h.close()
+        h = Historian(d)
+        index = RollupIndex(historian=h)
+        t0 = time.perf_counter()
+        index.backfill(h)
+        print(f"{len(ts)} points over {days} days, rollup backfill {time.perf_counter() - t0:.3f}s")
+
+        # Aligned to whole hours, so the rollups never touch raw points
+        q_start = math.ceil(start / 3600) * 3600
+        q_end = end // 3600 * 3600
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            rolled = index.buckets(series, q_start, q_end, 3600)
+        t_rollup = (time.perf_counter() - t0) / repeat
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            ts_us, vals = h.read_concat(series, q_start, q_end)
+            hours = (ts_us // (3600 * US)).astype(np.int64)
+            keys, inverse = np.unique(hours, return_inverse=True)
+            avg = np.bincount(inverse, weights=vals) / np.bincount(inverse)
+            vmin = np.full(len(keys), np.inf)
+            np.minimum.at(vmin, inverse, vals)
+            vmax = np.full(len(keys), -np.inf)
+            np.maximum.at(vmax, inverse, vals)
+        t_scan = (time.perf_counter() - t0) / repeat
+
+        assert np.allclose([b["avg"] for b in rolled if b["count"]], avg)
+        print(f"hourly buckets: {len(rolled)}")
+        print(f"rollups:  {t_rollup * 1e3:.2f} ms/query")
+        print(f"raw scan: {t_scan * 1e3:.2f} ms/query ({t_scan / t_rollup:.1f}x slower)")
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            index.aggregate(series, start + 17.5, end - 42.0)
+        print(f"unaligned {days}-day aggregate: {(time.perf_counter() - t0) / repeat * 1e3:.2f} ms/query")
+        h.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Telemetry rollups and range queries (MQTT)")
+    ap.add_argument("--history-dir", default="", help="Historian directory used for backfill and raw edges")
+    ap.add_argument("--broker", default="localhost")
+    ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--refuge", default="refuge_Monviso")
+    ap.add_argument("--bench", type=int, default=0, help="Run the benchmark over N days of data instead")
+    ap.add_argument("--bench-period", type=float, default=2.0, help="Seconds between points in the benchmark")
+    ap.add_argument("--bench-repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(args.bench, args.bench_period, args.bench_repeat)
+        return
+
+    historian = Historian(args.history_dir, read_only=True) if args.history_dir else None
+    agent = QueryAgent(args.broker, args.port, args.refuge, historian)
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
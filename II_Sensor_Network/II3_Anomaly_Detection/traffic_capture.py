@@ -0,0 +1,279 @@
+import argparse
+import hashlib
+import json
+import struct
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+
+"""
+MQTT traffic recorder and replayer.
+
+Capture file (append-only, little endian):
+    header   b"MQCAP001" + float64 capture start (epoch seconds)
+    topic    0x01 | uint16 topic_id | uint16 len | topic (utf-8)
+    message  0x02 | uint8 flags (qos | retain << 2) | uint32 delta_us | uint16 topic_id | uint32 len | payload
+    time     0x03 | int64 offset_us since capture start   (when delta_us would overflow)
+
+Each topic string is written once, messages refer to it by id. Message
+timestamps are deltas from the previous message.
+"""
+
+MAGIC = b"MQCAP001"
+FILE_HEADER = struct.Struct("<8sd")
+TOPIC_REC = struct.Struct("<BHH")
+MSG_REC = struct.Struct("<BBIHI")
+TIME_REC = struct.Struct("<Bq")
+
+TAG_TOPIC = 0x01
+TAG_MSG = 0x02
+TAG_TIME = 0x03
+
+MAX_DELTA_US = 0xFFFFFFFF
+FLUSH_TIMEOUT_S = 10.0   # replay waits this long for the last publish before disconnecting
+
+
+class CaptureWriter:
+    def __init__(self, path: str, start: float | None = None) -> None:
+        self.start = time.time() if start is None else start
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._file.write(FILE_HEADER.pack(MAGIC, self.start))
+        self._topics: dict[str, int] = {}
+        self._last_us = 0
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def write(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False, ts: float | None = None) -> None:
+        offset_us = int(((time.time() if ts is None else ts) - self.start) * 1_000_000)
+        with self._lock:
+            tid = self._topics.get(topic)
+            if tid is None:
+                tid = len(self._topics)
+                self._topics[topic] = tid
+                raw = topic.encode()
+                self._file.write(TOPIC_REC.pack(TAG_TOPIC, tid, len(raw)))
+                self._file.write(raw)
+            # Callbacks may race by a few us: never go back in time
+            delta = max(0, offset_us - self._last_us)
+            if delta > MAX_DELTA_US:
+                self._file.write(TIME_REC.pack(TAG_TIME, offset_us))
+                delta = 0
+                self._last_us = offset_us
+            self._last_us += delta
+            self._file.write(MSG_REC.pack(TAG_MSG, qos | (int(retain) << 2), delta, tid, len(payload)))
+            self._file.write(payload)
+            self.count += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path: str):
+    """Yields (offset_s, topic, payload, qos, retain) in capture order."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, _start = FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not an MQTT capture")
+    topics: dict[int, str] = {}
+    pos = FILE_HEADER.size
+    now_us = 0
+    while pos < len(data):
+        tag = data[pos]
+        if tag == TAG_TOPIC:
+            _, tid, n = TOPIC_REC.unpack_from(data, pos)
+            pos += TOPIC_REC.size
+            topics[tid] = data[pos:pos + n].decode()
+            pos += n
+        elif tag == TAG_MSG:
+            if pos + MSG_REC.size > len(data):
+                break  # truncated tail (recorder killed mid-write)
+            _, flags, delta, tid, n = MSG_REC.unpack_from(data, pos)
+            pos += MSG_REC.size
+            if pos + n > len(data):
+                break
+            now_us += delta
+            yield now_us / 1_000_000, topics[tid], data[pos:pos + n], flags & 0x3, bool(flags & 0x4)
+            pos += n
+        elif tag == TAG_TIME:
+            _, now_us = TIME_REC.unpack_from(data, pos)
+            pos += TIME_REC.size
+        else:
+            raise ValueError(f"{path}: bad record tag {tag:#x} at offset {pos}")
+
+
+class TrafficRecorder:
+    """Subscribes to `topic_filter` and appends every message to a capture file."""
+
+    def __init__(self, broker_host: str, broker_port: int, path: str, topic_filter: str = "#") -> None:
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.topic_filter = topic_filter
+        self.writer = CaptureWriter(path)
+
+        self.client = mqtt.Client()
+        self._stop_event = threading.Event()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        status = "OK" if rc == 0 else f"ERROR rc={rc}"
+        print(f"[REC] Connected to broker ({status}). Recording: {self.topic_filter}")
+        client.subscribe(self.topic_filter)
+
+    def _on_message(self, client, userdata, msg):
+        self.writer.write(msg.topic, msg.payload, msg.qos, msg.retain)
+
+    def connect(self) -> None:
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+        self.client.loop_start()
+
+    def run(self, duration_s: float | None = None) -> None:
+        self.connect()
+        t_end = None if duration_s is None else time.time() + duration_s
+        try:
+            while not self._stop_event.wait(1.0):
+                self.writer.flush()
+                if t_end is not None and time.time() >= t_end:
+                    break
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.writer.close()
+            print(f"[REC] stopped, {self.writer.count} messages recorded")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+class TrafficReplayer:
+    """
+    Republishes a capture. speed=1 is real time, speed=N is N times faster,
+    speed=0 publishes as fast as possible. Messages are always sent in capture
+    order with the captured payloads, so two replays of one file are identical.
+    The retain flag is dropped unless keep_retain is set, so a replay does not
+    leave its readings behind as retained state on the broker.
+    """
+
+    def __init__(self, broker_host: str, broker_port: int, path: str, speed: float = 1.0,
+                 topic_prefix: tuple[str, str] | None = None, keep_retain: bool = False) -> None:
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.speed = speed
+        self.topic_prefix = topic_prefix
+        self.keep_retain = keep_retain
+        self.messages = list(read_capture(path))
+        self.client = mqtt.Client()
+
+    def _topic(self, topic: str) -> str:
+        if self.topic_prefix and topic.startswith(self.topic_prefix[0]):
+            return self.topic_prefix[1] + topic[len(self.topic_prefix[0]):]
+        return topic
+
+    def run(self) -> dict:
+        self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+        self.client.loop_start()
+        digest = hashlib.sha256()
+        lateness = []
+        n_bytes = 0
+        info = None
+        try:
+            t0 = time.perf_counter()
+            for offset, topic, payload, qos, retain in self.messages:
+                if self.speed > 0:
+                    target = t0 + offset / self.speed
+                    remaining = target - time.perf_counter()
+                    if remaining > 0.002:
+                        time.sleep(remaining - 0.002)
+                    while time.perf_counter() < target:
+                        pass
+                    lateness.append(time.perf_counter() - target)
+                topic = self._topic(topic)
+                info = self.client.publish(topic, payload=payload, qos=qos, retain=retain and self.keep_retain)
+                digest.update(topic.encode())
+                digest.update(payload)
+                n_bytes += len(payload)
+            elapsed = time.perf_counter() - t0
+            if info is not None:
+                info.wait_for_publish(timeout=FLUSH_TIMEOUT_S)   # QoS 1/2 tail still in flight
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+        n = len(self.messages)
+        report = {
+            "messages": n,
+            "bytes": n_bytes,
+            "captured_s": self.messages[-1][0] if n else 0.0,
+            "elapsed_s": elapsed,
+            "msgs_per_s": n / elapsed if elapsed > 0 else 0.0,
+            "speed": self.speed or "max",
+            "sha256": digest.hexdigest(),
+        }
+        if lateness:
+            lateness.sort()
+            report["lateness_us_p50"] = lateness[len(lateness) // 2] * 1e6
+            report["lateness_us_p99"] = lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))] * 1e6
+            report["lateness_us_max"] = lateness[-1] * 1e6
+        return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="MQTT traffic recorder / replayer")
+    ap.add_argument("--broker", default="localhost")
+    ap.add_argument("--port", type=int, default=1883)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rec = sub.add_parser("record", help="Record traffic into a capture file")
+    rec.add_argument("path")
+    rec.add_argument("--filter", default="#", help="Topic filter to record")
+    rec.add_argument("--duration", type=float, default=None, help="Stop after N seconds (default: Ctrl+C)")
+
+    rep = sub.add_parser("replay", help="Republish a capture file")
+    rep.add_argument("path")
+    rep.add_argument("--speed", default="1", help='Speed factor (1 = real time, 10 = 10x) or "max"')
+    rep.add_argument("--rewrite-prefix", nargs=2, metavar=("OLD", "NEW"), help="Rewrite a topic prefix")
+    rep.add_argument("--report", default="", help="Also write the replay report as JSON to this file")
+    rep.add_argument("--keep-retain", action="store_true", help="Republish retained messages with the retain flag")
+
+    info = sub.add_parser("info", help="Summarize a capture file")
+    info.add_argument("path")
+    args = ap.parse_args()
+
+    if args.cmd == "record":
+        recorder = TrafficRecorder(args.broker, args.port, args.path, args.filter)
+        try:
+            recorder.run(args.duration)
+        except KeyboardInterrupt:
+            recorder.stop()
+    elif args.cmd == "replay":
+        speed = 0.0 if args.speed == "max" else float(args.speed)
+        replayer = TrafficReplayer(args.broker, args.port, args.path, speed,
+                                   tuple(args.rewrite_prefix) if args.rewrite_prefix else None, args.keep_retain)
+        report = replayer.run()
+        print(json.dumps(report, indent=2))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+    else:
+        per_topic: dict[str, int] = {}
+        n = 0
+        last = 0.0
+        for offset, topic, _payload, _qos, _retain in read_capture(args.path):
+            per_topic[topic] = per_topic.get(topic, 0) + 1
+            n += 1
+            last = offset
+        print(f"{n} messages over {last:.1f}s on {len(per_topic)} topics")
+        for topic, count in sorted(per_topic.items(), key=lambda kv: -kv[1]):
+            print(f"  {count:8d}  {topic}")
+
+
+if __name__ == "__main__":
+    main()